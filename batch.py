@@ -0,0 +1,166 @@
+import os, sys
+import glob
+import time
+import json
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+import argparse
+
+import cp
+
+__version__ = "0.1.0"
+
+class FileResult:
+    """单个文件的批量编译结果。"""
+    def __init__(self, path: str):
+        self.path = path
+        self.ok = False
+        self.size = 0 # 字节码大小
+        self.elapsed = 0.0 # 编译耗时，单位为秒
+        self.diagnostics: list[cp.Diagnostic] = []
+        self.outputs: list[str] = [] # 已写出的文件
+
+def collect_files(patterns: list[str], manifest: Optional[str] = None) -> list[str]:
+    """
+    展开glob模式与清单文件，得到去重后的文件列表，保持输入顺序。
+    清单文件每行一个路径或glob模式，支持#注释，相对路径以清单文件所在目录为基准。
+    """
+    patterns = list(patterns)
+    if manifest is not None:
+        base = os.path.dirname(os.path.abspath(manifest))
+        with open(manifest, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.split("#", 1)[0].strip()
+                if line == "":
+                    continue
+                patterns.append(line if os.path.isabs(line) else os.path.join(base, line))
+    files: list[str] = []
+    seen: set[str] = set()
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True))
+        if not matches and not glob.has_magic(pattern):
+            # 不存在的普通路径同样加入，由编译阶段报告错误
+            matches = [pattern]
+        for path in matches:
+            key = os.path.normcase(os.path.abspath(path))
+            if key not in seen:
+                seen.add(key)
+                files.append(path)
+    return files
+
+def assemble_file(path: str, no_warn: bool = False, write_bin: bool = True, write_debug: bool = True) -> FileResult:
+    """编译单个文件，并将.bin/.dzo输出到源文件同目录。任何异常都转换为诊断信息，不会抛出。"""
+    ret = FileResult(path)
+    start = time.perf_counter()
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            code = f.read()
+        result = cp.assemble(code, no_warn=no_warn)
+        ret.diagnostics = result.diagnostics
+        if not result.has_error:
+            bincode = result.binary
+            ret.size = len(bincode)
+            stem = os.path.splitext(path)[0]
+            if write_bin:
+                with open(stem + ".bin", "wb") as f:
+                    f.write(bincode)
+                ret.outputs.append(stem + ".bin")
+            if write_debug:
+                with open(stem + ".dzo", "wb") as f:
+                    f.write(cp.out_debug_object(result, code))
+                ret.outputs.append(stem + ".dzo")
+            ret.ok = True
+    except Exception as e:
+        ret.diagnostics.append(cp.Diagnostic(0, 0, cp.SEVERITY_ERROR, f"{type(e).__name__}: {e}"))
+    ret.elapsed = time.perf_counter() - start
+    return ret
+
+def _assemble_file_task(task: tuple[str, bool, bool, bool]) -> FileResult:
+    return assemble_file(*task)
+
+def assemble_files(files: list[str], jobs: Optional[int] = None, no_warn: bool = False,
+                   write_bin: bool = True, write_debug: bool = True) -> list[FileResult]:
+    """使用进程池并行编译多个文件。返回结果与输入顺序一致，失败的文件不影响其他文件。"""
+    tasks = [(path, no_warn, write_bin, write_debug) for path in files]
+    if jobs == 1 or len(tasks) <= 1:
+        return [_assemble_file_task(task) for task in tasks]
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(_assemble_file_task, tasks, chunksize=max(1, len(tasks) // 64)))
+
+def out_diagnostics(results: list[FileResult]) -> str:
+    """汇总所有文件的诊断信息。"""
+    string = ""
+    for res in results:
+        for d in res.diagnostics:
+            title = "警告" if d.severity == cp.SEVERITY_WARNING else "错误"
+            string += f"{res.path}:{d.line}:{d.column}: {title}: {d.message}\n"
+    return string
+
+def out_summary(results: list[FileResult], elapsed: float) -> str:
+    """生成大小与耗时汇总表。"""
+    name_width = max([len(res.path) for res in results] + [4])
+    string = f"""\
+  {'File':<{name_width}}   State   Size      Time
+┌─{'─' * name_width}─┬──────┬──────┬──────────
+"""
+    for res in results:
+        state = "OK" if res.ok else "FAIL"
+        string += f"│ {res.path:<{name_width}} │ {state:<4} │{res.size:>5} │{res.elapsed * 1000:>7.2f}ms\n"
+    string += f"""\
+└─{'─' * name_width}─┴──────┴──────┴──────────
+"""
+    failed = sum(1 for res in results if not res.ok)
+    string += f"共 {len(results)} 个文件，成功 {len(results) - failed} 个，失败 {failed} 个，总耗时 {elapsed * 1000:.2f}ms\n"
+    return string
+
+def out_report(results: list[FileResult], elapsed: float) -> str:
+    """生成JSON格式的汇总诊断报告。"""
+    return json.dumps({
+        "files": [
+            {
+                "path": res.path,
+                "ok": res.ok,
+                "size": res.size,
+                "time": res.elapsed,
+                "outputs": res.outputs,
+                "diagnostics": [d._asdict() for d in res.diagnostics],
+            }
+            for res in results
+        ],
+        "total": len(results),
+        "failed": sum(1 for res in results if not res.ok),
+        "time": elapsed,
+    }, ensure_ascii=False, indent=4)
+
+def main():
+    parser = argparse.ArgumentParser(description="DZC-8M Instruction ASM Batch Compiler")
+    parser.add_argument("patterns", nargs="*", help="输入的汇编代码文件或glob模式，如 example/**/*.asm")
+    parser.add_argument("-m", "--manifest", default=None, help="清单文件，每行一个文件路径或glob模式")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="并行进程数。默认为CPU核心数")
+    parser.add_argument("-nob", "--no-output-binary", action="store_true", help="不输出.bin文件")
+    parser.add_argument("-noD", "--no-debug-output", action="store_true", help="不输出.dzo调试信息文件")
+    parser.add_argument("-r", "--report", default=None, help="将汇总诊断报告输出到文件，类型为JSON文件")
+    parser.add_argument("--no-warn", action="store_true", help="不显示警告")
+    parser.add_argument("--version", action="version", version=f"Eggy Assembler Batch Compiler\n{__version__}\nfor DZC-8M Plus Instruction Set")
+    args = parser.parse_args()
+    files = collect_files(args.patterns, args.manifest)
+    if not files:
+        print("没有找到需要编译的文件。")
+        return 1
+    start = time.perf_counter()
+    results = assemble_files(files, jobs=args.jobs, no_warn=args.no_warn,
+                             write_bin=not args.no_output_binary, write_debug=not args.no_debug_output)
+    elapsed = time.perf_counter() - start
+    diagnostics = out_diagnostics(results)
+    if diagnostics:
+        print(diagnostics)
+    print(out_summary(results, elapsed))
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            f.write(out_report(results, elapsed))
+        print(f"汇总诊断报告已输出到 {args.report}")
+    return 0 if all(res.ok for res in results) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
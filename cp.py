@@ -3,12 +3,16 @@ import os, sys
 
 # typing
 import enum
-from typing import Optional, TypeAlias, Generic, TypeVar
+from typing import NamedTuple, Optional, TypeAlias, Generic, TypeVar
 
 import argparse
 
+import isa
+
 __version__ = "0.1.0"
 
+ROM_SIZE = 0xFF # 程序存储区(单个bank)大小
+
 rematch_singleline_comments = re.compile(r'(\".*?\"|\'.*?\')|(//[^\n]*|#[^\n]*)')
 rematch_multiline_comments = re.compile(r'/\*(?:[^*]|\*(?!/))*\*/', flags=re.DOTALL)
 
@@ -92,36 +96,10 @@ SHL:   [1110xR][VV]
 SHR:   [1111xR][VV]
 """
 
-class RegisterEnum(enum.Enum):
-    PC = 0b000
-    AF = 0b001
-    SP = 0b010
-    IO = 0b011
-    R0 = 0b100
-    R1 = 0b101
-    R2 = 0b110
-    R3 = 0b111
-
-class OpEnum(enum.Enum):
-    PAUSE = 0b00000000
-    NOP   = 0b00010000
-    MOVZ  = 0b00100000
-    MOVLZ = 0b00101000
-    MOVN  = 0b00110000
-    MOVLN = 0b00111000
-    ADD   = 0b01000000
-    SUB   = 0b01010000
-    ADDC  = 0b01100000
-    SUBB  = 0b01110000
-    INC   = 0b10000000
-    DEC   = 0b10001000
-    CMP   = 0b10010000
-    NOT   = 0b10100000
-    AND   = 0b10110000
-    OR    = 0b11000000
-    XOR   = 0b11010000
-    SHL   = 0b11100000
-    SHR   = 0b11110000
+# 寄存器与操作码均由isa.py的指令集表导出
+RegisterEnum = enum.Enum("RegisterEnum", {name: i for i, name in enumerate(isa.REGISTER_NAMES)})
+
+OpEnum = enum.Enum("OpEnum", {spec.name: spec.opcode for spec in isa.ISA})
 
 class Arg:
     name = "_"
@@ -175,6 +153,10 @@ class ConstArg(Arg):
     @value.setter
     def value(self, value: int):
         pass
+    @property
+    def flag_name(self) -> Optional[str]:
+        """标记引用的标记名。不是标记引用时为None"""
+        return self._value if isinstance(self._value, str) else None
     def parse_bin(self):
         if isinstance(self._value, int):
             if self._value < 0: # 转换为补码数
@@ -217,26 +199,46 @@ ValueArg: TypeAlias = ConstArg | RegArg
 class ArgsNotMatchException(Exception):
     pass
 
-def pack_value_arg(arg: Arg) -> int:
-    """将ValueArg打包为二进制参数。有效低4位。"""
+def arg_operand(arg: Arg) -> isa.Operand:
+    """将参数转换为isa.encode使用的操作数。"""
     if isinstance(arg, ConstArg):
-        # 0b0xxx
-        return 0b00000000 | (arg.parse_bin() & 0b00000111)
+        return ("C", arg.parse_bin())
     elif isinstance(arg, RegArg):
-        # 0b1xxx
-        return 0b00001000 | (arg.parse_bin() & 0b00000111)
+        return ("R", arg.parse_bin())
     else:
         raise Exception("无法打包未知类型的ValueArg")
 
+def pack_value_arg(arg: Arg) -> int:
+    """将ValueArg打包为二进制参数。有效低4位。"""
+    return isa.pack_value(arg_operand(arg))
+
+RELOC_BYTE = 0 # 重定位目标为整个字节(8位常量)
+RELOC_HI3 = 1 # 重定位目标为字节高4位中的值字段(3位常量)
+RELOC_LO3 = 2 # 重定位目标为字节低4位中的值字段(3位常量)
+
+def form_layout(form: str) -> tuple[list, list[int | None], list[tuple[int, int] | None], int]:
+    """
+    由isa.py中的参数格式导出指令类的参数类型、常量上限、常量字段位置与指令长度。
+
+    :return: target_argtypes, types_args, arg_fields, len
+    """
+    argtypes = {"R": RegArg, "V": ValueArg, "C": ConstArg}
+    relocs = {isa.FIELD_HI: RELOC_HI3, isa.FIELD_LO: RELOC_LO3, isa.FIELD_BYTE: RELOC_BYTE}
+    target_argtypes = [argtypes[slot] for slot in form]
+    types_args = [0xFF if slot == "C" else None for slot in form]
+    arg_fields = [None if field == isa.FIELD_REG else (offset, relocs[field]) for offset, field in isa.FORMS[form]]
+    return target_argtypes, types_args, arg_fields, isa.form_length(form)
+
 class Instruction:
-    target_argtypes = [RegArg, ValueArg, ValueArg]
-    types_args: list[int | None] = [None, None, None]
-    len = 2
+    """寄存器，双值指令。MOVZ MOVN ADD SUB ADDC SUBB AND OR XOR SHL SHR"""
+    form = "RVV"
+    # arg_fields: 各参数为常量时在字节码中的位置: (字节偏移, 重定位类型)。None表示该参数不可能是常量
+    target_argtypes, types_args, arg_fields, len = form_layout(form)
     def __init__(self, op: int, args: list[Arg]):
         self.op = op
         self.args = args
-    def check_args(self) -> None | str:
-        """检查参数是否正确。返回None或str错误信息。"""
+    def check_args(self, check_flags: bool = True) -> None | str:
+        """检查参数是否正确。返回None或str错误信息。check_flags为False时，不检查标记引用的取值范围。"""
         def check_an_args(index: int) -> None | str:
             # 返回None表示通过检查，否则返回错误信息字符串
             # 特例：ValueArg的期望类型字面量是"值"
@@ -259,6 +261,8 @@ class Instruction:
             if isinstance(self.args[i], ConstArg):
                 const_max = 7 # 0b111
                 arg = self.args[i]
+                if not check_flags and arg.flag_name is not None:
+                    continue
                 arg_arg = self.types_args[i]
                 const_min = 0
                 if arg_arg is not None:
@@ -275,13 +279,7 @@ class Instruction:
         :return: 字节码。必须确保之前检查过参数正确性。
         :rtype: btyes
         """
-        # 常用：[OpR][VV]
-        # 重载以实现不同指令格式的解析
-        bin_code = [
-            (self.op & 0b11111000) | (self.args[0].parse_bin() & 0b00000111),
-            (pack_value_arg(self.args[1]) << 4) | pack_value_arg(self.args[2])
-        ]
-        return bytes(bin_code)
+        return isa.encode(isa.DECODE_TABLE[self.op], [arg_operand(arg) for arg in self.args])
     
     def get_literal(self) -> str:
         """获取指令的字面量表示，用于信息提示。"""
@@ -290,96 +288,45 @@ class Instruction:
 
 class Instruction_N(Instruction):
     """无参数指令。PAUSE NOP"""
-    target_argtypes = []
-    types_args = []
-    len = 1
-    def __init__(self, op: int, args: list[Arg]):
-        super().__init__(op, args)
-    def parse_bin(self) -> bytes:
-        return bytes([self.op])
+    form = ""
+    target_argtypes, types_args, arg_fields, len = form_layout(form)
 
 class Instruction_R(Instruction):
     """单寄存器指令。INC DEC"""
-    target_argtypes = [RegArg]
-    types_args = [None]
-    len = 1
-    def __init__(self, op: int, args: list[Arg]):
-        super().__init__(op, args)
-    def parse_bin(self) -> bytes:
-        bin_code = [
-            (self.op & 0b11111000) | (self.args[0].parse_bin() & 0b00000111)
-        ]
-        return bytes(bin_code)
+    form = "R"
+    target_argtypes, types_args, arg_fields, len = form_layout(form)
 
 class Instruction_RV(Instruction):
     """单寄存器，值指令。NOT"""
-    target_argtypes = [RegArg, ValueArg]
-    types_args = [None, None]
-    len = 2
-    def __init__(self, op: int, args: list[Arg]):
-        super().__init__(op, args)
-    def parse_bin(self) -> bytes:
-        bin_code = [
-            (self.op & 0b11111000) | (self.args[0].parse_bin() & 0b00000111),
-            pack_value_arg(self.args[1]) << 4
-        ]
-        return bytes(bin_code)
+    form = "RV"
+    target_argtypes, types_args, arg_fields, len = form_layout(form)
 
 class Instruction_VV(Instruction):
     """仅双值指令。CMP"""
-    target_argtypes = [ValueArg, ValueArg]
-    types_args = [None, None]
-    len = 2
-    def __init__(self, op: int, args: list[Arg]):
-        super().__init__(op, args)
-    def parse_bin(self) -> bytes:
-        bin_code = [
-            self.op,
-            (pack_value_arg(self.args[0]) << 4) | pack_value_arg(self.args[1])
-        ]
-        return bytes(bin_code)
+    form = "VV"
+    target_argtypes, types_args, arg_fields, len = form_layout(form)
 
 class Instruction_RC8V(Instruction):
     """单寄存器，8位常量，值指令。MOVLZ MOVLN"""
-    target_argtypes = [RegArg, ConstArg, ValueArg]
-    types_args = [None, 0xFF, None]
-    len = 3
-    def __init__(self, op: int, args: list[Arg]):
-        super().__init__(op, args)
-    def parse_bin(self) -> bytes:
-        bin_code = [
-            (self.op & 0b11111000) | (self.args[0].parse_bin() & 0b00000111),
-            self.args[1].parse_bin() & 0xFF,
-            pack_value_arg(self.args[2]) << 4
-        ]
-        return bytes(bin_code)
-
-instructions: dict[str, type[Instruction]] = {
-    "PAUSE": Instruction_N,
-    "NOP":   Instruction_N,
-    "MOVZ":  Instruction,
-    "MOVLZ": Instruction_RC8V,
-    "MOVN":  Instruction,
-    "MOVLN": Instruction_RC8V,
-    "ADD":   Instruction,
-    "SUB":   Instruction,
-    "MUL":   Instruction,
-    "DIV":   Instruction,
-    "INC":   Instruction_R,
-    "DEC":   Instruction_R,
-    "CMP":   Instruction_VV,
-    "NOT":   Instruction_RV,
-    "AND":   Instruction,
-    "OR":    Instruction,
-    "XOR":   Instruction,
-    "SHL":   Instruction,
-    "SHR":   Instruction,
+    form = "RCV"
+    target_argtypes, types_args, arg_fields, len = form_layout(form)
+
+# 参数格式 -> 指令类
+form_classes: dict[str, type[Instruction]] = {
+    cls.form: cls for cls in (Instruction, Instruction_N, Instruction_R, Instruction_RV, Instruction_VV, Instruction_RC8V)
 }
 
+instructions: dict[str, type[Instruction]] = {spec.name: form_classes[spec.form] for spec in isa.ISA}
+
 class Flag:
     def __init__(self, name: str):
         self.name = name
 
+class Export:
+    """导出指令 .global 标记[, 标记...]。只有导出的标记可被链接的其他模块引用。"""
+    def __init__(self, names: list[str]):
+        self.names = names
+
 # 变量名匹配：仅包含大小写字母、数字、下划线
 rematch_varname = re.compile(r"^[A-Za-z0-9_]*$")
 # 更严格的变量名匹配：首字符只能是字母或下划线
@@ -387,6 +334,8 @@ rematch_varname_strict = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
 # 可能无效的变量名匹配：只包含数字
 rematch_varname_invalid = re.compile(r"^\d+$")
 
+EXPORT_DIRECTIVE = ".global"
+
 def parse_number(s: str) -> Optional[int]:
     """尝试将字符串解析为数字。
     支持的写法：
@@ -424,17 +373,26 @@ def print_error(line_number: int, message: str, line: str, title: str = "错误"
     {line_number} │ {line}
 """)
     
-ParseInstruction_BaseType: TypeAlias = Instruction | Flag | str | None
+ParseInstruction_BaseType: TypeAlias = Instruction | Flag | Export | str | None
 class ParseInstructionResult:
     base: ParseInstruction_BaseType = None
     warn: Optional[str] = None
 
 def parse_instruction(line: str, flag_table: dict[str, int]) -> ParseInstructionResult:
-    """匹配指令。Flag表示匹配到flag。若匹配不成功，返回str错误信息。None表示空行。"""
+    """匹配指令。Flag表示匹配到flag，Export表示匹配到导出指令。若匹配不成功，返回str错误信息。None表示空行。"""
     line = line.strip()
     ret = ParseInstructionResult()
     if line == "":
         return ret
+    # 检查是否是导出指令
+    if line.split(maxsplit=1)[0].lower() == EXPORT_DIRECTIVE:
+        names = line[len(EXPORT_DIRECTIVE):].replace(",", " ").split()
+        if not names:
+            ret.base = f"{EXPORT_DIRECTIVE} 后缺少标记名"
+            return ret
+        invalid = next((name for name in names if rematch_varname.match(name) is None), None)
+        ret.base = f"无效的flag '{invalid}'" if invalid is not None else Export(names)
+        return ret
     # 检查是否是flag
     if line.endswith(":"):
         var = line[:-1].strip()
@@ -482,77 +440,677 @@ def parse_instruction(line: str, flag_table: dict[str, int]) -> ParseInstruction
 
 BinCodeType: TypeAlias = list[tuple[bytes, str]]
 
-def compile(args: argparse.Namespace, code_raw: str) -> tuple[BinCodeType, bool, list[int]]:
+SEVERITY_ERROR = "error"
+SEVERITY_WARNING = "warning"
+
+class Diagnostic(NamedTuple):
+    """一条编译诊断信息。"""
+    line: int # 源代码行号，从1开始
+    column: int # 列号，从1开始
+    severity: str # SEVERITY_ERROR 或 SEVERITY_WARNING
+    message: str
+
+class Relocation(NamedTuple):
+    """可重定位目标中的一处标记引用，链接时填入标记的最终地址。"""
+    offset: int # 字节码中的字节偏移
+    kind: int # RELOC_BYTE, RELOC_HI3 或 RELOC_LO3
+    name: str # 引用的标记名
+    line: int # 源代码行号，从0开始
+
+class AssembleResult:
+    """assemble的编译结果。"""
+    def __init__(self):
+        self.bin_code: BinCodeType = [] # 字节码及其字面量，即清单条目
+        self.flag_table: dict[str, int] = {} # 标记表，标记名 -> 地址
+        self.lines: list[int] = [] # 字节码每字节对应的源代码行号，从0开始
+        self.diagnostics: list[Diagnostic] = []
+        self.relocations: list[Relocation] = [] # 仅可重定位编译时有效
+        self.exports: list[str] = [] # .global导出的标记，其余标记链接时只在本模块内可见
+    @property
+    def imports(self) -> list[str]:
+        """引用了但未在本文件中定义的标记。"""
+        return sorted({r.name for r in self.relocations if r.name not in self.flag_table})
+    @property
+    def has_error(self) -> bool:
+        return any(d.severity == SEVERITY_ERROR for d in self.diagnostics)
+    @property
+    def binary(self) -> bytes:
+        """打包后的字节码。"""
+        return bytes(pack_bin(self.bin_code))
+
+def get_line_column(line: str) -> int:
+    """获取行内首个非空白字符的列号，从1开始。"""
+    return len(line) - len(line.lstrip()) + 1
+
+def assemble(code_raw: str, no_warn: bool = False, relocatable: bool = False) -> AssembleResult:
     """
-    :param code: 汇编代码
-    :type code: str
-    :return: 字节码, 是否有错误, 字节码每行对应的源代码行号
-    :rtype: tuple[BinCodeType, bool]
+    编译汇编代码。不打印任何信息，所有问题以诊断信息的形式返回。
+
+    :param code_raw: 汇编代码
+    :type code_raw: str
+    :param no_warn: 是否忽略警告
+    :type no_warn: bool
+    :param relocatable: 是否编译为可重定位目标。此时允许引用未定义的标记，所有标记引用记录为重定位项，
+        标记引用的取值范围在链接时检查；导出的标记必须在本文件中定义
+    :type relocatable: bool
+    :return: 编译结果
+    :rtype: AssembleResult
     """
+    result = AssembleResult()
+    diagnostics = result.diagnostics
     cur_addr = 0
     line_instructions: list[tuple[int, Instruction]] = []
-    flag_table: dict[str, int] = {}
+    flag_table = result.flag_table
+    export_at: dict[str, tuple[int, int]] = {} # 导出的标记 -> 首次导出的行号与列号
     code = remove_comments_preserve_lines(code_raw) # 移除注释但保留行号信息
-    code_raw_lines = code_raw.splitlines()
     # 初步解析，生成指令
-    # print(code)
-    has_error = False
     for line_number, line in enumerate(code.splitlines(), start=1):
-        #  line = line.strip()
         res_objectd = parse_instruction(line, flag_table)
         res = res_objectd.base
+        column = get_line_column(line)
         # 输出warn
-        if res_objectd.warn is not None and not args.no_warn:
-            print_error(line_number, res_objectd.warn, code_raw_lines[line_number - 1], title="警告")
+        if res_objectd.warn is not None and not no_warn:
+            diagnostics.append(Diagnostic(line_number, column, SEVERITY_WARNING, res_objectd.warn))
         if res is None:
             continue
         elif isinstance(res, str):
-            print_error(line_number, res, line)
-            has_error = True
+            diagnostics.append(Diagnostic(line_number, column, SEVERITY_ERROR, res))
             continue
         elif isinstance(res, Flag):
             flag_name = res.name
             if flag_name in flag_table:
-                # print(f"第 {line_number} 行编译错误: 重复的标记 '{flag_name}'")
-                print_error(line_number, f"重复的标记 '{flag_name}'", code_raw_lines[line_number - 1])
-                has_error = True
+                diagnostics.append(Diagnostic(line_number, column, SEVERITY_ERROR, f"重复的标记 '{flag_name}'"))
             else:
-                # print(f"定义标记 '{flag_name}' 地址 {cur_addr}")
-
                 flag_table[flag_name] = cur_addr
             continue
-        # 检查参数
-        check_result = res.check_args()
+        elif isinstance(res, Export):
+            for name in res.names:
+                export_at.setdefault(name, (line_number, column))
+            continue
+        # 检查参数。此时标记可能尚未定义，标记引用的范围留到生成字节码时检查
+        check_result = res.check_args(check_flags=False)
         if check_result is not None:
-            # print(f"第 {line_number} 行编译错误: {check_result}")
-            print_error(line_number, check_result, code_raw_lines[line_number - 1])
-            has_error = True
+            diagnostics.append(Diagnostic(line_number, column, SEVERITY_ERROR, check_result))
             continue
         # 增加指令长度
         cur_addr += res.len
         # 添加指令
-        line_instructions.append((line_number-1, res))
+        line_instructions.append((line_number, res))
+    result.exports = list(export_at)
+    # 可重定位编译时，未定义的标记以0占位
+    imports: list[str] = []
+    if relocatable:
+        for name, (line_number, column) in export_at.items():
+            if name not in flag_table:
+                diagnostics.append(Diagnostic(line_number, column, SEVERITY_ERROR, f"导出的标记未定义: {name}"))
+        for _, instruction in line_instructions:
+            for arg in instruction.args:
+                if isinstance(arg, ConstArg) and arg.flag_name is not None and arg.flag_name not in flag_table:
+                    flag_table[arg.flag_name] = 0
+                    imports.append(arg.flag_name)
     # 生成字节码
-    bin_code = []
-    bin_src_lines = []
+    code_lines = code.splitlines()
+    emitted: list[Instruction] = []
+    cur_addr = 0
     for line_number, instruction in line_instructions:
+        column = get_line_column(code_lines[line_number - 1])
         # 检查
-        check_result = instruction.check_args()
+        check_result = instruction.check_args(check_flags=not relocatable)
         if check_result is not None:
-            # print(f"第 {line_number} 行编译错误: {check_result}")
-            print_error(line_number, check_result, code_raw_lines[line_number - 1])
-            has_error = True
+            diagnostics.append(Diagnostic(line_number, column, SEVERITY_ERROR, check_result))
             continue
         try:
             bin_inst = instruction.parse_bin()
-            bin_code.append((bin_inst, instruction.get_literal()))
-            bin_src_lines.extend([line_number] * len(bin_inst))
+            emitted.append(instruction)
+            result.bin_code.append((bin_inst, ""))
+            result.lines.extend([line_number - 1] * len(bin_inst))
         except Exception as e:
-            # print(f"第 {line_number} 行编译错误: {str(e)}")
-            print_error(line_number, str(e), code_raw_lines[line_number - 1])
-            has_error = True
-    
-    return bin_code, has_error, bin_src_lines
+            diagnostics.append(Diagnostic(line_number, column, SEVERITY_ERROR, str(e)))
+            continue
+        if relocatable:
+            for arg, field in zip(instruction.args, instruction.arg_fields):
+                if field is not None and isinstance(arg, ConstArg) and arg.flag_name is not None:
+                    result.relocations.append(Relocation(cur_addr + field[0], field[1], arg.flag_name, line_number - 1))
+        cur_addr += len(bin_inst)
+        if cur_addr > ROM_SIZE and cur_addr - len(bin_inst) <= ROM_SIZE:
+            diagnostics.append(Diagnostic(line_number, column, SEVERITY_ERROR,
+                f"程序超出ROM容量 {ROM_SIZE} 字节，此指令结束于第 {cur_addr} 字节。"
+                "请拆分为多个文件，使用 link.py --banks 链接到多个bank"))
+    for name in imports:
+        del flag_table[name]
+    # 占位标记移除后再生成字面量，未定义的标记显示为'?'
+    result.bin_code = [(bin_inst, instruction.get_literal()) for (bin_inst, _), instruction in zip(result.bin_code, emitted)]
+    # 两遍扫描产生的诊断信息按行号排序
+    diagnostics.sort(key=lambda d: d.line)
+    return result
+
+class _LayoutBlock:
+    """稳定布局中的代码块：从一个标记(或程序开头)到下一个标记之前的指令。"""
+    def __init__(self, start: int):
+        self.names: list[str] = [] # 位于块开头的标记
+        self.start = start # 顺序布局中的起始地址
+        self.size = 0
+        self.entries: list[int] = [] # 块内指令在bin_code中的下标
+        self.falls = True # 最后一条指令之后是否继续顺序执行
+        self.addr: Optional[int] = None # 稳定布局中的起始地址
+
+JUMP_SIZE = isa.OPS["MOVLZ"].length # 无条件跳转 MOVLZ PC, addr, 0 的长度
+
+def _ends_with_jump(code: bytes) -> bool:
+    """指令是否为无条件跳转，即 MOVZ/MOVLZ PC, x, 0 或 MOVN/MOVLN PC, x, 非0常量。"""
+    decoded = isa.decode(*(code + bytes(3))[:3])
+    if decoded.spec.name not in ("MOVZ", "MOVN", "MOVLZ", "MOVLN") or decoded.operands[0] != ("R", RegisterEnum.PC.value):
+        return False
+    kind, value = decoded.operands[2]
+    return kind == "C" and (value == 0) == (decoded.spec.name in ("MOVZ", "MOVLZ"))
+
+def _slot_sizes(symbols: dict[str, int], size: int) -> dict[int, int]:
+    """由上一版本的标记表得到 块地址 -> 块大小(含填充)。"""
+    starts = sorted({0, *symbols.values()})
+    return {start: end - start for start, end in zip(starts, starts[1:] + [max(size, starts[-1])])}
+
+def stable_layout(code_raw: str, previous_symbols: dict[str, int], previous_rom: bytes, no_warn: bool = False) -> AssembleResult:
+    """
+    稳定布局编译：以标记为界将程序分为代码块，尽量让每个块保持上一版本中的地址，使修改后的字节码与上一版本的差异最小。
+
+    放得下的块留在原位置，会被顺序执行到的剩余空间以NOP填充；变大的块与新增的块按源代码顺序成组放入空闲空间。
+    不会被执行的空闲空间保留上一版本的字节，无需重新写入。
+    块的顺序执行目标不再紧随其后时，在块末尾插入 MOVLZ PC, 下一块, 0；移走的块在原位置留下转发跳转，
+    使前一块仍可顺序执行进入。程序开头的块移动时，地址0处必须放置转发跳转。
+    空闲空间不足，或顺序布局与上一版本的差异反而更小时，使用顺序布局，并给出警告。
+
+    :param previous_symbols: 上一版本的标记表，通常来自上一版本的DZO调试文件
+    :param previous_rom: 上一版本的字节码
+    :return: 编译结果。bin_code按地址排列，包含填充与插入的跳转
+    """
+    import link
+    result = assemble(code_raw, no_warn=no_warn, relocatable=True)
+    code_lines = code_raw.splitlines()
+    for reloc in result.relocations:
+        if reloc.name not in result.flag_table:
+            result.diagnostics.append(Diagnostic(reloc.line + 1, get_line_column(code_lines[reloc.line]), SEVERITY_ERROR,
+                                                 f"标记未定义: {reloc.name}"))
+    if result.has_error:
+        result.diagnostics.sort(key=lambda d: d.line)
+        return result
+    # 划分代码块
+    blocks = [_LayoutBlock(0)]
+    by_addr = {0: blocks[0]}
+    for name, addr in sorted(result.flag_table.items(), key=lambda item: item[1]):
+        if addr not in by_addr:
+            by_addr[addr] = _LayoutBlock(addr)
+            blocks.append(by_addr[addr])
+        by_addr[addr].names.append(name)
+    addr = 0
+    block_index = 0
+    for i, (code, _) in enumerate(result.bin_code):
+        while block_index + 1 < len(blocks) and blocks[block_index + 1].start <= addr:
+            block_index += 1
+        block = blocks[block_index]
+        block.entries.append(i)
+        block.size += len(code)
+        block.falls = not _ends_with_jump(code)
+        addr += len(code)
+    last = blocks[-1]
+    # 每个块在上一版本中的位置(按标记名对应): 块 -> 原地址
+    slot_sizes = _slot_sizes(previous_symbols, len(previous_rom))
+    slots: dict[_LayoutBlock, int] = {}
+    for block in blocks:
+        slot = 0 if block is blocks[0] else next((previous_symbols[n] for n in block.names if n in previous_symbols), None)
+        if slot is not None and slot not in slots.values():
+            slots[block] = slot
+    # 留在原位置的块。移走的块在原位置留下跳转到新位置的转发跳转(程序开头的块必须留下)，前一块仍可顺序执行进入
+    kept = {block: slot for block, slot in slots.items() if block.size <= slot_sizes[slot]}
+    def forwarded(block: _LayoutBlock) -> bool:
+        if block not in slots or block in kept:
+            return False
+        if block is blocks[0]:
+            return True
+        # 程序开头的块移走时，地址0处的转发跳转占用[0, JUMP_SIZE)
+        overlaps_entry = blocks[0] not in kept and slots[block] < JUMP_SIZE
+        return not overlaps_entry and slot_sizes[slots[block]] >= JUMP_SIZE
+    def jump_after(i: int) -> bool:
+        """留在原位置的第i块末尾是否需要跳转到下一块。"""
+        block = blocks[i]
+        if not block.falls or block is last:
+            return False
+        slot_end = kept[block] + slot_sizes[kept[block]]
+        successor = blocks[i + 1]
+        adjacent = (kept.get(successor) == slot_end
+                    or forwarded(successor) and slots[successor] == slot_end)
+        return not adjacent or slot_end - (kept[block] + block.size) >= JUMP_SIZE
+    changed = True
+    while changed:
+        changed = False
+        for i, block in enumerate(blocks):
+            if block not in kept:
+                continue
+            overlaps_entry = blocks[0] not in kept and kept[block] < JUMP_SIZE
+            if overlaps_entry or (jump_after(i) and block.size + JUMP_SIZE > slot_sizes[kept[block]]):
+                del kept[block]
+                changed = True
+    forwards = [block for block in blocks if forwarded(block)]
+    # 空闲空间
+    used = [(addr, addr + slot_sizes[addr]) for addr in kept.values()]
+    used += [(slots[block], slots[block] + JUMP_SIZE) for block in forwards]
+    free: list[list[int]] = []
+    cur = 0
+    for start, end in sorted(used) + [(ROM_SIZE, ROM_SIZE)]:
+        if start > cur:
+            free.append([cur, start])
+        cur = max(cur, end)
+    # 其余的块按源代码顺序成组放入空闲空间
+    runs: list[list[_LayoutBlock]] = []
+    for i, block in enumerate(blocks):
+        if block in kept:
+            continue
+        if runs and blocks[i - 1] is runs[-1][-1]:
+            runs[-1].append(block)
+        else:
+            runs.append([block])
+    for run in runs:
+        size = sum(block.size for block in run) + (JUMP_SIZE if run[-1].falls and run[-1] is not last else 0)
+        gap = next((gap for gap in free if gap[1] - gap[0] >= size), None)
+        if gap is None:
+            fallback = assemble(code_raw, no_warn=no_warn)
+            fallback.diagnostics.insert(0, Diagnostic(1, 1, SEVERITY_WARNING, "空闲空间不足，无法保持稳定布局，已使用顺序布局"))
+            return fallback
+        addr = gap[0]
+        for block in run:
+            block.addr = addr
+            addr += block.size
+        gap[0] += size
+    for block, slot in kept.items():
+        block.addr = slot
+    # 生成字节码: (地址, 字节码, 字面量, 源代码行号)
+    flag_table = {name: block.addr for block in blocks for name in block.names}
+    def retarget(literal: str) -> str:
+        return re.sub(r"(\w+)\((\d+|\?)\)", lambda m: f"{m[1]}({flag_table.get(m[1], m[2])})", literal)
+    def jump(addr: int, target: _LayoutBlock, line: int) -> tuple[int, bytes, str, int]:
+        code = isa.encode(isa.OPS["MOVLZ"], [("R", RegisterEnum.PC.value), ("C", target.addr), ("C", 0)])
+        name = target.names[0] if target.names else "start"
+        return addr, code, f"MOVLZ PC {name}({target.addr}) 0", line
+    nop = isa.encode(isa.OPS["NOP"], [])
+    pieces: list[tuple[int, bytes, str, int]] = []
+    old_entry_addr = []
+    addr = 0
+    for code, _ in result.bin_code:
+        old_entry_addr.append(addr)
+        addr += len(code)
+    for i, block in enumerate(blocks):
+        addr = block.addr
+        line = 0
+        for entry in block.entries:
+            code, literal = result.bin_code[entry]
+            line = result.lines[old_entry_addr[entry]]
+            pieces.append((addr, code, retarget(literal), line))
+            addr += len(code)
+        if block in kept:
+            needs_jump = jump_after(i)
+        else:
+            needs_jump = block.falls and block is not last and blocks[i + 1].addr != addr
+        if needs_jump:
+            pieces.append(jump(addr, blocks[i + 1], line))
+        elif block in kept and block.falls and block is not last:
+            # 顺序执行经过的填充
+            pieces.extend((pad, nop, "NOP", line) for pad in range(addr, kept[block] + slot_sizes[kept[block]]))
+    for block in forwards:
+        pieces.append(jump(slots[block], block, result.lines[old_entry_addr[block.entries[0]]] if block.entries else 0))
+    pieces.sort(key=lambda piece: piece[0])
+    # 空隙不会被执行，保留上一版本的字节
+    laid_out = AssembleResult()
+    laid_out.flag_table = flag_table
+    laid_out.diagnostics = result.diagnostics
+    addr = 0
+    line = 0
+    for piece_addr, code, literal, piece_line in pieces:
+        assert piece_addr >= addr, f"稳定布局中地址 {piece_addr} 处的字节码与前一段重叠"
+        while addr < piece_addr:
+            laid_out.bin_code.append((previous_rom[addr:addr + 1] or nop, "(未使用)"))
+            laid_out.lines.append(line)
+            addr += 1
+        laid_out.bin_code.append((code, literal))
+        laid_out.lines.extend([piece_line] * len(code))
+        addr += len(code)
+        line = piece_line
+    # 重定位
+    binary = bytearray(laid_out.binary)
+    for reloc in result.relocations:
+        block = next(b for b in reversed(blocks) if b.start <= reloc.offset)
+        value = flag_table[reloc.name]
+        max_value = 0xFF if reloc.kind == RELOC_BYTE else 0b111
+        if value > max_value:
+            laid_out.diagnostics.append(Diagnostic(reloc.line + 1, get_line_column(code_lines[reloc.line]), SEVERITY_ERROR,
+                f"稳定布局中标记 '{reloc.name}' 的地址为 {value}，超出范围[0, {max_value}]，请改用 MOVLZ/MOVLN"))
+            continue
+        link.patch_field(binary, block.addr + reloc.offset - block.start, reloc.kind, value)
+    addr = 0
+    for i, (code, literal) in enumerate(laid_out.bin_code):
+        laid_out.bin_code[i] = (bytes(binary[addr:addr + len(code)]), literal)
+        addr += len(code)
+    if addr > ROM_SIZE:
+        laid_out.diagnostics.append(Diagnostic(1, 1, SEVERITY_ERROR, f"稳定布局后程序大小 {addr} 字节，超出ROM容量 {ROM_SIZE} 字节"))
+    laid_out.diagnostics.sort(key=lambda d: d.line)
+    if not laid_out.has_error:
+        sequential = assemble(code_raw, no_warn=no_warn)
+        changes = lambda rom: sum(a != b for a, b in zip(rom, previous_rom)) + max(0, len(rom) - len(previous_rom))
+        if changes(sequential.binary) <= changes(laid_out.binary):
+            sequential.diagnostics.insert(0, Diagnostic(1, 1, SEVERITY_WARNING,
+                f"顺序布局与上一版本的差异({changes(sequential.binary)}字节)不多于稳定布局({changes(laid_out.binary)}字节)，已使用顺序布局"))
+            return sequential
+    return laid_out
+
+_MOV_OPS = ("MOVZ", "MOVN", "MOVLZ", "MOVLN")
+
+class _PGOBlock:
+    """剖析引导布局中的基本块：从标记或跳转之后开始，到下一个标记或写入PC的指令为止。"""
+    FALL = 0 # 顺序执行进入next
+    JUMP = 1 # 以无条件跳转到target结束
+    BRANCH = 2 # 以条件跳转结束，条件满足时到target，否则到next
+    STOP = 3 # 以无条件的间接跳转(目标为寄存器)结束
+
+    def __init__(self, start: int):
+        self.names: list[str] = [] # 位于块开头的标记
+        self.start = start # 顺序布局中的起始地址
+        self.entries: list[int] = [] # 块内指令在bin_code中的下标，不含结尾的标记跳转
+        self.kind = _PGOBlock.FALL
+        self.jump: Optional[int] = None # 结尾的标记跳转在bin_code中的下标
+        self.sense = "Z" # 条件跳转在条件为0(Z)或非0(N)时跳转
+        self.cond: isa.Operand = ("C", 0)
+        self.target: Optional["_PGOBlock"] = None
+        self.next: Optional["_PGOBlock"] = None # 顺序布局中的下一块，最后一块为None
+        self.addr = 0 # 新布局中的起始地址
+
+    @property
+    def label(self) -> str:
+        """用于字面量的名称。没有标记的块显示为 @顺序布局中的地址。"""
+        return self.names[0] if self.names else ("start" if self.start == 0 else f"@{self.start}")
+
+class LayoutReport(NamedTuple):
+    """剖析引导布局的效果，按剖析中的执行次数计算。"""
+    steps: int # 剖析中执行的指令数
+    predicted: int # 新布局下预计执行的指令数
+    removed: int # 删除的跳转条数
+    added: int # 插入的跳转条数
+    inverted: int # 反转条件的跳转条数
+    short: int # 使用2字节短跳转的条数
+    window: list[str] # 位于短跳转窗口(地址0..7)的被跳转标记
+    size: int # 顺序布局的字节数
+    new_size: int
+
+def out_layout_report(report: LayoutReport) -> str:
+    saved = report.steps - report.predicted
+    rate = saved / report.steps * 100 if report.steps else 0.0
+    string = (f"剖析引导布局: 预计执行指令 {report.steps} -> {report.predicted}，减少 {saved} ({rate:.1f}%)\n"
+              f"    删除跳转 {report.removed} 条，插入 {report.added} 条，反转条件 {report.inverted} 条，短跳转 {report.short} 条\n"
+              f"    大小 {report.size} -> {report.new_size} 字节\n")
+    if report.window:
+        string += f"    短跳转窗口(0..7): {', '.join(report.window)}\n"
+    return string
+
+SHORT_WINDOW = 0b111 # MOVZ/MOVN的值字段可以直接表示的最大地址
+
+def pgo_layout(code_raw: str, profile, no_warn: bool = False) -> tuple[AssembleResult, Optional[LayoutReport]]:
+    """
+    剖析引导布局编译：按vm.py -P记录的执行剖析重排基本块，使热路径顺序执行，减少执行的跳转指令。
+
+    每条指令执行一步，条件跳转无论是否跳转都执行一条指令，因此只有无条件跳转与为顺序执行插入的跳转可以省去。
+    以边权(省去的执行次数)从大到小将基本块连成链，链内后继紧随其后；条件跳转的目标紧随其后时，
+    反转条件，改为跳转到原来的顺序后继。
+    程序开头的链放在地址0，之后按被跳转次数从多到少排列其余的链，使最常被跳转到的标记尽量位于地址0..7，
+    跳转到这些标记时使用2字节的MOVZ/MOVN，其余使用MOVLZ/MOVLN。
+
+    程序读取PC的值、以非MOV指令写入PC、跳转到数字地址，或标记参与运算时，无法安全地移动代码，使用顺序布局并给出警告。
+    载入寄存器的标记地址随布局改变，只应用于间接跳转；执行到程序末尾之后的行为也不保证与顺序布局相同。
+
+    :param profile: vm.ExecutionProfile，必须由同一源代码的顺序布局记录
+    :return: 编译结果, 布局效果。使用顺序布局时效果为None
+    """
+    import link
+    sequential = assemble(code_raw, no_warn=no_warn)
+    if sequential.has_error:
+        return sequential, None
+    def fallback(reason: str) -> tuple[AssembleResult, None]:
+        sequential.diagnostics.insert(0, Diagnostic(1, 1, SEVERITY_WARNING, f"{reason}，已使用顺序布局"))
+        return sequential, None
+    if profile.rom != sequential.binary:
+        return fallback("剖析记录的程序与源代码的编译结果不一致，请重新记录剖析")
+    result = assemble(code_raw, no_warn=True, relocatable=True)
+    # 划分基本块
+    labels: dict[int, list[str]] = {}
+    for name, addr in result.flag_table.items():
+        labels.setdefault(addr, []).append(name)
+    relocs_at: dict[int, list[Relocation]] = {}
+    for reloc in result.relocations:
+        relocs_at.setdefault(reloc.offset, []).append(reloc)
+    entry_addr: list[int] = []
+    blocks = [_PGOBlock(0)]
+    addr = 0
+    for i, (code, _) in enumerate(result.bin_code):
+        entry_addr.append(addr)
+        if addr in labels and (blocks[-1].entries or blocks[-1].jump is not None):
+            blocks.append(_PGOBlock(addr))
+        block = blocks[-1]
+        if addr in labels and not block.names:
+            block.names = sorted(labels[addr])
+        decoded = isa.decode(*(code + bytes(3))[:3])
+        spec = decoded.spec
+        values = decoded.operands[1:] if spec.writes_dest else decoded.operands
+        relocs = [reloc for offset in range(addr, addr + len(code)) for reloc in relocs_at.get(offset, [])]
+        if ("R", RegisterEnum.PC.value) in values:
+            return fallback(f"第{result.lines[addr] + 1}行读取了PC的值，无法移动代码")
+        if relocs and (spec.name not in _MOV_OPS or len(relocs) > 1 or relocs[0].offset != addr + 1
+                       or relocs[0].kind == RELOC_LO3):
+            return fallback(f"第{result.lines[addr] + 1}行的标记 '{relocs[0].name}' 参与运算或作为条件，无法移动代码")
+        addr += len(code)
+        if not (spec.writes_dest and decoded.operands[0] == ("R", RegisterEnum.PC.value)):
+            block.entries.append(i)
+            continue
+        if spec.name not in _MOV_OPS:
+            return fallback(f"第{result.lines[entry_addr[i]] + 1}行以{spec.name}写入PC，无法移动代码")
+        cond = decoded.operands[2]
+        sense = "Z" if spec.name in ("MOVZ", "MOVLZ") else "N"
+        always = cond[0] == "C" and (cond[1] == 0) == (sense == "Z")
+        never = cond[0] == "C" and not always
+        if never:
+            block.entries.append(i)
+            continue
+        if decoded.operands[1][0] == "R":
+            block.entries.append(i)
+            if always:
+                block.kind = _PGOBlock.STOP
+        elif not relocs:
+            return fallback(f"第{result.lines[entry_addr[i]] + 1}行跳转到数字地址，无法移动代码")
+        else:
+            block.jump = i
+            block.kind = _PGOBlock.JUMP if always else _PGOBlock.BRANCH
+            block.sense = sense
+            block.cond = cond
+            block.target = relocs[0].name # 划分完成后替换为块
+        blocks.append(_PGOBlock(addr))
+    if addr in labels:
+        if blocks[-1].entries or blocks[-1].jump is not None:
+            blocks.append(_PGOBlock(addr))
+        blocks[-1].names = sorted(labels[addr])
+    if not blocks[-1].entries and blocks[-1].jump is None and not blocks[-1].names and len(blocks) > 1:
+        blocks.pop()
+    # 顺序执行到程序末尾之后的位置，作为最后一块的后继，始终放在最后
+    end = None
+    if blocks[-1].kind in (_PGOBlock.FALL, _PGOBlock.BRANCH):
+        end = _PGOBlock(addr)
+        end.kind = _PGOBlock.STOP
+        blocks.append(end)
+    by_name = {name: block for block in blocks for name in block.names}
+    for block, following in zip(blocks, blocks[1:] + [None]):
+        block.next = following
+        if isinstance(block.target, str):
+            block.target = by_name[block.target]
+        if block.kind == _PGOBlock.BRANCH and block.target is following:
+            # 跳转到顺序后继的条件跳转，无论条件如何都进入同一块
+            block.kind = _PGOBlock.JUMP
+            block.sense, block.cond = "Z", ("C", 0)
+    # 边权
+    counts = profile.counts
+    def falls(tail: Optional[int]) -> int:
+        """块末尾顺序执行到下一块的次数。以条件间接跳转结尾时不计跳转的次数。"""
+        if tail is None:
+            return 0
+        executed, taken = profile.taken(tail)
+        return executed - taken
+    def last_addr(block: _PGOBlock) -> Optional[int]:
+        last = block.jump if block.jump is not None else (block.entries[-1] if block.entries else None)
+        return None if last is None else entry_addr[last]
+    weights: dict[tuple[_PGOBlock, _PGOBlock], int] = {} # (前驱, 后继) -> 紧随其后时省去的执行次数
+    for block in blocks:
+        tail = last_addr(block)
+        if block.kind == _PGOBlock.JUMP:
+            executed, taken = profile.taken(tail)
+            weights[(block, block.target)] = executed
+        elif block.kind == _PGOBlock.BRANCH:
+            # 条件跳转无论是否跳转都执行一条指令；两个后继都不紧随其后时，才需要为次数较少的一方插入跳转
+            executed, taken = profile.taken(tail)
+            weights[(block, block.target)] = weights[(block, block.next)] = min(executed - taken, taken)
+        elif block.kind == _PGOBlock.FALL and block.next is not None:
+            weights[(block, block.next)] = falls(tail)
+    # 权大的边优先；权相同时优先保持原有的顺序执行关系，其次按源代码顺序，未执行的代码保持原样
+    edges = [(weight, src, dst) for (src, dst), weight in weights.items()]
+    edges.sort(key=lambda edge: (-edge[0], edge[1].next is not edge[2], blocks.index(edge[1])))
+    chains: dict[_PGOBlock, list[_PGOBlock]] = {block: [block] for block in blocks}
+    for _, src, dst in edges:
+        if dst is blocks[0] or dst is end or src is dst:
+            continue
+        head, tail = chains[src], chains[dst]
+        if head is tail or head[-1] is not src or tail[0] is not dst:
+            continue
+        head.extend(tail)
+        for block in tail:
+            chains[block] = head
+    # 排列链：程序开头的链在前，顺序执行到程序末尾的链在最后，其余按被跳转的次数从多到少
+    def falls_into(src: _PGOBlock, dst: _PGOBlock) -> bool:
+        chain = chains[src]
+        return chains[dst] is chain and chain.index(dst) == chain.index(src) + 1
+    heat: dict[int, int] = {} # 链 -> 跳转进入链的次数
+    for block in blocks:
+        if block.kind in (_PGOBlock.JUMP, _PGOBlock.BRANCH) and not falls_into(block, block.target):
+            key = id(chains[block.target])
+            heat[key] = heat.get(key, 0) + profile.taken(last_addr(block))[1]
+    first = chains[blocks[0]]
+    last = chains[blocks[-2]] if end is not None else None
+    middle = [chains[block] for block in blocks
+              if chains[block][0] is block and chains[block] not in (first, last) and block is not end]
+    middle.sort(key=lambda chain: -heat.get(id(chain), 0))
+    chain_order = [first] + middle + ([last] if last is not None and last is not first else [])
+    order = [block for chain in chain_order for block in chain] + ([end] if end is not None else [])
+    # 结尾跳转: (块, 跳转类型Z/N, 条件, 目标)。顺序后继不再紧随其后时插入无条件跳转
+    removed = added = inverted = 0
+    predicted = profile.steps
+    terminators: dict[_PGOBlock, list[tuple[str, isa.Operand, _PGOBlock]]] = {}
+    for block, following in zip(order, order[1:] + [None]):
+        jumps: list[tuple[str, isa.Operand, _PGOBlock]] = []
+        tail = last_addr(block)
+        if block.kind == _PGOBlock.FALL and block.next is not None and block.next is not following:
+            jumps.append(("Z", ("C", 0), block.next))
+            added += 1
+            predicted += falls(tail)
+        elif block.kind == _PGOBlock.JUMP:
+            if block.target is following:
+                removed += 1
+                predicted -= counts.get(tail, 0)
+            else:
+                jumps.append(("Z", ("C", 0), block.target))
+        elif block.kind == _PGOBlock.BRANCH:
+            executed, taken = profile.taken(tail)
+            inverse = "N" if block.sense == "Z" else "Z"
+            if block.next is following:
+                jumps.append((block.sense, block.cond, block.target))
+            elif block.target is following:
+                jumps.append((inverse, block.cond, block.next))
+                inverted += 1
+            elif executed - taken <= taken:
+                jumps.append((block.sense, block.cond, block.target))
+                jumps.append(("Z", ("C", 0), block.next))
+                added += 1
+                predicted += executed - taken
+            else:
+                jumps.append((inverse, block.cond, block.next))
+                jumps.append(("Z", ("C", 0), block.target))
+                inverted += 1
+                added += 1
+                predicted += taken
+        terminators[block] = jumps
+    # 计算地址。跳转目标位于0..7时使用短跳转，地址只会因此变小，重复直到不再变化
+    short: set[tuple[int, int]] = set() # (块下标, 结尾跳转下标)
+    while True:
+        addr = 0
+        for block in order:
+            block.addr = addr
+            addr += sum(len(result.bin_code[i][0]) for i in block.entries)
+            addr += sum(2 if (id(block), j) in short else JUMP_SIZE for j in range(len(terminators[block])))
+        size = addr
+        new_short = {(id(block), j) for block in order for j, (_, _, target) in enumerate(terminators[block])
+                     if target.addr <= SHORT_WINDOW}
+        if new_short == short:
+            break
+        short = new_short
+    if size > ROM_SIZE:
+        return fallback(f"剖析引导布局后程序大小 {size} 字节，超出ROM容量 {ROM_SIZE} 字节")
+    if predicted > profile.steps or predicted == profile.steps and size >= len(sequential.binary):
+        return fallback("剖析引导布局不能减少执行的指令或程序大小")
+    # 生成字节码
+    flag_table = {name: block.addr for block in blocks for name in block.names}
+    laid_out = AssembleResult()
+    laid_out.flag_table = flag_table
+    laid_out.diagnostics = sequential.diagnostics
+    def retarget(literal: str) -> str:
+        return re.sub(r"(\w+)\((\d+|\?)\)", lambda m: f"{m[1]}({flag_table.get(m[1], m[2])})", literal)
+    for block in order:
+        addr = block.addr
+        line = result.lines[entry_addr[block.entries[0]]] if block.entries else 0
+        for i in block.entries:
+            code, literal = result.bin_code[i]
+            line = result.lines[entry_addr[i]]
+            code = bytearray(code)
+            for offset in range(len(code)):
+                for reloc in relocs_at.get(entry_addr[i] + offset, []):
+                    value = flag_table[reloc.name]
+                    if reloc.kind != RELOC_BYTE and value > SHORT_WINDOW:
+                        return fallback(f"第{reloc.line + 1}行的标记 '{reloc.name}' 移动到地址 {value}，超出3位常量的范围")
+                    link.patch_field(code, offset, reloc.kind, value)
+            laid_out.bin_code.append((bytes(code), retarget(literal)))
+            laid_out.lines.extend([line] * len(code))
+            addr += len(code)
+        if block.jump is not None:
+            line = result.lines[entry_addr[block.jump]]
+        for j, (sense, cond, target) in enumerate(terminators[block]):
+            is_short = (id(block), j) in short
+            name = {("Z", False): "MOVLZ", ("N", False): "MOVLN", ("Z", True): "MOVZ", ("N", True): "MOVN"}[(sense, is_short)]
+            code = isa.encode(isa.OPS[name], [("R", RegisterEnum.PC.value), ("C", target.addr), cond])
+            laid_out.bin_code.append((code, f"{name} PC {target.label}({target.addr}) {isa.format_operand(cond)}"))
+            laid_out.lines.extend([line] * len(code))
+    window = [block.label for block in order if block.addr <= SHORT_WINDOW and block.names
+              and any(target is block for jumps in terminators.values() for _, _, target in jumps)]
+    report = LayoutReport(profile.steps, predicted, removed, added, inverted, len(short), window, len(sequential.binary), size)
+    return laid_out, report
+
+def compile(args: argparse.Namespace, code_raw: str) -> tuple[BinCodeType, bool, list[int]]:
+    """
+    编译汇编代码，并打印错误与警告信息。库调用请使用assemble。
+
+    :param code: 汇编代码
+    :type code: str
+    :return: 字节码, 是否有错误, 字节码每行对应的源代码行号
+    :rtype: tuple[BinCodeType, bool]
+    """
+    result = assemble(code_raw, no_warn=args.no_warn)
+    print_diagnostics(result, code_raw)
+    return result.bin_code, result.has_error, result.lines
+
+def print_diagnostics(result: AssembleResult, code_raw: str):
+    """打印编译结果中的错误与警告信息。"""
+    code_raw_lines = code_raw.splitlines()
+    for d in result.diagnostics:
+        title = "警告" if d.severity == SEVERITY_WARNING else "错误"
+        print_error(d.line, d.message, code_raw_lines[d.line - 1], title=title)
 
 def out_bin(bytecode: BinCodeType) -> str:
     string = """\
@@ -581,6 +1139,39 @@ def pack_bin(bytecode: BinCodeType) -> bytearray:
     """打包成buytearray"""
     return bytearray(b''.join([inst for inst, _ in bytecode]))
 
+def out_debug_json(bincode: bytes, code: str, bin_src_lines: list[int]) -> str:
+    """生成旧版调试信息JSON字符串。"""
+    import base64, json
+    return f"""\
+{{
+    "bin": "{base64.b64encode(bincode).decode()}",
+    "src": {json.dumps(code, ensure_ascii=False)},
+    "lines": {bin_src_lines}
+}}
+"""
+
+def out_debug_object(result: AssembleResult, code: str, compress_source: bool = True) -> bytes:
+    """生成DZO格式的调试目标文件数据，包含字节码、符号表、行号表与源代码。"""
+    import dzo
+    return dzo.write_object(dzo.build_debug_object(
+        result.binary, result.flag_table, result.lines, code, compress_source=compress_source
+    ))
+
+def out_relocatable_object(result: AssembleResult, code: str, compress_source: bool = True) -> bytes:
+    """
+    生成DZO格式的可重定位目标文件数据，供link.py链接。
+    符号表只包含导出的标记，其余标记写入本地符号段，额外包含重定位段。
+    """
+    import dzo
+    exports = {name: addr for name, addr in result.flag_table.items() if name in result.exports}
+    local = {name: addr for name, addr in result.flag_table.items() if name not in exports}
+    sections = dzo.build_debug_object(
+        result.binary, exports, result.lines, code, compress_source=compress_source
+    )
+    sections.append((dzo.SECTION_LOCL, 0, dzo.pack_symbols(local)))
+    sections.append((dzo.SECTION_RELO, 0, dzo.pack_relocations(result.relocations)))
+    return dzo.write_object(sections)
+
 def main():
     parser = argparse.ArgumentParser(description="DZC-8M Instruction ASM Compiler")
     parser.add_argument("file", help="输入的汇编代码文件")
@@ -593,23 +1184,78 @@ def main():
                     nargs='?',
                     const=1,
                     default=None,
-                    help="将调试信息输出到文件，类型为JSON文件。不指定则不输出到文件，使用此选项但不指定文件则输出到同名同目录下的.json文件")
+                    help="将调试信息输出到文件，类型为DZO目标文件。不指定则不输出到文件，使用此选项但不指定文件则输出到同名同目录下的.dzo文件。文件名以.json结尾时输出旧版JSON格式")
     parser.add_argument("-nob", "--no-output_binary", action="store_true", help="不输出二进制字节码")
+    parser.add_argument("-c", "--relocatable",
+                    nargs='?',
+                    const=1,
+                    default=None,
+                    help="编译为可重定位目标文件，供link.py链接。允许引用其他文件中 .global 导出的标记，本文件的标记须用 .global 导出才能被其他文件引用。使用此选项但不指定文件则输出到同名同目录下的.o文件")
+    parser.add_argument("-S", "--stable-layout", default=None, metavar="PREV",
+                    help="稳定布局：尽量让各标记开始的代码块保持上一版本DZO调试文件PREV中的地址，使修改后写入ROM的字节最少。可与-D输出到同一文件")
+    parser.add_argument("-P", "--pgo", action="append", metavar="PROFILE",
+                    help="剖析引导布局：按vm.py -P记录的剖析文件重排代码块，使常用路径顺序执行，减少执行的跳转。可重复，多个剖析累加")
+    parser.add_argument("--no-compress-src", action="store_true", help="DZO调试信息中不压缩源代码")
     parser.add_argument("--no-warn", action="store_true", help="不显示警告")
     parser.add_argument("--version", action="version", version=f"Eggy Assembler Compiler\n{__version__}\nfor DZC-8M Plus Instruction Set")
     args = parser.parse_args()
     # 读取文件内容
     with open(args.file, "r", encoding="utf-8") as f:
         code = f.read()
+    if args.relocatable and (args.output or args.debug_output):
+        print("-c 不能与 -o 或 -D 同时使用。请使用link.py生成字节码与调试信息。")
+        return 1
+    if args.relocatable and args.stable_layout:
+        print("-c 不能与 -S 同时使用。")
+        return 1
+    if args.pgo and (args.relocatable or args.stable_layout):
+        print("-P 不能与 -c 或 -S 同时使用。")
+        return 1
     # 编译
-    bytecode, has_error, bin_src_lines = compile(args, code)
-    if has_error:
+    if args.stable_layout:
+        import dzo
+        try:
+            with dzo.ObjectFile.open(args.stable_layout) as obj:
+                previous_symbols, previous_rom = obj.symbols(), obj.rom
+        except (OSError, dzo.DZOFormatException) as e:
+            print(f"无法读取上一版本的布局: {e}")
+            return 1
+        result = stable_layout(code, previous_symbols, previous_rom, no_warn=args.no_warn)
+    elif args.pgo:
+        import vm
+        try:
+            profile = vm.ExecutionProfile.load(args.pgo[0])
+            for path in args.pgo[1:]:
+                profile.merge(vm.ExecutionProfile.load(path))
+        except vm.ProfileException as e:
+            print(e)
+            return 1
+        result, report = pgo_layout(code, profile, no_warn=args.no_warn)
+    else:
+        result = assemble(code, no_warn=args.no_warn, relocatable=bool(args.relocatable))
+    print_diagnostics(result, code)
+    if result.has_error:
         print("编译失败，存在错误。")
         return 1
+    if args.stable_layout:
+        moved = sorted(name for name, addr in result.flag_table.items() if previous_symbols.get(name, addr) != addr)
+        print(f"稳定布局: {len(result.flag_table) - len(moved)} 个标记保持原地址" + (f"，移动: {', '.join(moved)}" if moved else ""))
+    if args.pgo and report is not None:
+        print(out_layout_report(report), end="")
+    bytecode = result.bin_code
     # 输出字节码
     if not args.no_output_binary:
         print(out_bin(bytecode))
     bincode = pack_bin(bytecode)
+    # 如果指定了可重定位目标文件，则写入文件
+    if args.relocatable:
+        if args.relocatable == 1:
+            filename = os.path.splitext(args.file)[0] + ".o"
+        else:
+            filename = args.relocatable
+        with open(filename, "wb") as f:
+            f.write(out_relocatable_object(result, code, compress_source=not args.no_compress_src))
+        print(f"可重定位目标文件已输出到 {filename}")
     # 如果指定了输出文件，则写入文件
     if args.output:
         # 如果没有指定文件名，构造文件名
@@ -622,20 +1268,16 @@ def main():
         print(f"二进制字节码已输出到 {filename}")
     # 如果指定了调试输出文件，则写入文件
     if args.debug_output:
-        import base64
-        debug_string = f"""\
-{{
-    "bin": "{base64.b64encode(bincode).decode()}",
-    "src": "{repr(code)[1:-1]}",
-    "lines": {bin_src_lines}
-}}
-"""
         if args.debug_output == 1:
-            filename = os.path.splitext(args.file)[0] + ".json"
+            filename = os.path.splitext(args.file)[0] + ".dzo"
         else:
             filename = args.debug_output
-        with open(filename, "w", encoding="utf-8") as f:
-            f.write(debug_string)
+        if filename.lower().endswith(".json"):
+            with open(filename, "w", encoding="utf-8") as f:
+                f.write(out_debug_json(bincode, code, result.lines))
+        else:
+            with open(filename, "wb") as f:
+                f.write(out_debug_object(result, code, compress_source=not args.no_compress_src))
         print(f"调试信息已输出到 {filename}")
     return 0
 
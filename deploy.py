@@ -0,0 +1,162 @@
+"""
+部署计划。将新的字节码与游戏内ROM当前内容(保存在本地清单文件中)比较，
+生成按地址排列的最少字节写入列表，可选按位显示需要拨动的开关。
+
+配合 cp.py -S 稳定布局使用，修改程序后需要写入的字节更少。
+"""
+import os, sys
+import json
+import time
+from typing import NamedTuple, Optional
+
+import argparse
+
+import dzo
+import isa
+
+__version__ = "0.1.0"
+
+ROM_SIZE = 0xFF # 游戏内ROM大小
+DEFAULT_MANIFEST = "rom_manifest.json"
+
+class ByteWrite(NamedTuple):
+    """一次字节写入。"""
+    addr: int
+    old: int
+    new: int
+
+    @property
+    def toggles(self) -> int:
+        """需要拨动的开关数。"""
+        return bin(self.old ^ self.new).count("1")
+
+class ManifestException(Exception):
+    pass
+
+def load_rom(path: str) -> bytes:
+    """读取二进制字节码文件或DZO文件中的字节码。"""
+    if dzo.is_object_file(path):
+        with dzo.ObjectFile.open(path) as obj:
+            return obj.rom
+    with open(path, "rb") as f:
+        return f.read()
+
+def read_manifest(path: str) -> Optional[bytes]:
+    """
+    读取清单文件中记录的ROM内容。文件不存在时返回None。
+
+    :raises ManifestException: 清单文件格式错误
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        try:
+            return bytes.fromhex(json.load(f)["rom"])
+        except (ValueError, KeyError, TypeError) as e:
+            raise ManifestException(f"无效的清单文件 {path}: {e}")
+
+def write_manifest(path: str, rom: bytes, source: str):
+    """记录游戏内ROM的当前内容。"""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({
+            "rom": rom.hex(),
+            "source": source,
+            "updated": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }, f, ensure_ascii=False, indent=4)
+        f.write("\n")
+
+def plan_writes(current: bytes, new: bytes, keep_tail: bool = False) -> list[ByteWrite]:
+    """
+    生成将current改写为new所需的字节写入，按地址递增排列，与游戏内从地址0开始的输入顺序一致。
+
+    :param keep_tail: 不清除new末尾之后的旧字节。程序不会执行到这些字节时可以减少写入
+    """
+    size = len(new) if keep_tail else max(len(current), len(new))
+    writes: list[ByteWrite] = []
+    for addr in range(size):
+        old = current[addr] if addr < len(current) else 0
+        value = new[addr] if addr < len(new) else 0
+        if old != value:
+            writes.append(ByteWrite(addr, old, value))
+    return writes
+
+def apply_writes(current: bytes, writes: list[ByteWrite]) -> bytes:
+    """执行写入后的ROM内容，用于更新清单。"""
+    rom = bytearray(current)
+    for write in writes:
+        if write.addr >= len(rom):
+            rom += bytes(write.addr + 1 - len(rom))
+        rom[write.addr] = write.new
+    return bytes(rom.rstrip(b"\x00"))
+
+def bit_marks(write: ByteWrite) -> str:
+    """高位在前，^ 表示需要拨动的开关。"""
+    diff = write.old ^ write.new
+    return "".join("^" if diff >> bit & 1 else "." for bit in range(7, -1, -1))
+
+def out_plan(writes: list[ByteWrite], new: bytes, bits: bool = False) -> str:
+    """生成写入列表。指令起始地址处显示新的指令。"""
+    starts = {addr: str(decoded) for addr, _, decoded in isa.disassemble(new)}
+    if bits:
+        string = """\
+  Addr  Old        New        Toggle     ASM
+┌──────┬──────────┬──────────┬──────────┬──────────────────────
+"""
+        for write in writes:
+            string += (f"│ {write.addr:>4} │ {write.old:08b} │ {write.new:08b} │ {bit_marks(write)} │"
+                       f" {starts.get(write.addr, '')}\n")
+        string += """\
+└──────┴──────────┴──────────┴──────────┴──────────────────────
+"""
+    else:
+        string = """\
+  Addr  Old  New   ASM
+┌──────┬────┬─────┬──────────────────────
+"""
+        for write in writes:
+            string += f"│ {write.addr:>4} │ {write.old:02X} │ {write.new:02X}  │ {starts.get(write.addr, '')}\n"
+        string += """\
+└──────┴────┴─────┴──────────────────────
+"""
+    return string
+
+def out_summary(writes: list[ByteWrite], new: bytes) -> str:
+    full = sum(1 for byte in new if byte)
+    full_toggles = sum(bin(byte).count("1") for byte in new)
+    return (f"需写入 {len(writes)} 字节，拨动 {sum(w.toggles for w in writes)} 个开关"
+            f"（从空ROM完整写入需 {full} 字节，{full_toggles} 个开关）\n")
+
+def main():
+    parser = argparse.ArgumentParser(description="DZC-8M ROM Deployment Planner")
+    parser.add_argument("file", help="要部署的二进制字节码文件或DZO文件")
+    parser.add_argument("-m", "--manifest", default=DEFAULT_MANIFEST,
+                        help=f"记录游戏内ROM当前内容的清单文件。不存在时视为空ROM。默认{DEFAULT_MANIFEST}")
+    parser.add_argument("-b", "--bits", action="store_true", help="按位显示，标出每个字节需要拨动的开关")
+    parser.add_argument("--keep-tail", action="store_true", help="不清除新程序末尾之后的旧字节")
+    parser.add_argument("-u", "--update", action="store_true", help="写入完成后，将新的ROM内容记录到清单文件")
+    parser.add_argument("--version", action="version", version=f"Eggy Deployment Planner\n{__version__}\nfor DZC-8M Plus Instruction Set")
+    args = parser.parse_args()
+
+    try:
+        new = load_rom(args.file)
+        current = read_manifest(args.manifest)
+    except (OSError, ManifestException, dzo.DZOFormatException) as e:
+        print(e)
+        return 1
+    if len(new) > ROM_SIZE:
+        print(f"程序大小 {len(new)} 字节，超出游戏内ROM容量 {ROM_SIZE} 字节。")
+        return 1
+    if current is None:
+        print(f"清单文件 {args.manifest} 不存在，视为空ROM。")
+        current = b""
+    writes = plan_writes(current, new, keep_tail=args.keep_tail)
+    if writes:
+        print(out_plan(writes, new, bits=args.bits), end="")
+    print(out_summary(writes, new), end="")
+    if args.update:
+        write_manifest(args.manifest, apply_writes(current, writes), os.path.abspath(args.file))
+        print(f"清单已更新: {args.manifest}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
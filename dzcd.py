@@ -0,0 +1,395 @@
+"""
+DZC-8M 工具链常驻服务。
+
+服务进程常驻内存，通过Unix域套接字提供编译、无界面运行与性能分析服务，
+避免每次调用都重新启动解释器、导入模块与构建表。
+
+协议：每条消息为 4字节大端序长度 + UTF-8编码的JSON对象。
+客户端发送请求后等待一条响应，同一连接可发送多个请求。
+
+请求:
+    {"op": "ping"}
+    {"op": "assemble", "source": str, "no_warn": bool, "relocatable": bool}
+    {"op": "run", "source": str | "binary": base64, "max_events": int, "max_steps": int}
+    {"op": "profile", "source": str | "binary": base64, "max_steps": int}
+    max_events与max_steps缺省或为null时使用默认值(max_events不限)，否则须为1到MAX_STEPS之间的整数
+    {"op": "stats"}
+    {"op": "shutdown"}
+
+响应: {"ok": true, ...} 或 {"ok": false, "error": str}
+"""
+import os, sys
+import json
+import socket
+import struct
+import tempfile
+from typing import Any, Optional
+
+__version__ = "0.1.0"
+
+length_struct = struct.Struct(">I")
+
+MAX_MESSAGE_SIZE = 16 * 1024 * 1024
+MAX_STEPS = 10_000_000 # 单个请求最多执行的步数，避免不会PAUSE的程序长期占用服务线程
+
+def default_socket_path() -> str:
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    uid = os.getuid() if hasattr(os, "getuid") else 0
+    return os.path.join(runtime_dir, f"dzcd-{uid}.sock")
+
+class ProtocolException(Exception):
+    pass
+
+def recv_exact(sock: socket.socket, size: int) -> Optional[bytes]:
+    """读取恰好size字节。连接在消息边界关闭时返回None。"""
+    buf = bytearray()
+    while len(buf) < size:
+        chunk = sock.recv(size - len(buf))
+        if not chunk:
+            if buf:
+                raise ProtocolException("连接在消息中途关闭")
+            return None
+        buf += chunk
+    return bytes(buf)
+
+def send_message(sock: socket.socket, message: dict[str, Any]):
+    data = json.dumps(message, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    sock.sendall(length_struct.pack(len(data)) + data)
+
+def recv_message(sock: socket.socket) -> Optional[dict[str, Any]]:
+    header = recv_exact(sock, length_struct.size)
+    if header is None:
+        return None
+    size, = length_struct.unpack(header)
+    if size > MAX_MESSAGE_SIZE:
+        raise ProtocolException(f"消息过大: {size}字节")
+    data = recv_exact(sock, size)
+    if data is None:
+        raise ProtocolException("连接在消息中途关闭")
+    return json.loads(data.decode("utf-8"))
+
+class Client:
+    """常驻服务客户端。保持一个连接，可连续发送多个请求。"""
+    def __init__(self, path: Optional[str] = None):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path or default_socket_path())
+
+    def request(self, op: str, **kwargs) -> dict[str, Any]:
+        send_message(self.sock, {"op": op, **kwargs})
+        response = recv_message(self.sock)
+        if response is None:
+            raise ProtocolException("服务端关闭了连接")
+        return response
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc):
+        self.close()
+
+# ---------------- 服务端 ----------------
+
+class LRUCache:
+    """线程安全的LRU缓存。"""
+    def __init__(self, capacity: int):
+        import threading
+        from collections import OrderedDict
+        self.capacity = capacity
+        self.data: "OrderedDict[Any, Any]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            value = self.data.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            while len(self.data) > self.capacity:
+                self.data.popitem(last=False)
+
+class ToolchainService:
+    """请求处理逻辑，持有编译结果与程序的缓存。"""
+    def __init__(self, cache_size: int = 256):
+        import base64, hashlib
+        import cp, vm, dzo
+        self.base64 = base64
+        self.hashlib = hashlib
+        self.cp = cp
+        self.vm = vm
+        self.dzo = dzo
+        self.assemble_cache = LRUCache(cache_size) # (源代码哈希, 选项) -> 编译响应
+        self.program_cache = LRUCache(cache_size) # 源代码或文件哈希 -> 程序字节码
+        self.result_cache = LRUCache(cache_size) # (程序哈希, 请求参数) -> 运行/分析响应
+
+    def _digest(self, data: bytes) -> str:
+        return self.hashlib.sha1(data).hexdigest()
+
+    def _assemble(self, source: str, no_warn: bool, relocatable: bool) -> dict[str, Any]:
+        key = (self._digest(source.encode("utf-8")), no_warn, relocatable)
+        response = self.assemble_cache.get(key)
+        if response is not None:
+            return response
+        result = self.cp.assemble(source, no_warn=no_warn, relocatable=relocatable)
+        response = {
+            "ok": True,
+            "has_error": result.has_error,
+            "binary": self.base64.b64encode(result.binary).decode(),
+            "listing": [[inst.hex(), literal] for inst, literal in result.bin_code],
+            "flag_table": result.flag_table,
+            "lines": result.lines,
+            "relocations": [list(r) for r in result.relocations],
+            "diagnostics": [d._asdict() for d in result.diagnostics],
+        }
+        self.assemble_cache.put(key, response)
+        return response
+
+    def _program(self, request: dict[str, Any]) -> tuple[str, bytes]:
+        """从请求中取得程序。返回 程序哈希, 字节码。"""
+        if "source" in request:
+            source: str = request["source"]
+            key = "src:" + self._digest(source.encode("utf-8"))
+            program = self.program_cache.get(key)
+            if program is None:
+                result = self.cp.assemble(source, no_warn=True)
+                if result.has_error:
+                    first = next(d for d in result.diagnostics if d.severity == self.cp.SEVERITY_ERROR)
+                    raise ValueError(f"编译失败，第{first.line}行: {first.message}")
+                program = result.binary
+                self.program_cache.put(key, program)
+        elif "binary" in request:
+            data = self.base64.b64decode(request["binary"])
+            key = "bin:" + self._digest(data)
+            program = self.program_cache.get(key)
+            if program is None:
+                if self.dzo.is_object_data(data):
+                    program = self.dzo.ObjectFile(data).rom
+                else:
+                    program = data
+                self.program_cache.put(key, program)
+        else:
+            raise ValueError("请求中缺少source或binary")
+        return key, program
+
+    def _runner(self, program: bytes):
+        ctx = self.vm.Ctx_t()
+        ctx.load_program(program)
+        return self.vm.InstructionRunner(ctx)
+
+    @staticmethod
+    def _limit(request: dict[str, Any], name: str, default: Optional[int]) -> Optional[int]:
+        """取得步数或次数限制。缺省或为null时返回default。"""
+        value = request.get(name)
+        if value is None:
+            return default
+        if isinstance(value, bool) or not isinstance(value, int) or not 1 <= value <= MAX_STEPS:
+            raise ValueError(f"{name} 必须为1到{MAX_STEPS}之间的整数")
+        return value
+
+    def op_ping(self, request: dict[str, Any]) -> dict[str, Any]:
+        return {"ok": True, "version": __version__, "pid": os.getpid()}
+
+    def op_assemble(self, request: dict[str, Any]) -> dict[str, Any]:
+        return self._assemble(request["source"], bool(request.get("no_warn", False)), bool(request.get("relocatable", False)))
+
+    def op_run(self, request: dict[str, Any]) -> dict[str, Any]:
+        key, program = self._program(request)
+        max_events = self._limit(request, "max_events", None)
+        max_steps = self._limit(request, "max_steps", 1_000_000)
+        cache_key = (key, "run", max_events, max_steps)
+        response = self.result_cache.get(cache_key)
+        if response is not None:
+            return response
+        runner = self._runner(program)
+        events = [event._asdict() for event in runner.iter_pauses(max_events=max_events, max_steps=max_steps)]
+        response = {"ok": True, "events": events, "steps": runner.steps, "registers": runner.ctx.Registers}
+        self.result_cache.put(cache_key, response)
+        return response
+
+    def op_profile(self, request: dict[str, Any]) -> dict[str, Any]:
+        key, program = self._program(request)
+        max_steps = self._limit(request, "max_steps", 100_000)
+        cache_key = (key, "profile", max_steps)
+        response = self.result_cache.get(cache_key)
+        if response is not None:
+            return response
+        runner = self._runner(program)
+        counts = runner.run_profile(max_steps)
+        response = {"ok": True, "steps": runner.steps, "counts": {addr: n for addr, n in enumerate(counts) if n}}
+        self.result_cache.put(cache_key, response)
+        return response
+
+    def op_stats(self, request: dict[str, Any]) -> dict[str, Any]:
+        return {"ok": True, "caches": {
+            name: {"size": len(cache.data), "hits": cache.hits, "misses": cache.misses}
+            for name, cache in (("assemble", self.assemble_cache), ("program", self.program_cache), ("result", self.result_cache))
+        }}
+
+    def handle(self, request: dict[str, Any]) -> dict[str, Any]:
+        op = request.get("op")
+        func = getattr(self, f"op_{op}", None) if isinstance(op, str) else None
+        if func is None:
+            return {"ok": False, "error": f"未知的请求: {op}"}
+        try:
+            return func(request)
+        except Exception as e:
+            return {"ok": False, "error": f"{type(e).__name__}: {e}"}
+
+def serve(path: str, cache_size: int = 256):
+    """启动常驻服务，直到收到shutdown请求或被中断。"""
+    import socketserver
+    import threading
+    service = ToolchainService(cache_size)
+
+    class Handler(socketserver.BaseRequestHandler):
+        def handle(self):
+            sock: socket.socket = self.request
+            while True:
+                try:
+                    request = recv_message(sock)
+                except (ProtocolException, ValueError, OSError) as e:
+                    try:
+                        send_message(sock, {"ok": False, "error": str(e)})
+                    except OSError:
+                        pass
+                    return
+                if request is None:
+                    return
+                if request.get("op") == "shutdown":
+                    send_message(sock, {"ok": True})
+                    threading.Thread(target=server.shutdown, daemon=True).start()
+                    return
+                send_message(sock, service.handle(request))
+
+    class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+    if os.path.exists(path):
+        # 清理上次残留的套接字文件，但不抢占正在运行的服务
+        try:
+            Client(path).close()
+            print(f"服务已在运行: {path}")
+            return 1
+        except OSError:
+            os.unlink(path)
+    server = Server(path, Handler)
+    os.chmod(path, 0o600)
+    print(f"服务已启动: {path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(path):
+            os.unlink(path)
+    print("服务已停止。")
+    return 0
+
+# ---------------- 客户端命令行 ----------------
+
+def _file_request(path: str) -> dict[str, Any]:
+    """根据文件类型构造程序参数：汇编源文件发送源代码，其余发送字节码。"""
+    with open(path, "rb") as f:
+        data = f.read()
+    if path.lower().endswith(".asm"):
+        return {"source": data.decode("utf-8")}
+    if path.lower().endswith(".json"):
+        return {"binary": json.loads(data.decode("utf-8"))["bin"]}
+    import base64
+    return {"binary": base64.b64encode(data).decode()}
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="DZC-8M Toolchain Daemon")
+    parser.add_argument("-s", "--socket", default=None, help="Unix域套接字路径。默认为运行时目录下的dzcd-<uid>.sock")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("serve", help="启动常驻服务")
+    p.add_argument("--cache-size", type=int, default=256, help="每个缓存保存的条目数")
+    sub.add_parser("ping", help="检查服务是否在运行")
+    sub.add_parser("stats", help="显示缓存统计")
+    sub.add_parser("stop", help="停止服务")
+    p = sub.add_parser("assemble", help="编译汇编代码文件")
+    p.add_argument("file")
+    p.add_argument("-o", "--output", default=None, help="将字节码输出到文件")
+    p.add_argument("--no-warn", action="store_true", help="不显示警告")
+    p = sub.add_parser("run", help="无界面运行程序，输出每次PAUSE时的寄存器")
+    p.add_argument("file", help="汇编代码、二进制、dzo或json文件")
+    p.add_argument("-n", "--max-events", type=int, default=None, help="最多输出的PAUSE次数")
+    p.add_argument("--max-steps", type=int, default=1_000_000, help="最多执行的步数")
+    p = sub.add_parser("profile", help="统计各地址的执行次数")
+    p.add_argument("file", help="汇编代码、二进制、dzo或json文件")
+    p.add_argument("--max-steps", type=int, default=100_000, help="执行的步数")
+    args = parser.parse_args()
+    path = args.socket or default_socket_path()
+
+    if not hasattr(socket, "AF_UNIX"):
+        print("当前平台不支持Unix域套接字。")
+        return 1
+    if args.command == "serve":
+        return serve(path, args.cache_size)
+    try:
+        client = Client(path)
+    except OSError:
+        print(f"无法连接到服务: {path}。请先运行 python dzcd.py serve")
+        return 1
+    with client:
+        if args.command == "assemble":
+            with open(args.file, "r", encoding="utf-8") as f:
+                response = client.request("assemble", source=f.read(), no_warn=args.no_warn)
+        elif args.command == "run":
+            response = client.request("run", **_file_request(args.file), max_events=args.max_events, max_steps=args.max_steps)
+        elif args.command == "profile":
+            response = client.request("profile", **_file_request(args.file), max_steps=args.max_steps)
+        elif args.command == "stop":
+            response = client.request("shutdown")
+        else:
+            response = client.request(args.command)
+    if not response.get("ok"):
+        print(f"错误: {response.get('error')}")
+        return 1
+    if args.command == "assemble":
+        for d in response["diagnostics"]:
+            title = "警告" if d["severity"] == "warning" else "错误"
+            print(f"{args.file}:{d['line']}:{d['column']}: {title}: {d['message']}")
+        if response["has_error"]:
+            print("编译失败，存在错误。")
+            return 1
+        if args.output:
+            import base64
+            with open(args.output, "wb") as f:
+                f.write(base64.b64decode(response["binary"]))
+            print(f"二进制字节码已输出到 {args.output}")
+        else:
+            for inst, literal in response["listing"]:
+                print(f"{inst:<8} {literal}")
+    elif args.command == "run":
+        names = ("PC", "AF", "SP", "IO", "R0", "R1", "R2", "R3")
+        for event in response["events"]:
+            regs = " ".join(f"{name}={value}" for name, value in zip(names, event["registers"]))
+            print(f"{event['steps']:>10} @{event['addr']:>3}: {regs}")
+        print(f"共执行 {response['steps']} 步")
+    elif args.command == "profile":
+        for addr, n in sorted(response["counts"].items(), key=lambda item: -item[1]):
+            print(f"{int(addr):>4}: {n}")
+        print(f"共执行 {response['steps']} 步")
+    elif args.command == "stats":
+        for name, stat in response["caches"].items():
+            print(f"{name}: {stat['size']} 条, 命中 {stat['hits']}, 未命中 {stat['misses']}")
+    else:
+        print(json.dumps(response, ensure_ascii=False))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
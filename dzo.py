@@ -0,0 +1,278 @@
+"""
+DZO: DZC-8M 二进制目标文件格式。
+
+所有整数均为小端序。
+
+文件头(12字节):
+    [0:4]   魔数 b"DZO\\x00"
+    [4:6]   版本 u16
+    [6:8]   段数量 u16
+    [8:12]  保留 u32，为0
+
+段表(每项16字节，紧随文件头):
+    [0:4]   段标签，4字节ASCII
+    [4:8]   段标志 u32
+    [8:12]  段数据偏移 u32，相对文件开头
+    [12:16] 段数据大小 u32
+
+段:
+    ROM : 字节码原始数据
+    SYMS: 符号表。u16数量，每项为 u16地址, u8名称长度, 名称(UTF-8)
+    LINE: 地址到源代码行号(从0开始)的映射。varint字节总数, varint段数,
+          每段为 varint字节数, zigzag varint相对上一段的行号差
+    SRC : 源代码(UTF-8)。段标志 SECTION_FLAG_ZLIB 表示使用zlib压缩
+    RELO: 重定位表，仅存在于可重定位目标中。u16数量，每项为 u16字节偏移, u8重定位类型,
+          u16源代码行号, u8名称长度, 标记名(UTF-8)。可重定位目标中SYMS只包含对外导出的标记(.global)，
+          RELO中引用但SYMS与LOCL中均不存在的标记即为导入的标记
+    LOCL: 本地符号表，仅存在于可重定位目标中，格式同SYMS。未导出的标记，链接时只在本模块内可见。
+          没有此段的旧版目标文件中，所有标记均对外导出
+
+读取时按段表定位，只解码需要的段，可直接在mmap上读取。
+"""
+import mmap
+import struct
+import zlib
+from typing import Optional
+
+MAGIC = b"DZO\x00"
+VERSION = 1
+
+SECTION_ROM = "ROM "
+SECTION_SYMS = "SYMS"
+SECTION_LINE = "LINE"
+SECTION_SRC = "SRC "
+SECTION_RELO = "RELO"
+SECTION_LOCL = "LOCL"
+
+SECTION_FLAG_ZLIB = 0b1
+
+header_struct = struct.Struct("<4sHHI")
+section_struct = struct.Struct("<4sIII")
+symbol_struct = struct.Struct("<HB")
+relocation_struct = struct.Struct("<HBHB")
+
+class DZOFormatException(Exception):
+    pass
+
+def pack_varint(value: int) -> bytes:
+    """将非负整数编码为LEB128 varint。"""
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+def unpack_varint(data, pos: int) -> tuple[int, int]:
+    """
+    :return: 解码的值, 下一个位置
+    :rtype: tuple[int, int]
+    """
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+
+def zigzag(value: int) -> int:
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+def unzigzag(value: int) -> int:
+    return value >> 1 if not value & 1 else -(value >> 1) - 1
+
+def pack_symbols(symbols: dict[str, int]) -> bytes:
+    out = bytearray(struct.pack("<H", len(symbols)))
+    for name, addr in symbols.items():
+        name_bytes = name.encode("utf-8")
+        out += symbol_struct.pack(addr, len(name_bytes)) + name_bytes
+    return bytes(out)
+
+def unpack_symbols(data) -> dict[str, int]:
+    count, = struct.unpack_from("<H", data, 0)
+    pos = 2
+    symbols: dict[str, int] = {}
+    for _ in range(count):
+        addr, name_len = symbol_struct.unpack_from(data, pos)
+        pos += symbol_struct.size
+        symbols[bytes(data[pos:pos + name_len]).decode("utf-8")] = addr
+        pos += name_len
+    return symbols
+
+def pack_relocations(relocations: list[tuple[int, int, str, int]]) -> bytes:
+    """
+    :param relocations: (字节偏移, 重定位类型, 标记名, 源代码行号)列表，与cp.Relocation兼容
+    """
+    out = bytearray(struct.pack("<H", len(relocations)))
+    for offset, kind, name, line in relocations:
+        name_bytes = name.encode("utf-8")
+        out += relocation_struct.pack(offset, kind, line, len(name_bytes)) + name_bytes
+    return bytes(out)
+
+def unpack_relocations(data) -> list[tuple[int, int, str, int]]:
+    count, = struct.unpack_from("<H", data, 0)
+    pos = 2
+    relocations: list[tuple[int, int, str, int]] = []
+    for _ in range(count):
+        offset, kind, line, name_len = relocation_struct.unpack_from(data, pos)
+        pos += relocation_struct.size
+        relocations.append((offset, kind, bytes(data[pos:pos + name_len]).decode("utf-8"), line))
+        pos += name_len
+    return relocations
+
+def pack_lines(lines: list[int]) -> bytes:
+    """将每字节的行号列表按连续相同行号分段，差分编码。"""
+    runs: list[tuple[int, int]] = []
+    for line in lines:
+        if runs and runs[-1][1] == line:
+            runs[-1] = (runs[-1][0] + 1, line)
+        else:
+            runs.append((1, line))
+    out = bytearray(pack_varint(len(lines)) + pack_varint(len(runs)))
+    last_line = 0
+    for count, line in runs:
+        out += pack_varint(count) + pack_varint(zigzag(line - last_line))
+        last_line = line
+    return bytes(out)
+
+def unpack_lines(data) -> list[int]:
+    total, pos = unpack_varint(data, 0)
+    run_count, pos = unpack_varint(data, pos)
+    lines: list[int] = []
+    line = 0
+    for _ in range(run_count):
+        count, pos = unpack_varint(data, pos)
+        delta, pos = unpack_varint(data, pos)
+        line += unzigzag(delta)
+        lines.extend([line] * count)
+    if len(lines) != total:
+        raise DZOFormatException(f"行号表长度不匹配，期望{total}，实际{len(lines)}")
+    return lines
+
+def write_object(sections: list[tuple[str, int, bytes]]) -> bytes:
+    """
+    将段列表打包为DZO文件数据。
+
+    :param sections: (段标签, 段标志, 段数据)列表
+    :type sections: list[tuple[str, int, bytes]]
+    """
+    offset = header_struct.size + section_struct.size * len(sections)
+    table = bytearray()
+    body = bytearray()
+    for tag, flags, data in sections:
+        tag_bytes = tag.encode("ascii")
+        if len(tag_bytes) != 4:
+            raise DZOFormatException(f"段标签长度必须为4: {tag!r}")
+        table += section_struct.pack(tag_bytes, flags, offset + len(body), len(data))
+        body += data
+    return header_struct.pack(MAGIC, VERSION, len(sections), 0) + bytes(table) + bytes(body)
+
+def build_debug_object(rom: bytes, symbols: Optional[dict[str, int]] = None, lines: Optional[list[int]] = None,
+                       source: Optional[str] = None, compress_source: bool = True) -> list[tuple[str, int, bytes]]:
+    """构造包含字节码、符号、行号与源代码的段列表。"""
+    sections = [(SECTION_ROM, 0, bytes(rom))]
+    if symbols is not None:
+        sections.append((SECTION_SYMS, 0, pack_symbols(symbols)))
+    if lines is not None:
+        sections.append((SECTION_LINE, 0, pack_lines(lines)))
+    if source is not None:
+        src_bytes = source.encode("utf-8")
+        if compress_source:
+            sections.append((SECTION_SRC, SECTION_FLAG_ZLIB, zlib.compress(src_bytes, 9)))
+        else:
+            sections.append((SECTION_SRC, 0, src_bytes))
+    return sections
+
+def is_object_data(data: bytes) -> bool:
+    return data[:len(MAGIC)] == MAGIC
+
+def is_object_file(path: str) -> bool:
+    with open(path, "rb") as f:
+        return is_object_data(f.read(len(MAGIC)))
+
+class ObjectFile:
+    """DZO文件读取器。只解析段表，各段在访问时才解码。"""
+    def __init__(self, data):
+        self._mmap: Optional[mmap.mmap] = None
+        self.data = memoryview(data)
+        if len(self.data) < header_struct.size:
+            raise DZOFormatException("文件过短，不是有效的DZO文件")
+        magic, self.version, count, _ = header_struct.unpack_from(self.data, 0)
+        if magic != MAGIC:
+            raise DZOFormatException("魔数不匹配，不是有效的DZO文件")
+        if self.version > VERSION:
+            raise DZOFormatException(f"不支持的DZO版本: {self.version}")
+        self.sections: dict[str, tuple[int, memoryview]] = {}
+        for i in range(count):
+            tag, flags, offset, size = section_struct.unpack_from(self.data, header_struct.size + i * section_struct.size)
+            if offset + size > len(self.data):
+                raise DZOFormatException(f"段 {tag!r} 超出文件范围")
+            self.sections[tag.decode("ascii")] = (flags, self.data[offset:offset + size])
+
+    @classmethod
+    def open(cls, path: str) -> "ObjectFile":
+        """以内存映射方式打开DZO文件。"""
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        obj = cls(mapped)
+        obj._mmap = mapped
+        return obj
+
+    def close(self):
+        self.sections.clear()
+        self.data.release()
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc):
+        self.close()
+
+    def has_section(self, tag: str) -> bool:
+        return tag in self.sections
+
+    def get_section(self, tag: str) -> Optional[memoryview]:
+        section = self.sections.get(tag)
+        return None if section is None else section[1]
+
+    @property
+    def rom(self) -> bytes:
+        data = self.get_section(SECTION_ROM)
+        return b"" if data is None else bytes(data)
+
+    def symbols(self) -> dict[str, int]:
+        data = self.get_section(SECTION_SYMS)
+        return {} if data is None else unpack_symbols(data)
+
+    def local_symbols(self) -> dict[str, int]:
+        data = self.get_section(SECTION_LOCL)
+        return {} if data is None else unpack_symbols(data)
+
+    def lines(self) -> list[int]:
+        data = self.get_section(SECTION_LINE)
+        return [] if data is None else unpack_lines(data)
+
+    @property
+    def is_relocatable(self) -> bool:
+        return SECTION_RELO in self.sections
+
+    def relocations(self) -> list[tuple[int, int, str, int]]:
+        data = self.get_section(SECTION_RELO)
+        return [] if data is None else unpack_relocations(data)
+
+    def source(self) -> Optional[str]:
+        section = self.sections.get(SECTION_SRC)
+        if section is None:
+            return None
+        flags, data = section
+        if flags & SECTION_FLAG_ZLIB:
+            return zlib.decompress(data).decode("utf-8")
+        return bytes(data).decode("utf-8")
@@ -0,0 +1,16 @@
+/*
+多文件链接示例：调用 mul_lib.asm 中的乘法子程序
+链接：python link.py example/linkdemo.asm example/mul_lib.asm -D
+R0, R1: 乘数
+R2: 结果
+SP: 返回地址
+*/
+
+MOVZ R0, 6, 0
+MOVZ R1, 7, 0
+MOVLZ SP, ret, 0 // 保存返回地址
+MOVLZ PC, mul, 0 // 调用 mul
+ret:
+    PAUSE
+end:
+    MOVLZ PC, end, 0
@@ -0,0 +1,25 @@
+// 从2开始输出所有质数，与prime.c相同的试除法。用法: python minic.py example/minic_prime.c -o
+// R0: 质数输出。当输出有效时，暂停。
+// R1: 与R0相除的值
+#include <stdint.h>
+
+uint8_t R0;
+uint8_t R1;
+uint8_t rem; // R0除以R1的余数
+
+int main() {
+    R0 = 2;
+    while (1) {
+        R1 = 2;
+        while (R1 != R0) {
+            rem = R0;
+            // 循环结束时 1 <= rem <= R1，rem == R1 即整除
+            while (rem > R1) rem -= R1;
+            if (rem == R1) goto next;
+            R1++;
+        }
+        pause();
+    next:
+        R0++;
+    }
+}
@@ -0,0 +1,32 @@
+// 使用二分法求一个数的整数平方根，与sqrt.c相同的算法。用法: python minic.py example/minic_sqrt.c -o
+// R0: 输入的数 num
+// R1: 结果。二分结束时 high 即为 num 的整数平方根
+// IO: mid * mid，与sqrt.asm相同，借用IO寄存器
+#include <stdint.h>
+
+uint8_t R0 = 200;
+uint8_t R1; // high
+uint8_t IO;
+uint8_t low, mid, k;
+
+int main() {
+    R1 = R0;
+    if (R1 > 15) R1 = 15; // 15 * 15 = 225，避免mid * mid溢出
+    low = 1;
+    while (low <= R1) {
+        mid = (low + R1) >> 1;
+        // IO = mid * mid
+        IO = 0;
+        k = mid;
+        do {
+            IO += mid;
+            k--;
+        } while (k);
+        if (IO <= R0) {
+            low = mid + 1;
+        } else {
+            R1 = mid - 1;
+        }
+    }
+    pause();
+}
@@ -0,0 +1,21 @@
+/*
+移位乘法子程序库
+输入: R0, R1
+输出: R2 = R0 * R1
+破坏: R0, R1, R3
+返回地址保存在 SP 中
+只导出 mul，mul_loop 等标记只在本文件内可见
+*/
+
+.global mul
+mul:
+    MOVZ R2, 0, 0
+mul_loop:
+    AND R3, R1, 1 // 取最低位
+    MOVLZ PC, mul_skip_add, R3
+    ADD R2, R2, R0
+mul_skip_add:
+    SHR R1, R1, 1
+    SHL R0, R0, 1
+    MOVLN PC, mul_loop, R1
+    MOVZ PC, SP, 0 // 返回
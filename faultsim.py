@@ -0,0 +1,331 @@
+"""
+蒙特卡洛故障注入。按故障模型随机破坏寄存器写入、AF更新或PC自增，
+模拟游戏内事件丢失造成的错误，统计PAUSE输出保持正确的概率以及各条指令的敏感程度。
+
+每次试验使用由种子与试验序号确定的随机数生成器，结果与进程调度无关，可以复现。
+"""
+import os, sys, time
+import random
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple, Optional
+
+import argparse
+
+import isa
+import vm
+import gatesim
+
+__version__ = "0.1.0"
+
+FAULT_REG = "reg" # 目标寄存器写入出错
+FAULT_AF = "af" # AF符号位更新出错
+FAULT_PC = "pc" # PC自增出错
+FAULT_KINDS = (FAULT_REG, FAULT_AF, FAULT_PC)
+
+MODE_DROP = "drop" # 写入丢失，保持原值
+MODE_FLIP = "flip" # 写入的值随机翻转一位
+
+_HEAD_SPECS = tuple(isa.DECODE_TABLE[head << 3] for head in range(32))
+# 设置AF符号位的指令头: ADD/SUB/ADDC/SUBB/INC/DEC/CMP
+AF_HEADS = frozenset(head for head, spec in enumerate(_HEAD_SPECS) if spec.flags)
+# 不写目标寄存器的指令头: PAUSE/NOP/CMP
+NO_WRITE_HEADS = frozenset(head for head, spec in enumerate(_HEAD_SPECS) if not spec.writes_dest)
+CMP_HEADS = frozenset(head for head, spec in enumerate(_HEAD_SPECS) if spec.name == "CMP")
+
+class FaultModel(NamedTuple):
+    """每执行一步时各类故障发生的概率。"""
+    reg_rate: float = 0.001
+    af_rate: float = 0.001
+    pc_rate: float = 0.001
+    mode: str = MODE_DROP
+
+    def rate(self, kind: str) -> float:
+        return {FAULT_REG: self.reg_rate, FAULT_AF: self.af_rate, FAULT_PC: self.pc_rate}[kind]
+
+class Fault(NamedTuple):
+    """一次注入的故障。"""
+    step: int # 发生故障的步序号，从0开始
+    addr: int # 指令地址
+    kind: str
+
+def writes_register(head: int, d1: int, d2: int, registers: list[int]) -> bool:
+    """指令是否写入目标寄存器。条件赋值根据执行前的寄存器判断条件。"""
+    if head in NO_WRITE_HEADS:
+        return False
+    def value(v: int) -> int:
+        return registers[v & 0b111] if v & 0b1000 else v
+    if head == 0b00100: # MOVZ
+        return value(d1 & 0b1111) == 0
+    if head == 0b00110: # MOVN
+        return value(d1 & 0b1111) != 0
+    if head == 0b00101: # MOVLZ
+        return value(d2 >> 4) == 0
+    if head == 0b00111: # MOVLN
+        return value(d2 >> 4) != 0
+    return True
+
+class FaultyRunner(vm.InstructionRunner):
+    """
+    注入故障的指令执行器。
+
+    single为(步序号, 故障类型)时只注入一次该类型的故障，发生在该步或之后第一条适用的指令上；
+    否则按model的概率在每一步独立注入。不适用的故障(如对不设置AF的指令注入AF故障)不会发生。
+    """
+    def __init__(self, ctx: vm.Ctx_t, model: FaultModel, rng: random.Random, single: Optional[tuple[int, str]] = None):
+        super().__init__(ctx)
+        self.model = model
+        self.rng = rng
+        self.single = single
+        self.faults: list[Fault] = []
+
+    def _want(self, kind: str) -> bool:
+        if self.single is not None:
+            return not self.faults and kind == self.single[1] and self.steps - 1 >= self.single[0]
+        rate = self.model.rate(kind)
+        return rate > 0 and self.rng.random() < rate
+
+    def _corrupt(self, old: int, new: int, bits: int) -> int:
+        if self.model.mode == MODE_DROP:
+            return old
+        return new ^ (1 << self.rng.randrange(bits))
+
+    def run_step(self):
+        registers = self.ctx.Registers
+        before = list(registers)
+        super().run_step()
+        head = self.program_d0 >> 3
+        dest = self.program_d0 & 0b111
+        step = self.steps - 1
+        written = writes_register(head, self.program_d1, self.program_d2, before)
+        pc_written = written and dest == vm.PC
+        # PC自增：跳转指令的写入覆盖自增结果，不受影响
+        if not pc_written and self._want(FAULT_PC):
+            registers[vm.PC] = self._corrupt(before[vm.PC], registers[vm.PC], 8)
+            self.faults.append(Fault(step, self.cur_addr, FAULT_PC))
+        if head in AF_HEADS and dest != vm.AF and self._want(FAULT_AF):
+            flags = self._corrupt(before[vm.AF] & 0b111, registers[vm.AF] & 0b111, 3)
+            registers[vm.AF] = (registers[vm.AF] & 0b11111000) | flags
+            self.faults.append(Fault(step, self.cur_addr, FAULT_AF))
+        if written and self._want(FAULT_REG):
+            registers[dest] = self._corrupt(before[dest], registers[dest], 8)
+            self.faults.append(Fault(step, self.cur_addr, FAULT_REG))
+
+class Golden(NamedTuple):
+    """无故障运行的参考结果。"""
+    outputs: list[tuple[int, ...]] # 每次PAUSE时比较的寄存器值
+    steps: int # 产生全部输出所用的步数
+
+def pause_outputs(runner: vm.InstructionRunner, events: int, max_steps: int, compare: tuple[int, ...]) -> list[tuple[int, ...]]:
+    outputs = []
+    for event in runner.iter_pauses(max_events=events, max_steps=max_steps):
+        outputs.append(tuple(event.registers[reg] for reg in compare))
+    return outputs
+
+def golden_run(program: bytes, events: int, max_steps: int, compare: tuple[int, ...]) -> Golden:
+    ctx = vm.Ctx_t()
+    ctx.load_program(program)
+    runner = vm.InstructionRunner(ctx)
+    outputs = pause_outputs(runner, events, max_steps, compare)
+    return Golden(outputs, runner.steps)
+
+class TrialBatch:
+    """一批试验的统计，可合并。"""
+    def __init__(self):
+        self.trials = 0
+        self.correct = 0
+        self.wrong = 0 # 输出错误
+        self.hang = 0 # 在步数限制内没有产生足够的输出
+        self.clean = 0 # 没有注入任何故障的试验
+        self.injected: dict[tuple[int, str], int] = {} # (地址, 故障类型) -> 注入次数
+        self.failed: dict[tuple[int, str], int] = {} # (地址, 故障类型) -> 所在试验失败的注入次数
+        self.failed_seeds: list[int] = [] # 失败试验的序号，便于复现
+
+    def merge(self, other: "TrialBatch"):
+        self.trials += other.trials
+        self.correct += other.correct
+        self.wrong += other.wrong
+        self.hang += other.hang
+        self.clean += other.clean
+        for key, count in other.injected.items():
+            self.injected[key] = self.injected.get(key, 0) + count
+        for key, count in other.failed.items():
+            self.failed[key] = self.failed.get(key, 0) + count
+        self.failed_seeds.extend(other.failed_seeds)
+
+class TrialConfig(NamedTuple):
+    program: bytes
+    golden: Golden
+    model: FaultModel
+    compare: tuple[int, ...]
+    seed: int
+    single: bool # 每次试验只注入一个故障
+    kinds: tuple[str, ...] # single模式下可选的故障类型
+    step_slack: float = 2.0 # 步数限制为参考步数的倍数
+
+def run_trial(config: TrialConfig, index: int) -> tuple[str, list[Fault]]:
+    """
+    执行一次试验。
+
+    :return: 结果("correct"/"wrong"/"hang"), 注入的故障
+    :rtype: tuple[str, list[Fault]]
+    """
+    rng = random.Random((config.seed << 32) | index)
+    single = None
+    if config.single:
+        single = (rng.randrange(max(1, config.golden.steps)), rng.choice(config.kinds))
+    ctx = vm.Ctx_t()
+    ctx.load_program(config.program)
+    runner = FaultyRunner(ctx, config.model, rng, single)
+    expected = config.golden.outputs
+    max_steps = int(config.golden.steps * config.step_slack) + 100
+    outputs = pause_outputs(runner, len(expected), max_steps, config.compare)
+    if outputs == expected:
+        return "correct", runner.faults
+    if len(outputs) < len(expected) and outputs == expected[:len(outputs)]:
+        return "hang", runner.faults
+    return "wrong", runner.faults
+
+def run_trials(config: TrialConfig, start: int, count: int) -> TrialBatch:
+    batch = TrialBatch()
+    for index in range(start, start + count):
+        status, faults = run_trial(config, index)
+        batch.trials += 1
+        if not faults:
+            batch.clean += 1
+        if status == "correct":
+            batch.correct += 1
+        elif status == "wrong":
+            batch.wrong += 1
+        else:
+            batch.hang += 1
+        for fault in faults:
+            key = (fault.addr, fault.kind)
+            batch.injected[key] = batch.injected.get(key, 0) + 1
+            if status != "correct":
+                batch.failed[key] = batch.failed.get(key, 0) + 1
+        if status != "correct":
+            batch.failed_seeds.append(index)
+    return batch
+
+def _trials_task(task: tuple[TrialConfig, int, int]) -> TrialBatch:
+    return run_trials(*task)
+
+def run_campaign(config: TrialConfig, trials: int, jobs: Optional[int] = None) -> TrialBatch:
+    """使用进程池执行trials次试验。"""
+    workers = jobs or os.cpu_count() or 1
+    chunk = max(1, min(500, trials // (workers * 4) or 1))
+    tasks = [(config, start, min(chunk, trials - start)) for start in range(0, trials, chunk)]
+    result = TrialBatch()
+    if workers == 1 or len(tasks) <= 1:
+        parts = [_trials_task(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            parts = list(executor.map(_trials_task, tasks))
+    for part in parts:
+        result.merge(part)
+    result.failed_seeds.sort()
+    return result
+
+def out_report(result: TrialBatch, program: bytes, lines: list[int], src_lines: list[str], top: int) -> str:
+    n = result.trials
+    p = result.correct / n if n else 0.0
+    margin = 1.96 * (p * (1 - p) / n) ** 0.5 if n else 0.0
+    string = f"试验次数: {n}，其中 {result.clean} 次未注入故障\n"
+    string += f"输出正确: {result.correct} ({p:.2%} ± {margin:.2%})\n"
+    string += f"输出错误: {result.wrong}，未产生全部输出: {result.hang}\n"
+    if not result.injected:
+        return string
+    # 按地址汇总：每次注入导致试验失败的比例
+    by_addr: dict[int, dict[str, tuple[int, int]]] = {}
+    for (addr, kind), count in result.injected.items():
+        by_addr.setdefault(addr, {})[kind] = (count, result.failed.get((addr, kind), 0))
+    def total(addr: int) -> tuple[int, int]:
+        injected = sum(item[0] for item in by_addr[addr].values())
+        failed = sum(item[1] for item in by_addr[addr].values())
+        return injected, failed
+    ranked = sorted(by_addr, key=lambda addr: (-total(addr)[1], -total(addr)[1] / total(addr)[0]))[:top]
+    string += """
+  Addr  Injected  Failed   Rate   reg    af     pc
+┌──────┬─────────┬───────┬──────┬──────┬──────┬──────
+"""
+    hint = False
+    for addr in ranked:
+        injected, failed = total(addr)
+        rates = []
+        for kind in FAULT_KINDS:
+            count, kind_failed = by_addr[addr].get(kind, (0, 0))
+            rates.append(f"{kind_failed / count:>5.0%}" if count else "    -")
+        where = ""
+        if addr < len(lines) and lines[addr] < len(src_lines):
+            where = f"{lines[addr] + 1:>4}| {src_lines[lines[addr]].strip()}"
+        mark = " "
+        if program[addr % len(program)] >> 3 in CMP_HEADS and failed:
+            mark = "*"
+            hint = True
+        string += f"│ {addr:>4} │{injected:>8} │{failed:>6} │{failed / injected:>5.0%} │{rates[0]} │{rates[1]} │{rates[2]} {mark}{where}\n"
+    string += """\
+└──────┴─────────┴───────┴──────┴──────┴──────┴──────
+"""
+    if hint:
+        string += "* 敏感的CMP指令：比较相等/不等关系时，若有额外的缓冲寄存器，建议改用SUB或XOR(出错率更小)。\n"
+    if result.failed_seeds:
+        shown = ", ".join(str(i) for i in result.failed_seeds[:10])
+        string += f"失败试验序号(可用 --only 复现): {shown}{' ...' if len(result.failed_seeds) > 10 else ''}\n"
+    return string
+
+def main():
+    parser = argparse.ArgumentParser(description="DZC-8M Fault Injection")
+    parser.add_argument("file", help="汇编源文件(.asm)、DZO文件或二进制文件")
+    parser.add_argument("-t", "--trials", type=int, default=1000, help="试验次数。默认1000")
+    parser.add_argument("-s", "--seed", type=int, default=0, help="随机种子。默认0")
+    parser.add_argument("-e", "--events", type=int, default=1, help="比较前几次PAUSE的输出。默认1")
+    parser.add_argument("-n", "--max-steps", type=int, default=100000, help="参考运行的最大步数。默认100000")
+    parser.add_argument("-c", "--compare", default="SP,IO,R0,R1,R2,R3", help="PAUSE时比较的寄存器，逗号分隔。默认SP,IO,R0,R1,R2,R3")
+    parser.add_argument("--reg-rate", type=float, default=0.001, help="每步寄存器写入出错的概率。默认0.001")
+    parser.add_argument("--af-rate", type=float, default=0.001, help="每步AF更新出错的概率。默认0.001")
+    parser.add_argument("--pc-rate", type=float, default=0.001, help="每步PC自增出错的概率。默认0.001")
+    parser.add_argument("--mode", choices=(MODE_DROP, MODE_FLIP), default=MODE_DROP, help="故障模式。drop为写入丢失，flip为随机翻转一位。默认drop")
+    parser.add_argument("--single", action="store_true", help="每次试验只在随机的一步注入一个故障，故障类型在概率大于0的类型中随机选择")
+    parser.add_argument("--only", type=int, default=None, help="只执行指定序号的试验，并显示注入的故障")
+    parser.add_argument("--top", type=int, default=15, help="显示最敏感的指令数量。默认15")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="并行进程数。默认为CPU核心数")
+    parser.add_argument("--version", action="version", version=f"Eggy Fault Injection\n{__version__}\nfor DZC-8M Plus Instruction Set")
+    args = parser.parse_args()
+
+    names = {name: reg for reg, name in vm.reg_name_map.items()}
+    try:
+        compare = tuple(names[name.strip().upper()] for name in args.compare.split(","))
+    except KeyError as e:
+        parser.error(f"未知的寄存器: {e.args[0]}")
+    model = FaultModel(args.reg_rate, args.af_rate, args.pc_rate, args.mode)
+    kinds = tuple(kind for kind in FAULT_KINDS if model.rate(kind) > 0)
+    if not kinds:
+        parser.error("至少需要一种概率大于0的故障类型")
+
+    try:
+        program, lines, src_lines = gatesim.load_program(args.file)
+    except (OSError, ValueError) as e:
+        print(f"错误: {e}")
+        return 1
+    golden = golden_run(program, args.events, args.max_steps, compare)
+    if len(golden.outputs) < args.events:
+        print(f"错误: 参考运行在 {args.max_steps} 步内只产生了 {len(golden.outputs)} 次PAUSE输出")
+        return 1
+    print(f"参考运行: {golden.steps} 步产生 {len(golden.outputs)} 次输出")
+    config = TrialConfig(program, golden, model, compare, args.seed, args.single, kinds)
+
+    if args.only is not None:
+        status, faults = run_trial(config, args.only)
+        for fault in faults:
+            print(f"第{fault.step}步 地址{fault.addr}: {fault.kind}")
+        print(f"结果: {status}")
+        return 0 if status == "correct" else 1
+
+    start = time.perf_counter()
+    result = run_campaign(config, args.trials, args.jobs)
+    print(out_report(result, program, lines, src_lines, args.top), end="")
+    print(f"用时 {time.perf_counter() - start:.2f}s")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,680 @@
+"""
+差分模糊测试：随机生成合法与非法的指令序列，交叉检查编译器、编码与虚拟机。
+
+每个程序依次经过：
+1. 参考编码器：按 指令集说明.txt 独立实现的编码，同时判断程序是否合法；
+2. cp.assemble：合法程序必须编译成功且解码结果与原程序一致、字节码与参考编码一致，
+   非法程序必须报告错误而不能崩溃；
+3. 执行：用参考编码的字节码分别在vm.InstructionRunner与参考模型中逐步执行，比较每一步后的寄存器。
+
+参考模型的约定(指令集说明.txt未明确的部分)：
+- PC与地址均为8位，程序存储区只有0xFF字节，地址0xFF处没有存储单元，读为0；
+- Z标志表示写入的8位结果为0；
+- 8位常量接受[-128, 255]，负数按补码编码，与cp.py的检查一致。
+
+生成时按 (指令, 参数种类) 与执行时的 (指令, 符号位结果) 统计覆盖率，优先生成覆盖次数少的组合。
+发现的差异按签名去重，并通过delta debugging自动缩减为最小复现程序。
+"""
+import os, sys, time
+import random
+import re
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple, Optional
+
+import argparse
+
+import cp
+import vm
+
+__version__ = "0.1.0"
+
+# ---------------- 参考指令集 ----------------
+
+# 指令名 -> (指令头高5位, 参数格式)。参数格式中 R: 寄存器, V: 值(寄存器或3位常量), C: 8位常量
+SPEC: dict[str, tuple[int, str]] = {
+    "PAUSE": (0b00000, ""),
+    "NOP":   (0b00010, ""),
+    "MOVZ":  (0b00100, "RVV"),
+    "MOVLZ": (0b00101, "RCV"),
+    "MOVN":  (0b00110, "RVV"),
+    "MOVLN": (0b00111, "RCV"),
+    "ADD":   (0b01000, "RVV"),
+    "SUB":   (0b01010, "RVV"),
+    "ADDC":  (0b01100, "RVV"),
+    "SUBB":  (0b01110, "RVV"),
+    "INC":   (0b10000, "R"),
+    "DEC":   (0b10001, "R"),
+    "CMP":   (0b10010, "VV"),
+    "NOT":   (0b10100, "RV"),
+    "AND":   (0b10110, "RVV"),
+    "OR":    (0b11000, "RVV"),
+    "XOR":   (0b11010, "RVV"),
+    "SHL":   (0b11100, "RVV"),
+    "SHR":   (0b11110, "RVV"),
+}
+# 指令头第5位不参与区分的指令(编码中为x)
+FIXED_HEAD = ("MOVZ", "MOVLZ", "MOVN", "MOVLN", "INC", "DEC")
+FLAG_OPS = ("ADD", "SUB", "ADDC", "SUBB", "INC", "DEC", "CMP")
+REG_NAMES = ("PC", "AF", "SP", "IO", "R0", "R1", "R2", "R3")
+
+def op_length(form: str) -> int:
+    if form in ("", "R"):
+        return 1
+    return 3 if "C" in form else 2
+
+HEAD_TABLE: dict[int, str] = {}
+for _op, (_head, _form) in SPEC.items():
+    HEAD_TABLE[_head] = _op
+    if _op not in FIXED_HEAD:
+        HEAD_TABLE[_head | 1] = _op
+
+class Arg(NamedTuple):
+    kind: str # R: 寄存器, C: 常量, L: 标记引用
+    value: int | str
+    text: str # 源代码中的写法
+
+class Line(NamedTuple):
+    """生成的一行源代码。op与label恰有一个不为None。"""
+    op: Optional[str]
+    args: tuple[Arg, ...]
+    label: Optional[str]
+    text: str
+
+class Program(NamedTuple):
+    lines: tuple[Line, ...]
+    registers: tuple[int, ...] # 执行前的寄存器，PC总是0
+    steps: int
+
+    @property
+    def source(self) -> str:
+        return "\n".join(line.text for line in self.lines) + "\n"
+
+class RefResult(NamedTuple):
+    """参考编码结果。error不为None时程序非法。"""
+    binary: bytes
+    decoded: list[tuple[str, tuple[tuple[str, int], ...]]] # 每条指令的 (指令名, ((种类, 值), ...))，常量已解析
+    error: Optional[str]
+
+def ref_assemble(lines: tuple[Line, ...]) -> RefResult:
+    """按指令集说明编码，并判断程序是否合法。"""
+    labels: dict[str, int] = {}
+    addr = 0
+    for line in lines:
+        if line.label is not None:
+            if line.label in labels:
+                return RefResult(b"", [], f"重复的标记 {line.label}")
+            labels[line.label] = addr
+        elif line.op in SPEC:
+            addr += op_length(SPEC[line.op][1])
+    out = bytearray()
+    decoded = []
+    for line in lines:
+        if line.label is not None:
+            continue
+        if line.op not in SPEC:
+            return RefResult(b"", [], f"未知的指令 {line.op}")
+        head, form = SPEC[line.op]
+        if len(line.args) != len(form):
+            return RefResult(b"", [], f"{line.op} 参数数量错误")
+        fields = []
+        for slot, arg in zip(form, line.args):
+            if arg.kind == "R":
+                if slot == "C":
+                    return RefResult(b"", [], f"{line.op} 需要常量")
+                fields.append(("R", arg.value))
+                continue
+            if slot == "R":
+                return RefResult(b"", [], f"{line.op} 需要寄存器")
+            value = arg.value
+            if arg.kind == "L":
+                if value not in labels:
+                    return RefResult(b"", [], f"标记未定义 {value}")
+                value = labels[value]
+            low, high = (-0x80, 0xFF) if slot == "C" else (0, 7)
+            if not low <= value <= high:
+                return RefResult(b"", [], f"{line.op} 常量超出范围 {value}")
+            fields.append(("C", value & 0xFF))
+        decoded.append((line.op, tuple(fields)))
+        out += encode(line.op, fields)
+    return RefResult(bytes(out), decoded, None)
+
+def pack_value(field: tuple[str, int]) -> int:
+    kind, value = field
+    return 0b1000 | value if kind == "R" else value
+
+def encode(op: str, fields: list[tuple[str, int]]) -> bytes:
+    head, form = SPEC[op]
+    d0 = head << 3
+    if form == "":
+        return bytes([d0])
+    if form == "R":
+        return bytes([d0 | fields[0][1]])
+    if form == "VV":
+        return bytes([d0, pack_value(fields[0]) << 4 | pack_value(fields[1])])
+    if form == "RV":
+        return bytes([d0 | fields[0][1], pack_value(fields[1]) << 4])
+    if form == "RCV":
+        return bytes([d0 | fields[0][1], fields[1][1], pack_value(fields[2]) << 4])
+    return bytes([d0 | fields[0][1], pack_value(fields[1]) << 4 | pack_value(fields[2])])
+
+def ref_decode(data: bytes) -> list[tuple[str, tuple[tuple[str, int], ...]]]:
+    """将字节码顺序解码为指令列表。末尾不完整的指令忽略。"""
+    out = []
+    pos = 0
+    def value(v: int) -> tuple[str, int]:
+        return ("R", v & 0b111) if v & 0b1000 else ("C", v & 0b111)
+    while pos < len(data):
+        d0 = data[pos]
+        op = HEAD_TABLE[d0 >> 3]
+        form = SPEC[op][1]
+        length = op_length(form)
+        if pos + length > len(data):
+            break
+        d1 = data[pos + 1] if length > 1 else 0
+        d2 = data[pos + 2] if length > 2 else 0
+        if form == "":
+            fields = ()
+        elif form == "R":
+            fields = (("R", d0 & 0b111),)
+        elif form == "VV":
+            fields = (value(d1 >> 4), value(d1))
+        elif form == "RV":
+            fields = (("R", d0 & 0b111), value(d1 >> 4))
+        elif form == "RCV":
+            fields = (("R", d0 & 0b111), ("C", d1), value(d2 >> 4))
+        else:
+            fields = (("R", d0 & 0b111), value(d1 >> 4), value(d1))
+        out.append((op, fields))
+        pos += length
+    return out
+
+class RefMachine:
+    """按指令集说明独立实现的参考模型。"""
+    def __init__(self, rom: bytes, registers: tuple[int, ...]):
+        self.rom = bytes(rom[:0xFF]).ljust(0x100, b"\x00") # 地址0xFF没有存储单元，读为0
+        self.registers = list(registers)
+        self.pause = False
+        self.last_op = ""
+        self.wrapped = False # 最近一条指令的取指是否越过地址0xFF
+
+    def step(self):
+        regs = self.registers
+        pc = regs[0]
+        d0 = self.rom[pc]
+        op = HEAD_TABLE[d0 >> 3]
+        length = op_length(SPEC[op][1])
+        d1 = self.rom[(pc + 1) & 0xFF]
+        d2 = self.rom[(pc + 2) & 0xFF]
+        self.last_op = op
+        self.wrapped = pc + length > 0xFF
+        regs[0] = (pc + length) & 0xFF
+        dest = d0 & 0b111
+        def value(v: int) -> int:
+            return regs[v & 0b111] if v & 0b1000 else v & 0b111
+        if op == "PAUSE":
+            self.pause = True
+        elif op == "NOP":
+            pass
+        elif op in ("MOVZ", "MOVN"):
+            cond = value(d1 & 0b1111)
+            if (cond == 0) == (op == "MOVZ"):
+                regs[dest] = value(d1 >> 4)
+        elif op in ("MOVLZ", "MOVLN"):
+            cond = value(d2 >> 4)
+            if (cond == 0) == (op == "MOVLZ"):
+                regs[dest] = d1
+        elif op in FLAG_OPS:
+            carry = (regs[1] >> 1) & 1
+            if op == "INC":
+                a, b, sub, extra = regs[dest], 1, False, 0
+            elif op == "DEC":
+                a, b, sub, extra = regs[dest], 1, True, 0
+            else:
+                a, b = value(d1 >> 4), value(d1 & 0b1111)
+                sub = op in ("SUB", "SUBB", "CMP")
+                extra = carry if op in ("ADDC", "SUBB") else 0
+            r = a - b - extra if sub else a + b + extra
+            zf = (r & 0xFF) == 0
+            cf = r < 0 or r > 0xFF
+            sa, sb, sr = a >> 7, b >> 7, (r >> 7) & 1
+            of = (sa != sb if sub else sa == sb) and sr != sa
+            regs[1] = (regs[1] & 0b11111000) | of << 2 | cf << 1 | zf
+            if op != "CMP":
+                regs[dest] = r & 0xFF # 操作结果优先
+        else:
+            a, b = value(d1 >> 4), value(d1 & 0b1111)
+            if op == "NOT":
+                r = ~a
+            elif op == "AND":
+                r = a & b
+            elif op == "OR":
+                r = a | b
+            elif op == "XOR":
+                r = a ^ b
+            elif op == "SHL":
+                r = a << b
+            else:
+                r = a >> b
+            regs[dest] = r & 0xFF
+
+# ---------------- 生成 ----------------
+
+def valid_combos() -> list[tuple[str, str]]:
+    """所有合法的 (指令, 参数种类) 组合。"""
+    combos = []
+    for op, (_, form) in SPEC.items():
+        kinds = [""]
+        for slot in form:
+            choices = {"R": "R", "V": "RCL", "C": "CL"}[slot]
+            kinds = [k + c for k in kinds for c in choices]
+        combos.extend((op, k) for k in kinds)
+    return combos
+
+COMBOS = valid_combos()
+MUTATIONS = ("unknown-op", "arg-count", "arg-type", "const-range", "undefined-label", "duplicate-label")
+UNKNOWN_OPS = ("MUL", "DIV", "NEG", "MOV", "JMP", "SUBC", "HALT")
+
+def number_text(rng: random.Random, value: int) -> str:
+    """用随机的进制写法表示常量。"""
+    if value < 0:
+        return rng.choice([str(value), f"-0x{-value:x}"])
+    style = rng.randrange(8)
+    if style == 0:
+        return f"{value}d"
+    if style == 1:
+        return rng.choice(["0x", "0X"]) + f"{value:x}"
+    if style == 2:
+        text = f"{value:x}"
+        return ("0" + text if text[0].isalpha() else text) + rng.choice("hH")
+    if style == 3:
+        return f"0b{value:b}"
+    if style == 4:
+        return f"{value:b}b"
+    if style == 5:
+        return f"0o{value:o}"
+    if style == 6:
+        return f"{value:o}o"
+    return str(value)
+
+def cased(rng: random.Random, text: str) -> str:
+    return rng.choice([text.upper(), text.lower(), text.capitalize()])
+
+def label_name(rng: random.Random) -> str:
+    # 包含容易与数字写法混淆的名称，如 ah, beh
+    while True:
+        length = rng.randint(1, 4)
+        name = "".join(rng.choice("abcdefhlopxz_") for _ in range(length)) + rng.choice(["", "", str(rng.randrange(10))])
+        if name.upper() not in REG_NAMES: # 与寄存器同名的标记在语法上有歧义，不生成
+            return name
+
+class Generator:
+    def __init__(self, rng: random.Random, counts: dict[tuple, int]):
+        self.rng = rng
+        self.counts = counts
+
+    def pick_combo(self) -> tuple[str, str]:
+        weights = [1.0 / (1 + self.counts.get(("op",) + combo, 0)) for combo in COMBOS]
+        return self.rng.choices(COMBOS, weights)[0]
+
+    def const(self, slot: str) -> int:
+        rng = self.rng
+        if slot == "C":
+            return rng.choice([0, 1, 7, 8, 0x7F, 0x80, 0xFE, 0xFF, -1, -0x80, rng.randrange(-0x80, 0x100)])
+        return rng.randrange(8)
+
+    def instruction(self, op: str, kinds: str, labels: list[str]) -> Line:
+        rng = self.rng
+        form = SPEC[op][1]
+        args = []
+        for slot, kind in zip(form, kinds):
+            if kind == "R":
+                reg = rng.randrange(8)
+                args.append(Arg("R", reg, cased(rng, REG_NAMES[reg])))
+            elif kind == "L" and labels:
+                name = rng.choice(labels)
+                args.append(Arg("L", name, name))
+            else:
+                value = self.const(slot)
+                args.append(Arg("C", value, number_text(rng, value)))
+        return self.render(op, tuple(args))
+
+    def render(self, op: str, args: tuple[Arg, ...]) -> Line:
+        rng = self.rng
+        sep = rng.choice([", ", " ", ",", " , "])
+        text = cased(rng, op)
+        if args:
+            text += " " + sep.join(arg.text for arg in args)
+        return Line(op, args, None, rng.choice(["", "    ", "\t"]) + text)
+
+    def program(self, invalid: bool) -> tuple[Program, Optional[str]]:
+        """
+        生成一个程序。invalid为True时额外施加一个变异。
+
+        :return: 程序, 施加的变异名
+        """
+        rng = self.rng
+        count = rng.randint(1, 24)
+        labels = [label_name(rng) for _ in range(rng.randint(0, 3))]
+        labels = list(dict.fromkeys(labels))
+        lines: list[Line] = []
+        placed = set()
+        for _ in range(count):
+            if labels and rng.random() < 0.15:
+                free = [name for name in labels if name not in placed]
+                if free:
+                    name = rng.choice(free)
+                    placed.add(name)
+                    lines.append(Line(None, (), name, f"{name}:"))
+            op, kinds = self.pick_combo()
+            lines.append(self.instruction(op, kinds, labels))
+        # 未放置的标记放在末尾，保证引用有定义
+        for name in labels:
+            if name not in placed:
+                lines.append(Line(None, (), name, f"{name}:"))
+        mutation = None
+        if invalid:
+            mutation = rng.choice(MUTATIONS)
+            lines = self.mutate(lines, mutation)
+        registers = (0,) + tuple(rng.choice([0, 1, 0x7F, 0x80, 0xFF, rng.randrange(0x100)]) for _ in range(7))
+        return Program(tuple(lines), registers, rng.choice([8, 32, 64])), mutation
+
+    def mutate(self, lines: list[Line], mutation: str) -> list[Line]:
+        rng = self.rng
+        index = rng.randrange(len(lines))
+        instructions = [i for i, line in enumerate(lines) if line.op is not None]
+        if mutation == "unknown-op":
+            op = rng.choice(UNKNOWN_OPS)
+            line = Line(op, (), None, f"{cased(rng, op)} R0, R0, 1")
+            lines.insert(index, line)
+        elif mutation == "arg-count":
+            i = rng.choice(instructions)
+            line = lines[i]
+            if line.args and rng.random() < 0.5:
+                args = line.args[:-1]
+            else:
+                args = line.args + (Arg("R", 4, "R0"),)
+            lines[i] = self.render(line.op, args)
+        elif mutation == "arg-type":
+            candidates = [i for i in instructions if SPEC[lines[i].op][1]]
+            if not candidates:
+                return self.mutate(lines, "unknown-op")
+            i = rng.choice(candidates)
+            line = lines[i]
+            form = SPEC[line.op][1]
+            slots = [k for k, slot in enumerate(form) if slot in "RC"]
+            if not slots:
+                return self.mutate(lines, "const-range")
+            k = rng.choice(slots)
+            args = list(line.args)
+            args[k] = Arg("C", 1, "1") if form[k] == "R" else Arg("R", 4, "R0")
+            lines[i] = self.render(line.op, tuple(args))
+        elif mutation == "const-range":
+            candidates = [i for i in instructions if any(slot in "VC" for slot in SPEC[lines[i].op][1])]
+            if not candidates:
+                return self.mutate(lines, "unknown-op")
+            i = rng.choice(candidates)
+            line = lines[i]
+            form = SPEC[line.op][1]
+            k = rng.choice([k for k, slot in enumerate(form) if slot in "VC"])
+            if form[k] == "C":
+                value = rng.choice([0x100, 0x1FF, -0x81, -0x100])
+            else:
+                value = rng.choice([8, 9, 15, 0x10, -1])
+            args = list(line.args)
+            args[k] = Arg("C", value, number_text(rng, value))
+            lines[i] = self.render(line.op, tuple(args))
+        elif mutation == "undefined-label":
+            candidates = [i for i in instructions if any(slot in "VC" for slot in SPEC[lines[i].op][1])]
+            if not candidates:
+                return self.mutate(lines, "unknown-op")
+            i = rng.choice(candidates)
+            line = lines[i]
+            form = SPEC[line.op][1]
+            k = rng.choice([k for k, slot in enumerate(form) if slot in "VC"])
+            args = list(line.args)
+            args[k] = Arg("L", "undefined_label", "undefined_label")
+            lines[i] = self.render(line.op, tuple(args))
+        else: # duplicate-label
+            name = label_name(self.rng)
+            lines.insert(index, Line(None, (), name, f"{name}:"))
+            lines.insert(rng.randrange(len(lines) + 1), Line(None, (), name, f"{name}:"))
+        return lines
+
+# ---------------- 检查 ----------------
+
+class Divergence(NamedTuple):
+    signature: tuple[str, ...]
+    detail: str
+
+def message_category(message: str) -> str:
+    """取诊断信息中冒号或逗号之前的部分作为类别。"""
+    return re.split(r"[:：，,]", message, maxsplit=1)[0].strip()
+
+def check(program: Program, coverage: Optional[dict[tuple, int]] = None, mutation: Optional[str] = None) -> list[Divergence]:
+    """检查一个程序，返回发现的差异。coverage不为None时累加覆盖计数。"""
+    divergences: list[Divergence] = []
+    ref = ref_assemble(program.lines)
+    if coverage is not None:
+        for line in program.lines:
+            if line.op in SPEC and ref.error is None:
+                key = ("op", line.op, "".join(arg.kind for arg in line.args))
+                coverage[key] = coverage.get(key, 0) + 1
+        if mutation is not None:
+            key = ("mutation", mutation)
+            coverage[key] = coverage.get(key, 0) + 1
+    # 编译
+    try:
+        result = cp.assemble(program.source, no_warn=True)
+    except Exception as e:
+        line = next((line for line in program.lines if line.op is not None and line.op not in SPEC), None)
+        op = line.op if line is not None else "?"
+        return [Divergence(("assemble-crash", type(e).__name__, op), f"cp.assemble抛出异常 {type(e).__name__}: {e}")]
+    errors = [d for d in result.diagnostics if d.severity == cp.SEVERITY_ERROR]
+    if ref.error is None and errors:
+        first = errors[0]
+        category = message_category(first.message)
+        signature = ("assemble-rejects-valid", category)
+        if category.startswith("未知的指令"):
+            signature += (first.message.split("：")[-1],)
+        divergences.append(Divergence(signature, f"合法程序编译失败，第{first.line}行: {first.message}"))
+    elif ref.error is not None and not errors:
+        divergences.append(Divergence(("assemble-accepts-invalid", mutation or "?"),
+                                      f"非法程序编译成功，参考编码器的错误: {ref.error}"))
+    elif ref.error is None:
+        decoded = ref_decode(result.binary)
+        if decoded != ref.decoded:
+            for i, (got, want) in enumerate(zip(decoded, ref.decoded)):
+                if got != want:
+                    divergences.append(Divergence(("decode-mismatch", want[0]), f"第{i}条指令解码为 {got}，期望 {want}"))
+                    break
+            else:
+                divergences.append(Divergence(("decode-mismatch", "length"),
+                                              f"解码得到{len(decoded)}条指令，期望{len(ref.decoded)}条"))
+        elif result.binary != ref.binary:
+            pos = next(i for i, (a, b) in enumerate(zip(result.binary + b"\x00", ref.binary + b"\x00")) if a != b)
+            divergences.append(Divergence(("encoding-mismatch",), f"地址{pos}处字节为 {result.binary[pos:pos + 1].hex()}，"
+                                          f"期望 {ref.binary[pos:pos + 1].hex()}"))
+    if ref.error is not None:
+        return divergences
+    # 执行
+    divergences.extend(check_execution(ref.binary, program.registers, program.steps, coverage))
+    return divergences
+
+def check_execution(binary: bytes, registers: tuple[int, ...], steps: int,
+                    coverage: Optional[dict[tuple, int]] = None) -> list[Divergence]:
+    ctx = vm.Ctx_t()
+    ctx.load_program(binary)
+    ctx.Registers[:] = registers
+    runner = vm.InstructionRunner(ctx)
+    ref = RefMachine(binary, registers)
+    for step in range(steps):
+        pc = ref.registers[0]
+        try:
+            runner.run_step()
+        except Exception as e:
+            ref.step()
+            return [Divergence(("exec-crash", ref.last_op, type(e).__name__),
+                               f"第{step}步(地址{pc}) {ref.last_op} 执行时抛出异常 {type(e).__name__}: {e}")]
+        ref.step()
+        if coverage is not None:
+            key = ("exec", ref.last_op, ref.registers[1] & 0b111 if ref.last_op in FLAG_OPS else -1)
+            coverage[key] = coverage.get(key, 0) + 1
+            if ref.wrapped:
+                coverage[("wrap",)] = coverage.get(("wrap",), 0) + 1
+        diff = [REG_NAMES[i] for i in range(8) if ctx.Registers[i] != ref.registers[i]]
+        if ctx.Pause_signal != ref.pause:
+            diff.append("PAUSE")
+        if diff:
+            got = " ".join(f"{name}={ctx.Registers[REG_NAMES.index(name)]}" for name in diff if name != "PAUSE")
+            want = " ".join(f"{name}={ref.registers[REG_NAMES.index(name)]}" for name in diff if name != "PAUSE")
+            # 按差异类别归类，避免同一问题因目标寄存器不同而重复报告
+            if ref.wrapped:
+                category = "wrap"
+            elif diff == ["AF"]:
+                category = "flags"
+            else:
+                category = "result"
+            signature = ("exec-mismatch", ref.last_op, category)
+            return [Divergence(signature, f"第{step}步(地址{pc}) {ref.last_op} 之后 vm: {got}，参考模型: {want}")]
+        ctx.Pause_signal = False
+        ref.pause = False
+    return []
+
+def minimize(program: Program, signature: tuple[str, ...]) -> Program:
+    """delta debugging：在保持同一签名的前提下删除尽可能多的行，再将初始寄存器尽量清零。"""
+    def reproduces(lines: tuple[Line, ...], registers: tuple[int, ...]) -> bool:
+        candidate = Program(lines, registers, program.steps)
+        return any(d.signature == signature for d in check(candidate))
+    lines = list(program.lines)
+    registers = program.registers
+    n = 2
+    while len(lines) >= 2:
+        chunk = -(-len(lines) // n)
+        for start in range(0, len(lines), chunk):
+            candidate = lines[:start] + lines[start + chunk:]
+            if reproduces(tuple(candidate), registers):
+                lines = candidate
+                n = max(n - 1, 2)
+                break
+        else:
+            if n >= len(lines):
+                break
+            n = min(len(lines), n * 2)
+    for i in range(1, 8):
+        if registers[i]:
+            candidate = registers[:i] + (0,) + registers[i + 1:]
+            if reproduces(tuple(lines), candidate):
+                registers = candidate
+    return Program(tuple(lines), registers, program.steps)
+
+def reproducer_text(program: Program, divergence: Divergence) -> str:
+    regs = " ".join(f"{name}={value}" for name, value in zip(REG_NAMES, program.registers))
+    return f"""\
+// fuzz: {' '.join(divergence.signature)}
+// {divergence.detail}
+// 初始寄存器: {regs}，执行{program.steps}步
+{program.source}"""
+
+# ---------------- 并行执行 ----------------
+
+class BatchResult:
+    def __init__(self):
+        self.programs = 0
+        self.coverage: dict[tuple, int] = {}
+        self.found: dict[tuple[str, ...], tuple[Program, Divergence]] = {} # 签名 -> 缩减后的复现程序
+
+    def merge(self, other: "BatchResult"):
+        self.programs += other.programs
+        for key, count in other.coverage.items():
+            self.coverage[key] = self.coverage.get(key, 0) + count
+        for signature, (program, divergence) in other.found.items():
+            old = self.found.get(signature)
+            if old is None or len(program.lines) < len(old[0].lines):
+                self.found[signature] = (program, divergence)
+
+def fuzz_batch(seed: int, count: int, counts: dict[tuple, int], known: set[tuple[str, ...]],
+               invalid_rate: float = 0.3) -> BatchResult:
+    """生成并检查count个程序。known中的签名不再缩减。"""
+    rng = random.Random(seed)
+    result = BatchResult()
+    guide = dict(counts)
+    generator = Generator(rng, guide)
+    for _ in range(count):
+        program, mutation = generator.program(rng.random() < invalid_rate)
+        found = check(program, result.coverage, mutation)
+        for key in result.coverage:
+            guide[key] = counts.get(key, 0) + result.coverage[key]
+        result.programs += 1
+        for divergence in found:
+            if divergence.signature in known or divergence.signature in result.found:
+                continue
+            small = minimize(program, divergence.signature)
+            detail = next(d for d in check(small) if d.signature == divergence.signature)
+            result.found[divergence.signature] = (small, detail)
+    return result
+
+def _batch_task(task: tuple) -> BatchResult:
+    return fuzz_batch(*task)
+
+def coverage_summary(coverage: dict[tuple, int]) -> str:
+    op_total = len(COMBOS)
+    op_covered = sum(1 for combo in COMBOS if coverage.get(("op",) + combo))
+    mutations = sum(1 for m in MUTATIONS if coverage.get(("mutation", m)))
+    flags = sum(1 for key in coverage if key[0] == "exec" and key[2] >= 0)
+    return (f"指令/参数种类覆盖 {op_covered}/{op_total}，变异种类 {mutations}/{len(MUTATIONS)}，"
+            f"符号位结果组合 {flags}/{len(FLAG_OPS) * 8}，跨越0xFF取指 {coverage.get(('wrap',), 0)} 次")
+
+def main():
+    parser = argparse.ArgumentParser(description="DZC-8M Differential Fuzzer")
+    parser.add_argument("-n", "--count", type=int, default=20000, help="生成的程序数量。默认20000")
+    parser.add_argument("-t", "--time", type=float, default=None, help="最长运行时间(秒)，达到后提前结束")
+    parser.add_argument("-s", "--seed", type=int, default=None, help="随机种子。默认随机")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="并行进程数。默认为CPU核心数")
+    parser.add_argument("--batch", type=int, default=500, help="每个任务的程序数量。默认500")
+    parser.add_argument("--invalid-rate", type=float, default=0.3, help="生成非法程序的比例。默认0.3")
+    parser.add_argument("-o", "--output", default=None, help="将复现程序写入此目录")
+    parser.add_argument("--version", action="version", version=f"Eggy Fuzzer\n{__version__}\nfor DZC-8M Plus Instruction Set")
+    args = parser.parse_args()
+
+    seed = args.seed if args.seed is not None else random.randrange(1 << 31)
+    jobs = args.jobs or os.cpu_count() or 1
+    print(f"种子: {seed}")
+    total = BatchResult()
+    start = time.perf_counter()
+    round_index = 0
+    executor = ProcessPoolExecutor(max_workers=jobs) if jobs > 1 else None
+    try:
+        while total.programs < args.count:
+            if args.time is not None and time.perf_counter() - start >= args.time:
+                break
+            remaining = args.count - total.programs
+            sizes = [min(args.batch, remaining - i * args.batch) for i in range(jobs)]
+            tasks = [((seed << 20) + round_index * jobs + i, size, total.coverage, set(total.found), args.invalid_rate)
+                     for i, size in enumerate(sizes) if size > 0]
+            if executor is None:
+                parts = [_batch_task(task) for task in tasks]
+            else:
+                parts = list(executor.map(_batch_task, tasks))
+            for part in parts:
+                total.merge(part)
+            round_index += 1
+            elapsed = time.perf_counter() - start
+            print(f"\r已检查 {total.programs} 个程序 ({total.programs / elapsed:.0f}/s)，发现 {len(total.found)} 种差异", end="")
+            sys.stdout.flush()
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    print()
+    print(coverage_summary(total.coverage))
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+    for i, (signature, (program, divergence)) in enumerate(sorted(total.found.items())):
+        text = reproducer_text(program, divergence)
+        print(f"\n[{i}] {' '.join(signature)}\n{text}", end="")
+        if args.output:
+            with open(os.path.join(args.output, f"repro_{i:03}.asm"), "w", encoding="utf-8") as f:
+                f.write(text)
+    return 1 if total.found else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,811 @@
+"""
+事件驱动的门级模拟器，用于分析游戏内逻辑门事件队列(约256个事件)溢出的风险。
+
+机制与docs/小困难.md中描述的一致：
+- 逻辑门仅在输出变化时发出事件，每个事件发往输出所连接的每一个下一级逻辑门；
+- 事件在下一级逻辑门处理完成后才从队列中移除；
+- 队列已满时，新事件被直接丢弃。
+
+模拟DZC-8M Plus的数据通路：ALU、AF标志(含ZF识别)、寄存器写入与PC更新，
+统计每个时钟阶段产生的事件数与队列峰值深度，找出可能导致队列溢出的操作数组合与指令序列。
+"""
+import sys, time
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple, Optional
+
+import argparse
+
+import isa
+
+__version__ = "0.1.0"
+
+EVENT_QUEUE_LIMIT = 256 # 游戏内事件队列容量
+
+# 逻辑门类型
+G_AND = 0
+G_OR = 1
+G_XOR = 2
+G_NOT = 3
+G_NOR = 4
+G_NAND = 5
+G_XNOR = 6
+G_BUF = 7
+G_LATCH = 8 # 输入为(d, en)。en为1时输出d，否则保持
+
+class Netlist:
+    """逻辑门网表。线网与逻辑门均以整数编号。"""
+    def __init__(self):
+        self.net_count = 0
+        self.kinds: list[int] = []
+        self.gate_inputs: list[tuple[int, ...]] = []
+        self.gate_outputs: list[int] = []
+        self.fanout: list[list[int]] = [] # 线网 -> 以其为输入的逻辑门
+        self.values: list[int] = []
+        self.limit = EVENT_QUEUE_LIMIT
+        self.drop = False # 是否模拟队列满时丢弃事件
+        self._tables: Optional[list[int]] = None
+        self._in0: list[int] = []
+        self._in1: list[int] = []
+        self._in2: list[int] = []
+
+    def net(self) -> int:
+        self.net_count += 1
+        self.fanout.append([])
+        self.values.append(0)
+        return self.net_count - 1
+
+    def nets(self, count: int) -> list[int]:
+        return [self.net() for _ in range(count)]
+
+    def gate(self, kind: int, *inputs: int) -> int:
+        """添加逻辑门，返回其输出线网。"""
+        out = self.net()
+        index = len(self.kinds)
+        self.kinds.append(kind)
+        self.gate_inputs.append(inputs)
+        self.gate_outputs.append(out)
+        for net in inputs:
+            self.fanout[net].append(index)
+        return out
+
+    def tree(self, kind: int, inputs: list[int]) -> int:
+        """用两输入逻辑门构成的平衡树合并多个输入。kind须满足结合律(AND/OR/XOR)。"""
+        level = list(inputs)
+        while len(level) > 1:
+            nxt = [self.gate(kind, level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+            if len(level) % 2:
+                nxt.append(level[-1])
+            level = nxt
+        return level[0]
+
+    def _eval(self, gate: int) -> int:
+        kind = self.kinds[gate]
+        inputs = self.gate_inputs[gate]
+        values = self.values
+        if kind == G_AND:
+            for net in inputs:
+                if not values[net]:
+                    return 0
+            return 1
+        if kind == G_OR:
+            for net in inputs:
+                if values[net]:
+                    return 1
+            return 0
+        if kind == G_XOR:
+            v = 0
+            for net in inputs:
+                v ^= values[net]
+            return v
+        if kind == G_NOT:
+            return values[inputs[0]] ^ 1
+        if kind == G_NOR:
+            for net in inputs:
+                if values[net]:
+                    return 0
+            return 1
+        if kind == G_NAND:
+            for net in inputs:
+                if not values[net]:
+                    return 1
+            return 0
+        if kind == G_XNOR:
+            v = 1
+            for net in inputs:
+                v ^= values[net]
+            return v
+        if kind == G_BUF:
+            return values[inputs[0]]
+        # G_LATCH
+        if values[inputs[1]]:
+            return values[inputs[0]]
+        return values[self.gate_outputs[gate]]
+
+    def _compile(self):
+        """
+        为输入不超过3个的逻辑门生成按 in0 | in1 << 1 | in2 << 2 索引的真值表。
+        锁存器的第3个输入为其自身输出。其余逻辑门为-1，由_eval求值。
+        """
+        self._tables = []
+        self._in0 = []
+        self._in1 = []
+        self._in2 = []
+        values = self.values
+        for gate, inputs in enumerate(self.gate_inputs):
+            if self.kinds[gate] == G_LATCH:
+                inputs = inputs + (self.gate_outputs[gate],)
+            if len(inputs) > 3:
+                self._tables.append(-1)
+                self._in0.append(0)
+                self._in1.append(0)
+                self._in2.append(0)
+                continue
+            # 输入不足3个时重复最后一个输入。运行时重复的输入值总是相同，只会用到与之一致的表项
+            in0, in1, in2 = (inputs + (inputs[-1],) * 2)[:3]
+            saved = values[in0], values[in1], values[in2]
+            table = 0
+            for index in range(8):
+                values[in0] = index & 1
+                values[in1] = (index >> 1) & 1
+                values[in2] = index >> 2
+                table |= self._eval(gate) << index
+            values[in2], values[in1], values[in0] = saved[2], saved[1], saved[0]
+            self._tables.append(table)
+            self._in0.append(in0)
+            self._in1.append(in1)
+            self._in2.append(in2)
+
+    def settle(self):
+        """不计事件地将所有逻辑门求值到稳定状态，用于初始化。"""
+        changed = True
+        while changed:
+            changed = False
+            for gate in range(len(self.kinds)):
+                v = self._eval(gate)
+                out = self.gate_outputs[gate]
+                if self.values[out] != v:
+                    self.values[out] = v
+                    changed = True
+
+    def apply(self, changes: list[tuple[int, int]]) -> tuple[int, int, int]:
+        """
+        修改输入线网的值并处理事件直到队列为空。
+
+        :param changes: (线网, 新值)列表
+        :return: 事件数, 队列峰值深度, 丢弃的事件数
+        :rtype: tuple[int, int, int]
+        """
+        if self._tables is None:
+            self._compile()
+        values = self.values
+        fanout = self.fanout
+        outputs = self.gate_outputs
+        tables, in0, in1, in2 = self._tables, self._in0, self._in1, self._in2
+        limit = self.limit
+        drop = self.drop
+        # 以列表加队首下标作为FIFO队列，队列深度为 len(queue) - head
+        queue: list[int] = []
+        head = 0
+        dropped = 0
+        peak = 0
+        for net, value in changes:
+            if values[net] == value:
+                continue
+            values[net] = value
+            queue.extend(fanout[net])
+        if drop and len(queue) > limit:
+            dropped += len(queue) - limit
+            del queue[limit:]
+        peak = len(queue)
+        while head < len(queue):
+            gate = queue[head]
+            head += 1
+            table = tables[gate]
+            if table >= 0:
+                v = (table >> (values[in0[gate]] | values[in1[gate]] << 1 | values[in2[gate]] << 2)) & 1
+            else:
+                v = self._eval(gate)
+            out = outputs[gate]
+            if values[out] == v:
+                continue
+            values[out] = v
+            nxt = fanout[out]
+            if not nxt:
+                continue
+            queue.extend(nxt)
+            depth = len(queue) - head
+            if depth > peak:
+                if drop and depth > limit:
+                    dropped += depth - limit
+                    del queue[head + limit:]
+                    depth = limit
+                peak = depth
+        return len(queue), peak, dropped
+
+    def bits(self, nets: list[int]) -> int:
+        """读取线网组表示的整数，nets[0]为最低位。"""
+        value = 0
+        for i, net in enumerate(nets):
+            value |= self.values[net] << i
+        return value
+
+def set_bits(nets: list[int], value: int) -> list[tuple[int, int]]:
+    return [(net, (value >> i) & 1) for i, net in enumerate(nets)]
+
+# ---------------- 数据通路 ----------------
+
+# ALU操作选择
+ALU_SELECTS = ("ADD", "AND", "OR", "XOR", "NOT", "SHL", "SHR", "PASS")
+
+def build_alu(nl: Netlist, a: list[int], b: list[int], sub: int, cin: int, sel: dict[str, int]) -> tuple[list[int], int, int]:
+    """
+    构造ALU。
+
+    :return: 结果线网, 进位输出, 参与加法的b最高位
+    """
+    # 加/减法：a + (b ^ sub) + (cin ^ sub)
+    b_eff = [nl.gate(G_XOR, b[i], sub) for i in range(8)]
+    carry = nl.gate(G_XOR, cin, sub)
+    sums = []
+    for i in range(8):
+        x = nl.gate(G_XOR, a[i], b_eff[i])
+        sums.append(nl.gate(G_XOR, x, carry))
+        carry = nl.gate(G_OR, nl.gate(G_AND, a[i], b_eff[i]), nl.gate(G_AND, x, carry))
+    ands = [nl.gate(G_AND, a[i], b[i]) for i in range(8)]
+    ors = [nl.gate(G_OR, a[i], b[i]) for i in range(8)]
+    xors = [nl.gate(G_XOR, a[i], b[i]) for i in range(8)]
+    nots = [nl.gate(G_NOT, a[i]) for i in range(8)]
+    # 桶形移位器。移位量为b，b >= 8 时结果为0
+    in_range = nl.gate(G_NOR, *b[3:])
+    def shifter(left: bool) -> list[int]:
+        cur = list(a)
+        for k in range(3):
+            s = b[k]
+            ns = nl.gate(G_NOT, s)
+            step = 1 << k
+            nxt = []
+            for i in range(8):
+                src = i - step if left else i + step
+                keep = nl.gate(G_AND, ns, cur[i])
+                if 0 <= src < 8:
+                    nxt.append(nl.gate(G_OR, keep, nl.gate(G_AND, s, cur[src])))
+                else:
+                    nxt.append(keep)
+            cur = nxt
+        return [nl.gate(G_AND, in_range, cur[i]) for i in range(8)]
+    shl = shifter(True)
+    shr = shifter(False)
+    sources = {"ADD": sums, "AND": ands, "OR": ors, "XOR": xors, "NOT": nots, "SHL": shl, "SHR": shr, "PASS": list(b)}
+    result = []
+    for i in range(8):
+        terms = [nl.gate(G_AND, sel[name], sources[name][i]) for name in ALU_SELECTS]
+        result.append(nl.tree(G_OR, terms))
+    return result, carry, b_eff[7]
+
+def build_zf(nl: Netlist, result: list[int], style: str) -> int:
+    """构造ZF识别电路。naive为8输入NOR，tree为docs/小困难.md中的两级OR树。"""
+    if style == "naive":
+        return nl.gate(G_NOR, *result)
+    level1 = [nl.gate(G_OR, result[i], result[i + 1]) for i in range(0, 8, 2)]
+    level2 = [nl.gate(G_OR, level1[0], level1[1]), nl.gate(G_OR, level1[2], level1[3])]
+    return nl.gate(G_NOR, *level2)
+
+def build_flags(nl: Netlist, result: list[int], carry: int, sub: int, a7: int, b_eff7: int, we: int, zf_style: str) -> list[int]:
+    """构造AF标志计算与锁存电路，返回AF[0..2]锁存器输出。"""
+    zf = build_zf(nl, result, zf_style)
+    cf = nl.gate(G_XOR, carry, sub)
+    of = nl.gate(G_AND, nl.gate(G_XNOR, a7, b_eff7), nl.gate(G_XOR, result[7], a7))
+    return [nl.gate(G_LATCH, flag, we) for flag in (zf, cf, of)]
+
+def build_writeback(nl: Netlist, result: list[int], dest: list[int], we: int) -> list[list[int]]:
+    """构造目标寄存器译码与8个8位寄存器锁存器，返回各寄存器输出。"""
+    ndest = [nl.gate(G_NOT, d) for d in dest]
+    registers = []
+    for r in range(8):
+        terms = [dest[k] if (r >> k) & 1 else ndest[k] for k in range(3)]
+        enable = nl.gate(G_AND, we, *terms)
+        registers.append([nl.gate(G_LATCH, result[i], enable) for i in range(8)])
+    return registers
+
+def build_pc(nl: Netlist, pc: list[int], length: list[int], we: int) -> list[int]:
+    """构造PC自增电路(pc + length)与PC锁存器。"""
+    carry = None
+    out = []
+    for i in range(8):
+        addend = length[i] if i < len(length) else None
+        if addend is None and carry is None:
+            out.append(pc[i])
+            continue
+        if addend is None:
+            s = nl.gate(G_XOR, pc[i], carry)
+            carry = nl.gate(G_AND, pc[i], carry)
+        elif carry is None:
+            s = nl.gate(G_XOR, pc[i], addend)
+            carry = nl.gate(G_AND, pc[i], addend)
+        else:
+            x = nl.gate(G_XOR, pc[i], addend)
+            s = nl.gate(G_XOR, x, carry)
+            carry = nl.gate(G_OR, nl.gate(G_AND, pc[i], addend), nl.gate(G_AND, x, carry))
+        out.append(s)
+    return [nl.gate(G_LATCH, out[i], we) for i in range(8)]
+
+class PhaseStats(NamedTuple):
+    """一个时钟阶段的事件统计。"""
+    phase: str
+    events: int
+    peak: int
+    dropped: int
+
+class AluControl(NamedTuple):
+    """一条指令对数据通路的控制信号。"""
+    select: str # ALU_SELECTS之一
+    sub: int
+    use_carry: bool # ADDC/SUBB使用AF:C作为进位输入
+    flags: bool # 是否写AF
+    write: bool # 是否写目标寄存器
+
+# 各指令的控制信号。INC/DEC的第二操作数为1，CMP不写寄存器，条件赋值在条件不满足时不写寄存器
+ALU_CONTROLS: dict[str, AluControl] = {
+    "MOVZ":  AluControl("PASS", 0, False, False, True),
+    "MOVLZ": AluControl("PASS", 0, False, False, True),
+    "MOVN":  AluControl("PASS", 0, False, False, True),
+    "MOVLN": AluControl("PASS", 0, False, False, True),
+    "ADD":   AluControl("ADD", 0, False, True, True),
+    "SUB":   AluControl("ADD", 1, False, True, True),
+    "ADDC":  AluControl("ADD", 0, True, True, True),
+    "SUBB":  AluControl("ADD", 1, True, True, True),
+    "INC":   AluControl("ADD", 0, False, True, True),
+    "DEC":   AluControl("ADD", 1, False, True, True),
+    "CMP":   AluControl("ADD", 1, False, True, False),
+    "NOT":   AluControl("NOT", 0, False, False, True),
+    "AND":   AluControl("AND", 0, False, False, True),
+    "OR":    AluControl("OR", 0, False, False, True),
+    "XOR":   AluControl("XOR", 0, False, False, True),
+    "SHL":   AluControl("SHL", 0, False, False, True),
+    "SHR":   AluControl("SHR", 0, False, False, True),
+}
+
+class DatapathSim:
+    """
+    DZC-8M Plus数据通路模拟器。
+
+    split_phases为True时，ALU、AF、写回、PC各自为独立电路，依次在不同阶段处理(DZC-8M Plus)；
+    为False时所有电路连成一体，在同一个事件队列中处理(DZC-8M)。
+    """
+    PHASES = ("alu", "flags", "writeback", "pc")
+
+    def __init__(self, zf_style: str = "tree", split_phases: bool = True, limit: int = EVENT_QUEUE_LIMIT, drop: bool = False):
+        self.split_phases = split_phases
+        self.nets: dict[str, Netlist] = {}
+        def netlist(phase: str) -> Netlist:
+            if not split_phases:
+                phase = "all"
+            if phase not in self.nets:
+                nl = Netlist()
+                nl.limit = limit
+                nl.drop = drop
+                self.nets[phase] = nl
+            return self.nets[phase]
+
+        nl = netlist("alu")
+        self.a = nl.nets(8)
+        self.b = nl.nets(8)
+        self.sub = nl.net()
+        self.cin = nl.net()
+        self.sel = {name: nl.net() for name in ALU_SELECTS}
+        result, carry, b_eff7 = build_alu(nl, self.a, self.b, self.sub, self.cin, self.sel)
+        self.alu_result = result
+        # 传给AF阶段的信号：结果, 进位输出, sub, a7, b_eff7
+        alu_outputs = result + [carry, self.sub, self.a[7], b_eff7]
+        self.alu_outputs = alu_outputs
+
+        # 分阶段时，下一阶段的输入为独立的线网，由上一阶段的结果驱动
+        nl = netlist("flags")
+        if split_phases:
+            self.flag_in = nl.nets(len(alu_outputs))
+            flag_src = self.flag_in
+        else:
+            self.flag_in = []
+            flag_src = alu_outputs
+        self.flag_we = nl.net()
+        self.af = build_flags(nl, flag_src[:8], flag_src[8], flag_src[9], flag_src[10], flag_src[11], self.flag_we,
+                              zf_style)
+
+        nl = netlist("writeback")
+        if split_phases:
+            self.wb_in = nl.nets(8)
+            wb_src = self.wb_in
+        else:
+            self.wb_in = []
+            wb_src = result
+        self.dest = nl.nets(3)
+        self.reg_we = nl.net()
+        self.registers = build_writeback(nl, wb_src, self.dest, self.reg_we)
+
+        nl = netlist("pc")
+        self.pc = nl.nets(8)
+        self.length = nl.nets(2)
+        self.pc_we = nl.net()
+        self.pc_out = build_pc(nl, self.pc, self.length, self.pc_we)
+
+        for nl in self.nets.values():
+            nl.settle()
+
+    def snapshot(self) -> list[list[int]]:
+        return [list(nl.values) for nl in self.nets.values()]
+
+    def restore(self, snapshot: list[list[int]]):
+        for nl, values in zip(self.nets.values(), snapshot):
+            nl.values[:] = values
+
+    def _phase(self, phase: str, changes: list[tuple[int, int]]) -> PhaseStats:
+        nl = self.nets[phase if self.split_phases else "all"]
+        return PhaseStats(phase, *nl.apply(changes))
+
+    def alu_changes(self, op: str, a: int, b: int, carry: int = 0) -> list[tuple[int, int]]:
+        control = ALU_CONTROLS[op]
+        changes = set_bits(self.a, a) + set_bits(self.b, b)
+        changes += [(self.sub, control.sub), (self.cin, carry if control.use_carry else 0)]
+        changes += [(net, int(name == control.select)) for name, net in self.sel.items()]
+        return changes
+
+    def alu_values(self) -> tuple[int, ...]:
+        """ALU阶段传给后续阶段的信号值，仅在分阶段时有意义。"""
+        values = self.nets["alu"].values
+        return tuple(values[net] for net in self.alu_outputs)
+
+    def result_phases(self, op: str, alu_values: tuple[int, ...], dest: int = 4, write: bool = True) -> list[PhaseStats]:
+        """在分阶段时，用ALU阶段的输出驱动AF与写回阶段。"""
+        control = ALU_CONTROLS[op]
+        flag_changes = list(zip(self.flag_in, alu_values)) + [(self.flag_we, int(control.flags))]
+        wb_changes = list(zip(self.wb_in, alu_values[:8])) + set_bits(self.dest, dest)
+        wb_changes.append((self.reg_we, int(control.write and write)))
+        return [self._phase("flags", flag_changes), self._phase("writeback", wb_changes)]
+
+    def pc_changes(self, pc: int, length: int) -> list[tuple[int, int]]:
+        return set_bits(self.pc, pc) + set_bits(self.length, length) + [(self.pc_we, 1)]
+
+    def step(self, op: Optional[str], a: int = 0, b: int = 0, dest: int = 4, carry: int = 0, write: bool = True,
+             pc: Optional[int] = None, length: int = 2) -> list[PhaseStats]:
+        """
+        模拟一条指令经过数据通路。
+
+        :param op: 指令名，见ALU_CONTROLS。None表示不经过ALU的指令(NOP/PAUSE)
+        :param a: 第一操作数
+        :param b: 第二操作数
+        :param dest: 目标寄存器编号
+        :param carry: 当前AF:C
+        :param write: 条件赋值的条件是否满足
+        :param pc: 指令地址。None表示不模拟PC更新
+        :param length: 指令长度
+        :return: 各阶段的事件统计。未分阶段时只有一项
+        """
+        pc_changes = [] if pc is None else self.pc_changes(pc, length)
+        if not self.split_phases:
+            changes = []
+            if op is not None:
+                control = ALU_CONTROLS[op]
+                changes = self.alu_changes(op, a, b, carry) + [(self.flag_we, int(control.flags))]
+                changes += set_bits(self.dest, dest) + [(self.reg_we, int(control.write and write))]
+            else:
+                changes = [(self.flag_we, 0), (self.reg_we, 0)]
+            return [self._phase("all", changes + pc_changes)]
+        stats = []
+        if op is not None:
+            stats.append(self._phase("alu", self.alu_changes(op, a, b, carry)))
+            stats += self.result_phases(op, self.alu_values(), dest, write)
+        if pc is not None:
+            stats.append(self._phase("pc", pc_changes))
+        return stats
+
+# ---------------- 操作数扫描 ----------------
+
+class SweepStats:
+    """一条指令在所有操作数组合下的事件统计。"""
+    def __init__(self, op: str, top: int = 10):
+        self.op = op
+        self.top = top
+        self.pairs = 0
+        self.max_events: dict[str, int] = {}
+        self.max_peak: dict[str, int] = {}
+        self.total_events: dict[str, int] = {}
+        self.histogram: dict[int, int] = {} # 最大阶段峰值深度 -> 组合数
+        self.worst: list[tuple[int, int, int, str]] = [] # (峰值深度, a, b, 阶段)，降序
+
+    def add(self, a: int, b: int, stats: list[PhaseStats]):
+        self.pairs += 1
+        worst_peak = -1
+        worst_phase = ""
+        for s in stats:
+            if s.events > self.max_events.get(s.phase, -1):
+                self.max_events[s.phase] = s.events
+            if s.peak > self.max_peak.get(s.phase, -1):
+                self.max_peak[s.phase] = s.peak
+            self.total_events[s.phase] = self.total_events.get(s.phase, 0) + s.events
+            if s.peak > worst_peak:
+                worst_peak = s.peak
+                worst_phase = s.phase
+        self.histogram[worst_peak] = self.histogram.get(worst_peak, 0) + 1
+        if len(self.worst) < self.top or worst_peak > self.worst[-1][0]:
+            self.worst.append((worst_peak, a, b, worst_phase))
+            self.worst.sort(key=lambda item: -item[0])
+            del self.worst[self.top:]
+
+    def merge(self, other: "SweepStats"):
+        self.pairs += other.pairs
+        for phase, value in other.max_events.items():
+            self.max_events[phase] = max(self.max_events.get(phase, 0), value)
+        for phase, value in other.max_peak.items():
+            self.max_peak[phase] = max(self.max_peak.get(phase, 0), value)
+        for phase, value in other.total_events.items():
+            self.total_events[phase] = self.total_events.get(phase, 0) + value
+        for peak, count in other.histogram.items():
+            self.histogram[peak] = self.histogram.get(peak, 0) + count
+        self.worst = sorted(self.worst + other.worst, key=lambda item: -item[0])[:self.top]
+
+    def count_at_least(self, peak: int) -> int:
+        """最大阶段峰值深度不小于peak的操作数组合数。"""
+        return sum(count for value, count in self.histogram.items() if value >= peak)
+
+class SweepConfig(NamedTuple):
+    zf_style: str = "tree"
+    split_phases: bool = True
+    limit: int = EVENT_QUEUE_LIMIT
+    prev: Optional[tuple[int, int]] = (0, 0) # 扫描前的操作数。None表示每组的前一状态为其按位取反(最坏情况)
+    carry: int = 0
+    top: int = 10
+
+def sweep_rows(op: str, rows: list[int], config: SweepConfig) -> SweepStats:
+    """扫描a在rows中、b为0..255的所有操作数组合。每组都从相同的前一状态开始。"""
+    sim = DatapathSim(config.zf_style, config.split_phases, config.limit)
+    if config.prev is not None:
+        sim.step(op, config.prev[0], config.prev[1], carry=config.carry)
+    base = sim.snapshot()
+    stats = SweepStats(op, config.top)
+    # 前一状态固定时，AF与写回阶段的结果只取决于ALU阶段的输出，可以缓存
+    cache: dict[tuple[int, ...], list[PhaseStats]] = {}
+    memo = config.split_phases and config.prev is not None
+    for a in rows:
+        for b in range(0x100):
+            sim.restore(base)
+            if config.prev is None:
+                sim.step(op, ~a & 0xFF, ~b & 0xFF, carry=config.carry)
+            if not memo:
+                stats.add(a, b, sim.step(op, a, b, carry=config.carry))
+                continue
+            alu = sim._phase("alu", sim.alu_changes(op, a, b, config.carry))
+            values = sim.alu_values()
+            rest = cache.get(values)
+            if rest is None:
+                rest = sim.result_phases(op, values)
+                cache[values] = rest
+            stats.add(a, b, [alu] + rest)
+    return stats
+
+def _sweep_task(task: tuple[str, list[int], SweepConfig]) -> SweepStats:
+    return sweep_rows(*task)
+
+def sweep(ops: list[str], config: SweepConfig = SweepConfig(), jobs: Optional[int] = None) -> list[SweepStats]:
+    """
+    对每条指令扫描全部65536组8位操作数，使用进程池并行。
+
+    :return: 与ops顺序一致的统计
+    """
+    chunks = 16
+    tasks = [(op, list(range(i, 0x100, chunks)), config) for op in ops for i in range(chunks)]
+    if jobs == 1:
+        parts = [_sweep_task(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            parts = list(executor.map(_sweep_task, tasks))
+    results = []
+    for i, op in enumerate(ops):
+        merged = SweepStats(op, config.top)
+        for part in parts[i * chunks:(i + 1) * chunks]:
+            merged.merge(part)
+        results.append(merged)
+    return results
+
+def out_sweep(results: list[SweepStats], limit: int, warn: int) -> str:
+    phases = [phase for phase in DatapathSim.PHASES + ("all",) if any(phase in r.max_peak for r in results)]
+    string = "  指令    " + "".join(f"{phase + '峰值':>12}" for phase in phases)
+    string += f"{'平均事件':>10}{'≥' + str(warn):>8}{'>' + str(limit):>8}\n"
+    for r in results:
+        mean = sum(r.total_events.values()) / r.pairs if r.pairs else 0
+        string += f"  {r.op:<8}" + "".join(f"{r.max_peak.get(phase, 0):>14}" for phase in phases)
+        string += f"{mean:>14.1f}{r.count_at_least(warn):>9}{r.count_at_least(limit + 1):>9}\n"
+    for r in results:
+        if not r.worst:
+            continue
+        string += f"\n{r.op} 队列峰值最高的操作数组合:\n"
+        for peak, a, b, phase in r.worst:
+            mark = "!" if peak >= warn else " "
+            string += f" {mark}a={a:#04x} b={b:#04x}  {phase}阶段峰值 {peak}\n"
+    return string
+
+# ---------------- 程序跟踪 ----------------
+
+# 指令头(高5位) -> (指令名, 长度)。PAUSE/NOP不经过数据通路，指令名为None
+HEAD_TABLE: dict[int, tuple[Optional[str], int]] = {
+    head: (spec.name if spec.writes_dest or spec.name == "CMP" else None, spec.length)
+    for head, spec in ((head, isa.DECODE_TABLE[head << 3]) for head in range(32))
+}
+
+class DecodedStep(NamedTuple):
+    op: Optional[str]
+    a: int
+    b: int
+    dest: int
+    write: bool
+    length: int
+
+def decode_step(d0: int, d1: int, d2: int, registers: list[int]) -> DecodedStep:
+    """根据指令字节与执行前的寄存器，得到数据通路的输入。"""
+    op, length = HEAD_TABLE[d0 >> 3]
+    dest = d0 & 0b111
+    def value(v: int) -> int:
+        return registers[v & 0b111] if v & 0b1000 else v
+    if op is None:
+        return DecodedStep(None, 0, 0, dest, False, length)
+    if op in ("MOVZ", "MOVN"):
+        cond = value(d1 & 0b1111)
+        return DecodedStep(op, registers[dest], value(d1 >> 4), dest, (cond == 0) == (op == "MOVZ"), length)
+    if op in ("MOVLZ", "MOVLN"):
+        cond = value(d2 >> 4)
+        return DecodedStep(op, registers[dest], d1, dest, (cond == 0) == (op == "MOVLZ"), length)
+    if op in ("INC", "DEC"):
+        return DecodedStep(op, registers[dest], 1, dest, True, length)
+    if op == "NOT":
+        return DecodedStep(op, value(d1 >> 4), 0, dest, True, length)
+    return DecodedStep(op, value(d1 >> 4), value(d1 & 0b1111), dest, True, length)
+
+class AddrStats:
+    """跟踪中一个指令地址的统计。"""
+    __slots__ = ("count", "max_peak", "max_events", "phase", "risky", "dropped", "prev")
+    def __init__(self):
+        self.count = 0
+        self.max_peak = 0
+        self.max_events = 0
+        self.phase = ""
+        self.risky = 0 # 峰值达到警告阈值的次数
+        self.dropped = 0 # 模拟丢弃时被丢弃的事件总数
+        self.prev: dict[int, int] = {} # 达到警告阈值时的前一条指令地址 -> 次数
+
+def trace(program: bytes, max_steps: int, sim: DatapathSim, warn: int) -> dict[int, AddrStats]:
+    """在虚拟机中执行程序，将每一步的实际操作数送入数据通路模拟器，按地址统计。"""
+    import vm
+    ctx = vm.Ctx_t()
+    ctx.load_program(program)
+    runner = vm.InstructionRunner(ctx)
+    result: dict[int, AddrStats] = {}
+    prev_addr = -1
+    for _ in range(max_steps):
+        registers = list(ctx.Registers)
+        runner.run_step()
+        ctx.Pause_signal = False
+        addr = runner.cur_addr
+        step = decode_step(runner.program_d0, runner.program_d1, runner.program_d2, registers)
+        stats = sim.step(step.op, step.a, step.b, step.dest, (registers[vm.AF] >> 1) & 1, step.write,
+                         pc=addr, length=step.length)
+        entry = result.get(addr)
+        if entry is None:
+            entry = result[addr] = AddrStats()
+        entry.count += 1
+        peak = max(stats, key=lambda s: s.peak)
+        entry.max_events = max(entry.max_events, sum(s.events for s in stats))
+        entry.dropped += sum(s.dropped for s in stats)
+        if peak.peak > entry.max_peak:
+            entry.max_peak = peak.peak
+            entry.phase = peak.phase
+        if peak.peak >= warn:
+            entry.risky += 1
+            entry.prev[prev_addr] = entry.prev.get(prev_addr, 0) + 1
+        prev_addr = addr
+    return result
+
+def out_trace(result: dict[int, AddrStats], warn: int, src_lines: list[str], lines: list[int]) -> str:
+    def where(addr: int) -> str:
+        if addr < len(lines) and lines[addr] < len(src_lines):
+            return f"{lines[addr] + 1:>4}| {src_lines[lines[addr]].strip()}"
+        return ""
+    string = """\
+  Addr   Count   Peak  Events  Phase      Risky
+┌──────┬───────┬──────┬───────┬──────────┬───────
+"""
+    for addr in sorted(result):
+        e = result[addr]
+        mark = "!" if e.risky else " "
+        string += f"│ {addr:>4} │{e.count:>6} │{e.max_peak:>5} │{e.max_events:>6} │ {e.phase:<9}│{e.risky:>6}{mark} {where(addr)}\n"
+    string += """\
+└──────┴───────┴──────┴───────┴──────────┴───────
+"""
+    dropped = sum(e.dropped for e in result.values())
+    if dropped:
+        string += f"共丢弃 {dropped} 个事件，涉及地址: {', '.join(str(addr) for addr in sorted(result) if result[addr].dropped)}\n"
+    risky = [(addr, e) for addr, e in result.items() if e.risky]
+    if not risky:
+        string += f"没有队列峰值达到 {warn} 的指令。\n"
+        return string
+    string += f"队列峰值达到 {warn} 的指令序列(前一条指令地址 -> 指令地址):\n"
+    for addr, e in sorted(risky, key=lambda item: -item[1].max_peak):
+        for prev, count in sorted(e.prev.items(), key=lambda item: -item[1]):
+            prev_text = f"{prev:>4}" if prev >= 0 else "开始"
+            string += f"  {prev_text} -> {addr:>4}  {count}次  {where(addr)}\n"
+    return string
+
+def load_program(path: str) -> tuple[bytes, list[int], list[str]]:
+    """读取汇编源文件、DZO文件或二进制文件。返回 字节码, 每字节的行号, 源代码行。"""
+    import dzo
+    if path.lower().endswith(".asm"):
+        import cp
+        with open(path, "r", encoding="utf-8") as f:
+            code = f.read()
+        result = cp.assemble(code, no_warn=True)
+        if result.has_error:
+            cp.print_diagnostics(result, code)
+            raise ValueError(f"{path} 编译失败")
+        return result.binary, result.lines, code.splitlines()
+    if dzo.is_object_file(path):
+        with dzo.ObjectFile.open(path) as obj:
+            source = obj.source()
+            return obj.rom, obj.lines(), source.splitlines() if source else []
+    with open(path, "rb") as f:
+        return f.read(), [], []
+
+def main():
+    parser = argparse.ArgumentParser(description="DZC-8M Plus Event Queue Simulator")
+    parser.add_argument("--zf", choices=("tree", "naive"), default="tree", help="ZF识别电路。tree为两级OR树，naive为8输入NOR。默认tree")
+    parser.add_argument("--single-cycle", action="store_true", help="不分时钟阶段，所有电路共用一个事件队列(DZC-8M)")
+    parser.add_argument("--limit", type=int, default=EVENT_QUEUE_LIMIT, help=f"事件队列容量。默认{EVENT_QUEUE_LIMIT}")
+    parser.add_argument("--warn", type=float, default=0.75, help="队列峰值达到容量的此比例时视为有风险。默认0.75")
+    parser.add_argument("--version", action="version", version=f"Eggy Event Queue Simulator\n{__version__}\nfor DZC-8M Plus Instruction Set")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("sweep", help="扫描指令的全部8位操作数组合")
+    p.add_argument("ops", nargs="*", help="要扫描的指令名。默认扫描所有经过ALU的指令")
+    p.add_argument("--prev", default="0,0", help="扫描前的操作数 a,b；或 complement 表示每组的前一状态为其按位取反。默认0,0")
+    p.add_argument("--carry", type=int, choices=(0, 1), default=0, help="ADDC/SUBB的进位输入。默认0")
+    p.add_argument("--top", type=int, default=10, help="显示峰值最高的操作数组合数量。默认10")
+    p.add_argument("-j", "--jobs", type=int, default=None, help="并行进程数。默认为CPU核心数")
+
+    p = sub.add_parser("trace", help="执行程序，按指令地址统计实际操作数下的事件与队列峰值")
+    p.add_argument("file", help="汇编源文件(.asm)、DZO文件或二进制文件")
+    p.add_argument("-n", "--max-steps", type=int, default=10000, help="执行的步数。默认10000")
+    p.add_argument("--drop", action="store_true", help="模拟队列满时丢弃事件")
+    args = parser.parse_args()
+
+    warn = max(1, int(args.limit * args.warn))
+    split = not args.single_cycle
+    if args.command == "sweep":
+        ops = [op.upper() for op in args.ops] or [op for op in ALU_CONTROLS if op not in ("MOVLZ", "MOVN", "MOVLN", "INC", "DEC")]
+        for op in ops:
+            if op not in ALU_CONTROLS:
+                parser.error(f"未知的指令: {op}")
+        if args.prev == "complement":
+            prev = None
+        else:
+            try:
+                prev = tuple(int(x, 0) & 0xFF for x in args.prev.split(","))
+            except ValueError:
+                parser.error(f"无效的--prev: {args.prev}")
+            if len(prev) != 2:
+                parser.error(f"无效的--prev: {args.prev}")
+        config = SweepConfig(args.zf, split, args.limit, prev, args.carry, args.top)
+        start = time.perf_counter()
+        results = sweep(ops, config, args.jobs)
+        print(out_sweep(results, args.limit, warn), end="")
+        print(f"共扫描 {sum(r.pairs for r in results)} 组操作数，用时 {time.perf_counter() - start:.2f}s")
+        return 1 if any(r.count_at_least(args.limit + 1) for r in results) else 0
+
+    try:
+        program, lines, src_lines = load_program(args.file)
+    except (OSError, ValueError) as e:
+        print(f"错误: {e}")
+        return 1
+    sim = DatapathSim(args.zf, split, args.limit, args.drop)
+    result = trace(program, args.max_steps, sim, warn)
+    print(out_trace(result, warn, src_lines, lines), end="")
+    return 1 if any(e.max_peak > args.limit for e in result.values()) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
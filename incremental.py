@@ -0,0 +1,252 @@
+"""
+增量编译模型，供编辑器集成使用(实时诊断、标记悬停提示、显示每行的字节地址等)。
+
+保存每一行的解析结果，编辑时只重新解析被修改的行(以及多行注释状态发生变化的后续行)，
+从第一处修改开始累加指令长度更新后续行的地址，并只重新检查引用了地址发生变化的标记的指令。
+编译结果与cp.assemble一致。
+
+与cp.remove_comments_preserve_lines的唯一区别：未闭合的 /* 视为注释直到文件末尾。
+"""
+from typing import Optional
+
+import cp
+
+class LineState:
+    """一行源代码的解析结果。"""
+    __slots__ = ("raw", "clean", "block_in", "block_out", "instruction", "length", "define",
+                 "refs", "warn", "local_error", "flag_error", "dup_error", "addr")
+    def __init__(self, raw: str, block_in: bool):
+        self.raw = raw
+        self.block_in = block_in # 行首是否处于多行注释中
+        self.clean, self.block_out = strip_line_comments(raw, block_in)
+        self.instruction: Optional[cp.Instruction] = None
+        self.length = 0 # 指令长度。非指令行或有错误的指令行为0
+        self.define: Optional[str] = None # 本行定义的标记
+        self.refs: tuple[str, ...] = () # 本行指令引用的标记
+        self.warn: Optional[str] = None
+        self.local_error: Optional[str] = None # 与标记无关的错误
+        self.flag_error: Optional[str] = None # 标记引用的错误，标记变化时重新检查
+        self.dup_error: Optional[str] = None # 重复定义标记的错误
+        self.addr = 0 # 本行起始地址
+
+    @property
+    def column(self) -> int:
+        return cp.get_line_column(self.clean)
+
+def strip_line_comments(line: str, in_block: bool) -> tuple[str, bool]:
+    """
+    移除一行中的注释。
+
+    :param in_block: 行首是否处于多行注释中
+    :return: 移除注释后的行, 行尾是否处于多行注释中
+    :rtype: tuple[str, bool]
+    """
+    out = []
+    pos = 0
+    while pos <= len(line):
+        if in_block:
+            end = line.find("*/", pos)
+            if end < 0:
+                pos = len(line) + 1
+                break
+            pos = end + 2
+            in_block = False
+        else:
+            start = line.find("/*", pos)
+            if start < 0:
+                out.append(line[pos:])
+                break
+            out.append(line[pos:start])
+            pos = start + 2
+            in_block = True
+    clean = "".join(out)
+    clean = cp.rematch_singleline_comments.sub(lambda m: m.group(1) or "", clean)
+    return clean, in_block
+
+class IncrementalAssembler:
+    """
+    增量编译器。行号均从0开始。
+
+    用法::
+
+        engine = IncrementalAssembler(code)
+        engine.edit(3, 4, ["    ADD R0, R0, 1"]) # 将第3行替换为新内容
+        engine.diagnostics()
+    """
+    def __init__(self, code: str = "", no_warn: bool = False):
+        self.no_warn = no_warn
+        self.lines: list[LineState] = []
+        self.flag_table: dict[str, int] = {} # 所有ConstArg共享此标记表
+        self.defines: dict[str, list[LineState]] = {} # 标记名 -> 定义该标记的行
+        self.references: dict[str, set[LineState]] = {} # 标记名 -> 引用该标记的行
+        self.set_text(code)
+
+    @property
+    def text(self) -> str:
+        return "\n".join(state.raw for state in self.lines)
+
+    def set_text(self, code: str):
+        self.lines = []
+        self.flag_table.clear()
+        self.defines.clear()
+        self.references.clear()
+        self.edit(0, 0, code.splitlines())
+
+    def _parse(self, state: LineState):
+        res = cp.parse_instruction(state.clean, self.flag_table)
+        if res.warn is not None and not self.no_warn:
+            state.warn = res.warn
+        base = res.base
+        if base is None:
+            return
+        if isinstance(base, str):
+            state.local_error = base
+        elif isinstance(base, cp.Flag):
+            state.define = base.name
+        elif isinstance(base, cp.Export):
+            pass # 导出只影响可重定位编译
+        else:
+            state.local_error = base.check_args(check_flags=False)
+            if state.local_error is None:
+                state.instruction = base
+                state.length = base.len
+                state.refs = tuple({arg.flag_name for arg in base.args
+                                    if isinstance(arg, cp.ConstArg) and arg.flag_name is not None})
+
+    def _register(self, state: LineState):
+        if state.define is not None:
+            self.defines.setdefault(state.define, []).append(state)
+        for name in state.refs:
+            self.references.setdefault(name, set()).add(state)
+
+    def _unregister(self, state: LineState):
+        if state.define is not None:
+            defines = self.defines[state.define]
+            defines.remove(state)
+            if not defines:
+                del self.defines[state.define]
+        for name in state.refs:
+            refs = self.references[name]
+            refs.discard(state)
+            if not refs:
+                del self.references[name]
+
+    def _check_flags(self, state: LineState):
+        instruction = state.instruction
+        if instruction is None:
+            return
+        state.flag_error = instruction.check_args()
+        if state.flag_error is None:
+            try:
+                instruction.parse_bin()
+            except Exception as e:
+                state.flag_error = str(e)
+
+    def _resolve(self, name: str) -> bool:
+        """重新确定标记的地址与重复定义错误。返回标记地址是否发生变化。"""
+        defines = self.defines.get(name, [])
+        if len(defines) > 1:
+            # 行号最小的定义有效，其余为重复定义
+            order = {id(state): i for i, state in enumerate(self.lines) if state.define == name}
+            defines.sort(key=lambda state: order[id(state)])
+        for i, state in enumerate(defines):
+            state.dup_error = f"重复的标记 '{name}'" if i > 0 else None
+        old = self.flag_table.get(name)
+        if defines:
+            self.flag_table[name] = defines[0].addr
+        else:
+            self.flag_table.pop(name, None)
+        return self.flag_table.get(name) != old
+
+    def edit(self, start: int, end: int, new_lines: list[str]):
+        """
+        将[start, end)行替换为new_lines。
+
+        :param start: 起始行号，从0开始
+        :param end: 结束行号(不含)
+        :param new_lines: 新的行内容，不含换行符
+        """
+        old_states = self.lines[start:end]
+        block_in = self.lines[start - 1].block_out if start > 0 else False
+        new_states: list[LineState] = []
+        for raw in new_lines:
+            state = LineState(raw, block_in)
+            block_in = state.block_out
+            new_states.append(state)
+        self.lines[start:end] = new_states
+        # 多行注释状态变化时，继续重新处理后续行直到状态一致
+        stop = start + len(new_states)
+        while stop < len(self.lines) and self.lines[stop].block_in != block_in:
+            old_states.append(self.lines[stop])
+            state = LineState(self.lines[stop].raw, block_in)
+            block_in = state.block_out
+            new_states.append(state)
+            self.lines[stop] = state
+            stop += 1
+
+        affected: set[str] = set()
+        for state in old_states:
+            self._unregister(state)
+            if state.define is not None:
+                affected.add(state.define)
+        for state in new_states:
+            self._parse(state)
+            self._register(state)
+            if state.define is not None:
+                affected.add(state.define)
+
+        # 从第一处修改开始更新地址。后续行只在长度总和变化时平移
+        addr = self.lines[start - 1].addr + self.lines[start - 1].length if start > 0 else 0
+        for state in self.lines[start:stop]:
+            state.addr = addr
+            addr += state.length
+        delta = addr - (self.lines[stop].addr if stop < len(self.lines) else addr)
+        if delta:
+            for state in self.lines[stop:]:
+                state.addr += delta
+                if state.define is not None:
+                    affected.add(state.define)
+
+        # 只重新检查引用了变化标记的指令
+        recheck: set[LineState] = set(new_states)
+        for name in affected:
+            if self._resolve(name):
+                recheck.update(self.references.get(name, ()))
+        for state in recheck:
+            self._check_flags(state)
+
+    def address_of(self, line: int) -> int:
+        """获取行的起始地址。"""
+        return self.lines[line].addr
+
+    def line_of_label(self, name: str) -> Optional[int]:
+        """获取有效的标记定义所在行。"""
+        defines = self.defines.get(name)
+        return self.lines.index(defines[0]) if defines else None
+
+    def label_address(self, name: str) -> Optional[int]:
+        return self.flag_table.get(name)
+
+    def diagnostics(self) -> list[cp.Diagnostic]:
+        """与cp.assemble相同顺序的诊断信息。"""
+        result: list[cp.Diagnostic] = []
+        for line_number, state in enumerate(self.lines, start=1):
+            if state.warn is not None:
+                result.append(cp.Diagnostic(line_number, state.column, cp.SEVERITY_WARNING, state.warn))
+            error = state.local_error or state.dup_error or state.flag_error
+            if error is not None:
+                result.append(cp.Diagnostic(line_number, state.column, cp.SEVERITY_ERROR, error))
+        return result
+
+    def assemble(self) -> cp.AssembleResult:
+        """根据已解析的行生成完整的编译结果。"""
+        result = cp.AssembleResult()
+        result.flag_table = dict(self.flag_table)
+        result.diagnostics = self.diagnostics()
+        for line_number, state in enumerate(self.lines):
+            if state.instruction is None or state.flag_error is not None:
+                continue
+            bin_inst = state.instruction.parse_bin()
+            result.bin_code.append((bin_inst, state.instruction.get_literal()))
+            result.lines.extend([line_number] * len(bin_inst))
+        return result
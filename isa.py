@@ -0,0 +1,214 @@
+"""
+DZC-8M Plus 指令集的唯一描述。
+
+编译器(cp.py)的OpEnum、指令格式与编码，虚拟机(vm.py)的指令分派，以及反汇编器，均由本模块的ISA表导出。
+修改指令集时只需修改ISA表。
+
+指令首字节的高5位为指令头。fixed为False的指令，指令头最低位在编码中为x，不参与区分。
+操作数格式中 R: 寄存器(字节低3位), V: 值(4位字段，1xxx为寄存器，0yyy为3位常量), C: 8位常量(整个字节)。
+"""
+import sys
+from typing import Iterator, NamedTuple, Optional
+
+import argparse
+
+__version__ = "0.1.0"
+
+REGISTER_NAMES = ("PC", "AF", "SP", "IO", "R0", "R1", "R2", "R3")
+
+# 操作数字段的位置
+FIELD_REG = "reg" # 字节低3位，寄存器编号
+FIELD_HI = "hi" # 字节高4位，值字段
+FIELD_LO = "lo" # 字节低4位，值字段
+FIELD_BYTE = "byte" # 整个字节，8位常量
+
+# 参数格式 -> 各操作数的 (字节偏移, 字段位置)
+FORMS: dict[str, tuple[tuple[int, str], ...]] = {
+    "":    (),
+    "R":   ((0, FIELD_REG),),
+    "RV":  ((0, FIELD_REG), (1, FIELD_HI)),
+    "VV":  ((1, FIELD_HI), (1, FIELD_LO)),
+    "RVV": ((0, FIELD_REG), (1, FIELD_HI), (1, FIELD_LO)),
+    "RCV": ((0, FIELD_REG), (1, FIELD_BYTE), (2, FIELD_HI)),
+}
+
+def form_length(form: str) -> int:
+    """参数格式对应的指令长度。"""
+    return max((offset for offset, _ in FORMS[form]), default=0) + 1
+
+class OpSpec(NamedTuple):
+    """一条指令的描述。"""
+    name: str
+    head: int # 指令头(首字节高5位)
+    form: str # 参数格式，见FORMS
+    fixed: bool # 指令头最低位是否参与区分
+    flags: bool # 是否设置AF符号位
+
+    @property
+    def opcode(self) -> int:
+        """首字节中的操作码部分。"""
+        return self.head << 3
+
+    @property
+    def length(self) -> int:
+        return form_length(self.form)
+
+    @property
+    def writes_dest(self) -> bool:
+        """第一个操作数是否为目标寄存器。"""
+        return self.form.startswith("R")
+
+ISA: tuple[OpSpec, ...] = (
+    OpSpec("PAUSE", 0b00000, "",    False, False),
+    OpSpec("NOP",   0b00010, "",    False, False),
+    OpSpec("MOVZ",  0b00100, "RVV", True,  False),
+    OpSpec("MOVLZ", 0b00101, "RCV", True,  False),
+    OpSpec("MOVN",  0b00110, "RVV", True,  False),
+    OpSpec("MOVLN", 0b00111, "RCV", True,  False),
+    OpSpec("ADD",   0b01000, "RVV", False, True),
+    OpSpec("SUB",   0b01010, "RVV", False, True),
+    OpSpec("ADDC",  0b01100, "RVV", False, True),
+    OpSpec("SUBB",  0b01110, "RVV", False, True),
+    OpSpec("INC",   0b10000, "R",   True,  True),
+    OpSpec("DEC",   0b10001, "R",   True,  True),
+    OpSpec("CMP",   0b10010, "VV",  False, True),
+    OpSpec("NOT",   0b10100, "RV",  False, False),
+    OpSpec("AND",   0b10110, "RVV", False, False),
+    OpSpec("OR",    0b11000, "RVV", False, False),
+    OpSpec("XOR",   0b11010, "RVV", False, False),
+    OpSpec("SHL",   0b11100, "RVV", False, False),
+    OpSpec("SHR",   0b11110, "RVV", False, False),
+)
+
+OPS: dict[str, OpSpec] = {spec.name: spec for spec in ISA}
+
+def _build_decode_table() -> tuple[OpSpec, ...]:
+    heads: dict[int, OpSpec] = {}
+    for spec in ISA:
+        for head in ((spec.head,) if spec.fixed else (spec.head, spec.head | 1)):
+            if head in heads:
+                raise ValueError(f"指令头 {head:05b} 同时属于 {heads[head].name} 和 {spec.name}")
+            heads[head] = spec
+    missing = [f"{head:05b}" for head in range(32) if head not in heads]
+    if missing:
+        raise ValueError(f"指令头没有对应的指令: {', '.join(missing)}")
+    return tuple(heads[byte >> 3] for byte in range(0x100))
+
+# 首字节 -> 指令描述。解码只需一次下标访问
+DECODE_TABLE: tuple[OpSpec, ...] = _build_decode_table()
+# 首字节 -> 指令长度
+LENGTH_TABLE: bytes = bytes(spec.length for spec in DECODE_TABLE)
+
+Operand = tuple[str, int] # ("R", 寄存器编号) 或 ("C", 常量值)
+
+def pack_value(operand: Operand) -> int:
+    kind, value = operand
+    return 0b1000 | (value & 0b111) if kind == "R" else value & 0b111
+
+def unpack_value(field: int) -> Operand:
+    return ("R", field & 0b111) if field & 0b1000 else ("C", field & 0b111)
+
+def encode(spec: OpSpec, operands: list[Operand]) -> bytes:
+    """
+    将指令编码为字节码。操作数的种类与取值范围须事先检查。
+
+    :param operands: 与spec.form对应的操作数
+    """
+    out = bytearray(spec.length)
+    out[0] = spec.opcode
+    for (offset, field), operand in zip(FORMS[spec.form], operands):
+        if field == FIELD_REG:
+            out[offset] |= operand[1] & 0b111
+        elif field == FIELD_HI:
+            out[offset] |= pack_value(operand) << 4
+        elif field == FIELD_LO:
+            out[offset] |= pack_value(operand)
+        else:
+            out[offset] = operand[1] & 0xFF
+    return bytes(out)
+
+class Decoded(NamedTuple):
+    spec: OpSpec
+    operands: tuple[Operand, ...]
+
+    def __str__(self) -> str:
+        return format_instruction(self)
+
+def decode(d0: int, d1: int = 0, d2: int = 0) -> Decoded:
+    """解码一条指令。d1, d2为后续字节，指令长度不足时被忽略。"""
+    spec = DECODE_TABLE[d0]
+    data = (d0, d1, d2)
+    operands = []
+    for offset, field in FORMS[spec.form]:
+        byte = data[offset]
+        if field == FIELD_REG:
+            operands.append(("R", byte & 0b111))
+        elif field == FIELD_HI:
+            operands.append(unpack_value(byte >> 4))
+        elif field == FIELD_LO:
+            operands.append(unpack_value(byte))
+        else:
+            operands.append(("C", byte))
+    return Decoded(spec, tuple(operands))
+
+def format_operand(operand: Operand) -> str:
+    kind, value = operand
+    return REGISTER_NAMES[value] if kind == "R" else str(value)
+
+def format_instruction(decoded: Decoded) -> str:
+    """格式化为汇编代码，如 ADD R0, R1, 3。"""
+    if not decoded.operands:
+        return decoded.spec.name
+    return f"{decoded.spec.name} {', '.join(format_operand(op) for op in decoded.operands)}"
+
+def decode_at(program, addr: int, size: Optional[int] = None) -> Decoded:
+    """从程序存储区的addr处解码。地址按size取模，默认为len(program)。"""
+    size = size or len(program)
+    return decode(program[addr % size], program[(addr + 1) % size], program[(addr + 2) % size])
+
+def disassemble(program: bytes, start: int = 0, end: Optional[int] = None) -> Iterator[tuple[int, bytes, Decoded]]:
+    """
+    顺序反汇编。末尾不完整的指令按缺失字节为0解码。
+
+    :return: (地址, 指令字节, 解码结果) 迭代器
+    """
+    end = len(program) if end is None else min(end, len(program))
+    addr = start
+    while addr < end:
+        length = LENGTH_TABLE[program[addr]]
+        data = program[addr:addr + length]
+        padded = bytes(data) + bytes(3 - len(data))
+        yield addr, bytes(data), decode(padded[0], padded[1], padded[2])
+        addr += length
+
+def out_listing(program: bytes, start: int = 0, end: Optional[int] = None) -> str:
+    string = """\
+  Addr  Bytes       ASM
+┌─────┬───────────┬──────────────────────
+"""
+    for addr, data, decoded in disassemble(program, start, end):
+        string += f"│{addr:>4} │ {data.hex(' '):<9} │ {decoded}\n"
+    string += """\
+└─────┴───────────┴──────────────────────
+"""
+    return string
+
+def main():
+    parser = argparse.ArgumentParser(description="DZC-8M Disassembler")
+    parser.add_argument("file", help="二进制字节码文件或DZO文件")
+    parser.add_argument("-s", "--start", type=lambda s: int(s, 0), default=0, help="起始地址。默认0")
+    parser.add_argument("-e", "--end", type=lambda s: int(s, 0), default=None, help="结束地址(不含)。默认到文件末尾")
+    parser.add_argument("--version", action="version", version=f"Eggy Disassembler\n{__version__}\nfor DZC-8M Plus Instruction Set")
+    args = parser.parse_args()
+    import dzo
+    if dzo.is_object_file(args.file):
+        with dzo.ObjectFile.open(args.file) as obj:
+            program = obj.rom
+    else:
+        with open(args.file, "rb") as f:
+            program = f.read()
+    print(out_listing(program, args.start, args.end), end="")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,407 @@
+import os, sys
+from typing import Callable, Optional
+
+import argparse
+
+import cp
+import dzo
+import isa
+
+__version__ = "0.1.0"
+
+ROM_SIZE = 0xFF # 程序存储区大小
+MAX_BANKS = 16 # bank编号由IO写入值的低4位给出
+BANK_SELECT = 0xF0 # 向IO写入 BANK_SELECT | n，下一次写入PC时切换到bank n
+STUB_SIZE = 6 # 跨bank跳板: MOVLZ IO, 0xFn, 0; MOVLZ PC, addr, 0
+
+class LinkModule:
+    """参与链接的一个可重定位模块。"""
+    def __init__(self, name: str, rom: bytes, symbols: dict[str, int], relocations: list[tuple[int, int, str, int]],
+                 lines: list[int], source: Optional[str], exports: Optional[set[str]] = None):
+        self.name = name
+        self.rom = rom
+        self.symbols = symbols # 本模块定义的所有标记
+        self.exports = set(symbols) if exports is None else exports # 对外导出的标记，其余标记只在本模块内可见
+        self.relocations = relocations
+        self.lines = lines
+        self.source = source
+        self.base = 0 # 链接后的起始地址(bank内)
+        self.bank = 0 # 所在bank
+
+    @classmethod
+    def from_object(cls, name: str, obj: dzo.ObjectFile) -> "LinkModule":
+        if not obj.is_relocatable:
+            raise dzo.DZOFormatException(f"{name} 不是可重定位目标文件，请使用 cp.py -c 生成")
+        exports = obj.symbols()
+        return cls(name, obj.rom, {**obj.local_symbols(), **exports}, obj.relocations(), obj.lines(), obj.source(),
+                   set(exports))
+
+    @classmethod
+    def from_result(cls, name: str, result: cp.AssembleResult, code: str) -> "LinkModule":
+        return cls(name, result.binary, dict(result.flag_table), list(result.relocations), list(result.lines), code,
+                   set(result.exports))
+
+    @property
+    def stem(self) -> str:
+        return os.path.splitext(os.path.basename(self.name))[0]
+
+class LinkResult:
+    """link的链接结果。"""
+    def __init__(self):
+        self.binary = bytearray()
+        self.symbols: dict[str, int] = {} # 全局标记表，导出的标记名 -> 最终地址
+        self.local_symbols: dict[str, int] = {} # 未导出的标记，模块名.标记名 -> 最终地址，仅用于调试信息
+        self.lines: list[int] = [] # 每字节对应的合并后源代码行号
+        self.source = "" # 各模块源代码按顺序拼接
+        self.modules: list[LinkModule] = []
+        self.errors: list[str] = []
+        self.bank_usage: list[tuple[int, int]] = [] # 每个bank的 (代码字节数, 跳板字节数)，仅bank链接时有效
+        self.stubs: dict[tuple[int, str], int] = {} # (bank, 目标标记) -> 跳板地址(bank内)
+    @property
+    def has_error(self) -> bool:
+        return bool(self.errors)
+
+def patch_field(rom: bytearray, offset: int, kind: int, value: int):
+    """将value写入rom中offset处的重定位字段。值的范围必须事先检查。"""
+    if kind == cp.RELOC_BYTE:
+        rom[offset] = value & 0xFF
+    elif kind == cp.RELOC_HI3:
+        rom[offset] = (rom[offset] & 0b10001111) | ((value & 0b111) << 4)
+    elif kind == cp.RELOC_LO3:
+        rom[offset] = (rom[offset] & 0b11111000) | (value & 0b111)
+    else:
+        raise dzo.DZOFormatException(f"未知的重定位类型: {kind}")
+
+def collect_symbols(result: LinkResult, address: Callable[[LinkModule, int], int]) -> dict[str, LinkModule]:
+    """
+    建立全局标记表与调试用的本地标记表。只有导出的标记进入全局标记表，不同模块中的同名本地标记互不冲突。
+
+    :param address: (模块, 模块内地址) -> 最终地址
+    :return: 导出的标记名 -> 定义它的模块
+    """
+    exported_by: dict[str, LinkModule] = {}
+    for module in result.modules:
+        for name, sym_addr in module.symbols.items():
+            if name not in module.exports:
+                result.local_symbols[f"{module.stem}.{name}"] = address(module, sym_addr)
+            elif name in exported_by:
+                result.errors.append(f"重复的标记 '{name}'，在 {exported_by[name].name} 和 {module.name} 中均有导出")
+            else:
+                exported_by[name] = module
+                result.symbols[name] = address(module, sym_addr)
+    return exported_by
+
+def resolve(module: LinkModule, name: str, exported_by: dict[str, LinkModule]) -> Optional[LinkModule]:
+    """模块中的标记引用指向的模块。本模块定义的标记(无论是否导出)优先于其他模块导出的标记。"""
+    return module if name in module.symbols else exported_by.get(name)
+
+def undefined_error(where: str, name: str, modules: list[LinkModule]) -> str:
+    hidden = next((module for module in modules if name in module.symbols), None)
+    hint = f"，{hidden.name} 中定义了该标记但未导出，请在其中添加 {cp.EXPORT_DIRECTIVE} {name}" if hidden else ""
+    return f"{where}: 标记未定义: {name}{hint}"
+
+def link(modules: list[LinkModule], rom_size: int = ROM_SIZE) -> LinkResult:
+    """
+    按顺序放置各模块，解析跨模块的标记引用，并检查结果能否放入ROM。
+
+    :param modules: 可重定位模块，按放置顺序排列。第一个模块从地址0开始执行
+    :type modules: list[LinkModule]
+    :return: 链接结果。存在错误时binary不可用
+    :rtype: LinkResult
+    """
+    result = LinkResult()
+    result.modules = modules
+    # 放置模块，建立全局标记表
+    addr = 0
+    for module in modules:
+        module.base = addr
+        addr += len(module.rom)
+    exported_by = collect_symbols(result, lambda module, sym_addr: module.base + sym_addr)
+    if addr > rom_size:
+        result.errors.append(f"程序大小 {addr} 字节，超出ROM容量 {rom_size} 字节")
+    # 合并字节码、行号与源代码
+    line_base = 0
+    sources: list[str] = []
+    for module in modules:
+        result.binary += module.rom
+        result.lines.extend(line + line_base for line in module.lines)
+        src_lines = (module.source or "").splitlines()
+        sources.extend(src_lines)
+        line_base += len(src_lines)
+    result.source = "\n".join(sources)
+    # 重定位
+    for module in modules:
+        for offset, kind, name, line in module.relocations:
+            where = f"{module.name}:{line + 1}"
+            target = resolve(module, name, exported_by)
+            if target is None:
+                result.errors.append(undefined_error(where, name, modules))
+                continue
+            value = target.base + target.symbols[name]
+            max_value = 0xFF if kind == cp.RELOC_BYTE else 0b111
+            if value > max_value:
+                result.errors.append(f"{where}: 标记 '{name}' 的地址 {value} 超出范围[0, {max_value}]"
+                                     + ("，请改用 MOVLZ/MOVLN" if kind != cp.RELOC_BYTE else ""))
+                continue
+            patch_field(result.binary, module.base + offset, kind, value)
+    return result
+
+_RELOC_FIELDS = {cp.RELOC_BYTE: isa.FIELD_BYTE, cp.RELOC_HI3: isa.FIELD_HI, cp.RELOC_LO3: isa.FIELD_LO}
+_MOVE_OPS = ("MOVZ", "MOVN", "MOVLZ", "MOVLN")
+
+def is_jump_reference(rom: bytes, offset: int, kind: int) -> bool:
+    """
+    判断rom中offset处的标记引用是否为直接跳转目标，即 MOV* PC, 标记, 条件 中的标记。
+    只有直接跳转可以经由跳板跨bank，其他引用(如保存返回地址)的值在另一个bank中没有意义。
+    """
+    addr = 0
+    while addr <= offset:
+        length = isa.LENGTH_TABLE[rom[addr]]
+        if offset < addr + length:
+            spec = isa.DECODE_TABLE[rom[addr]]
+            if spec.name not in _MOVE_OPS or rom[addr] & 0b111 != isa.REGISTER_NAMES.index("PC"):
+                return False
+            # 第二个操作数为写入的值，第三个为条件
+            return isa.FORMS[spec.form][1] == (offset - addr, _RELOC_FIELDS[kind])
+        addr += length
+    return False
+
+def jump_targets(module: LinkModule) -> set[str]:
+    """模块中作为直接跳转目标引用的、其他模块导出的标记。"""
+    return {name for offset, kind, name, _ in module.relocations
+            if name not in module.symbols and is_jump_reference(module.rom, offset, kind)}
+
+def assign_banks(modules: list[LinkModule], max_banks: int, bank_size: int = ROM_SIZE) -> list[str]:
+    """
+    按顺序将模块依次放入bank，放不下时换到下一个bank。模块不会被拆分。
+    每个bank末尾为跳板预留空间：bank内所有模块跳转到的、本bank中没有模块导出的标记各一个跳板，是实际需要的上限。
+
+    :return: 错误信息
+    """
+    errors: list[str] = []
+    targets = {id(module): jump_targets(module) for module in modules}
+    bank = 0
+    code_size = 0
+    jumps: set[str] = set()
+    defined: set[str] = set()
+    for module in modules:
+        new_jumps = jumps | targets[id(module)]
+        new_defined = defined | module.exports
+        new_size = code_size + len(module.rom)
+        if code_size > 0 and new_size + STUB_SIZE * len(new_jumps - new_defined) > bank_size:
+            bank += 1
+            new_jumps = set(targets[id(module)])
+            new_defined = set(module.exports)
+            new_size = len(module.rom)
+        if new_size + STUB_SIZE * len(new_jumps - new_defined) > bank_size:
+            errors.append(f"模块 {module.name} 大小 {len(module.rom)} 字节，加上跳板后无法放入一个 {bank_size} 字节的bank")
+        module.bank = bank
+        module.base = new_size - len(module.rom)
+        code_size, jumps, defined = new_size, new_jumps, new_defined
+    if bank + 1 > max_banks:
+        errors.append(f"程序需要 {bank + 1} 个bank，超出限制 {max_banks} 个")
+    return errors
+
+def link_banked(modules: list[LinkModule], max_banks: int, bank_size: int = ROM_SIZE) -> LinkResult:
+    """
+    将模块放入多个bank并链接。全局标记表中的地址为 bank * bank_size + bank内地址。
+
+    跨bank的直接跳转改为跳到本bank末尾的跳板，跳板向IO写入 BANK_SELECT | 目标bank 后跳转，会修改IO寄存器。
+    除最后一个bank外，各bank以0填充到bank_size字节，虚拟机按bank_size拆分。
+
+    :param max_banks: 最多使用的bank数，不超过MAX_BANKS
+    :return: 链接结果。存在错误时binary不可用
+    """
+    result = LinkResult()
+    result.modules = modules
+    result.errors = assign_banks(modules, max_banks, bank_size)
+    exported_by = collect_symbols(result, lambda module, sym_addr: module.bank * bank_size + module.base + sym_addr)
+    bank_count = modules[-1].bank + 1 if modules else 1
+    # 为跨bank跳转分配跳板
+    code_end = [0] * bank_count
+    for module in modules:
+        code_end[module.bank] = module.base + len(module.rom)
+    stub_count = [0] * bank_count
+    for module in modules:
+        for offset, kind, name, _ in module.relocations:
+            target = resolve(module, name, exported_by)
+            if target is None or target.bank == module.bank or (module.bank, name) in result.stubs:
+                continue
+            if is_jump_reference(module.rom, offset, kind):
+                result.stubs[(module.bank, name)] = code_end[module.bank] + STUB_SIZE * stub_count[module.bank]
+                stub_count[module.bank] += 1
+    # 合并字节码、行号与源代码。跳板与填充生成对应的源代码行
+    banks = [bytearray() for _ in range(bank_count)]
+    bank_lines: list[list[int]] = [[] for _ in range(bank_count)]
+    sources: list[str] = []
+    for module in modules:
+        src_lines = (module.source or "").splitlines()
+        banks[module.bank] += module.rom
+        bank_lines[module.bank].extend(line + len(sources) for line in module.lines)
+        sources.extend(src_lines)
+    movlz = isa.OPS["MOVLZ"]
+    for (bank, name), stub_addr in sorted(result.stubs.items(), key=lambda item: item[1]):
+        target_bank, target_addr = divmod(result.symbols[name], bank_size)
+        for reg, value, text in ((isa.REGISTER_NAMES.index("IO"), BANK_SELECT | target_bank,
+                                  f"    MOVLZ IO, {BANK_SELECT | target_bank}, 0 // 跳板: bank {bank} -> {name}"),
+                                 (isa.REGISTER_NAMES.index("PC"), target_addr, f"    MOVLZ PC, {target_addr}, 0")):
+            code = isa.encode(movlz, [("R", reg), ("C", value), ("C", 0)])
+            banks[bank] += code
+            bank_lines[bank].extend([len(sources)] * len(code))
+            sources.append(text)
+    for bank in range(bank_count):
+        result.bank_usage.append((code_end[bank], STUB_SIZE * stub_count[bank]))
+        if len(banks[bank]) > bank_size:
+            result.errors.append(f"bank {bank} 大小 {len(banks[bank])} 字节，超出容量 {bank_size} 字节")
+        if bank + 1 < bank_count and len(banks[bank]) < bank_size:
+            padding = bank_size - len(banks[bank])
+            banks[bank] += bytes(padding)
+            bank_lines[bank].extend([len(sources)] * padding)
+            sources.append(f"// bank {bank} 填充 {padding} 字节")
+        result.binary += banks[bank]
+        result.lines.extend(bank_lines[bank])
+    result.source = "\n".join(sources)
+    # 重定位
+    for module in modules:
+        for offset, kind, name, line in module.relocations:
+            where = f"{module.name}:{line + 1}"
+            target = resolve(module, name, exported_by)
+            if target is None:
+                result.errors.append(undefined_error(where, name, modules))
+                continue
+            target_bank, value = target.bank, target.base + target.symbols[name]
+            if target_bank != module.bank:
+                stub = result.stubs.get((module.bank, name))
+                if stub is None or not is_jump_reference(module.rom, offset, kind):
+                    result.errors.append(f"{where}: 标记 '{name}' 位于bank {target_bank}，"
+                                         f"bank {module.bank} 中只能通过 MOV* PC 直接跳转到该标记")
+                    continue
+                value = stub
+            max_value = 0xFF if kind == cp.RELOC_BYTE else 0b111
+            if value > max_value:
+                result.errors.append(f"{where}: 标记 '{name}' 的地址 {value} 超出范围[0, {max_value}]"
+                                     + ("，请改用 MOVLZ/MOVLN" if kind != cp.RELOC_BYTE else ""))
+                continue
+            patch_field(result.binary, module.bank * bank_size + module.base + offset, kind, value)
+    return result
+
+def object_path_for(source_path: str) -> str:
+    return os.path.splitext(source_path)[0] + ".o"
+
+def load_module(path: str, no_warn: bool = False, write_object: bool = True) -> tuple[Optional[LinkModule], bool]:
+    """
+    加载一个输入文件。目标文件直接读取；汇编源文件若存在不早于它的.o文件则复用，否则重新编译并更新.o文件。
+
+    :return: 模块(失败时为None), 是否复用了已有目标文件
+    :rtype: tuple[Optional[LinkModule], bool]
+    """
+    if dzo.is_object_file(path):
+        with dzo.ObjectFile.open(path) as obj:
+            return LinkModule.from_object(path, obj), True
+    obj_path = object_path_for(path)
+    if os.path.exists(obj_path) and os.path.getmtime(obj_path) >= os.path.getmtime(path) and dzo.is_object_file(obj_path):
+        with dzo.ObjectFile.open(obj_path) as obj:
+            if obj.is_relocatable:
+                return LinkModule.from_object(path, obj), True
+    with open(path, "r", encoding="utf-8") as f:
+        code = f.read()
+    result = cp.assemble(code, no_warn=no_warn, relocatable=True)
+    if result.diagnostics:
+        print(f"{path}:")
+        cp.print_diagnostics(result, code)
+    if result.has_error:
+        return None, False
+    if write_object:
+        with open(obj_path, "wb") as f:
+            f.write(cp.out_relocatable_object(result, code))
+    return LinkModule.from_result(path, result, code), False
+
+def out_bank_usage(result: LinkResult) -> str:
+    """生成各bank的占用情况。"""
+    string = ""
+    for bank, (code, stubs) in enumerate(result.bank_usage):
+        string += f"bank {bank}: {code + stubs:>3}/{ROM_SIZE} 字节 (代码 {code}, 跳板 {stubs})\n"
+    return string
+
+def out_map(result: LinkResult) -> str:
+    """生成模块布局与全局标记表。bank链接时地址显示为 bank:地址。"""
+    banked = bool(result.bank_usage)
+    string = """\
+  Base  Size  Module
+┌──────┬─────┬──────────────────────
+"""
+    for module in result.modules:
+        base = f"{module.bank}:{module.base}" if banked else str(module.base)
+        string += f"│ {base:>4} │{len(module.rom):>4} │ {module.name}\n"
+    string += """\
+└──────┴─────┴──────────────────────
+"""
+    if banked:
+        string += out_bank_usage(result)
+    else:
+        string += f"共 {len(result.binary)}/{ROM_SIZE} 字节\n"
+    for name, addr in sorted(result.symbols.items(), key=lambda item: item[1]):
+        if banked:
+            bank, addr = divmod(addr, ROM_SIZE)
+            string += f"{bank:>3}:{addr:<3}: {name}\n"
+        else:
+            string += f"{addr:>6}: {name}\n"
+    return string
+
+def main():
+    parser = argparse.ArgumentParser(description="DZC-8M Instruction Linker")
+    parser.add_argument("files", nargs="+", help="输入的汇编代码文件或可重定位目标文件(.o)，按放置顺序排列，第一个文件从地址0开始")
+    parser.add_argument("-o", "--output", default=None, help="将字节码输出到文件。不指定则输出到第一个文件同名同目录下的.bin文件")
+    parser.add_argument("-D", "--debug-output",
+                    nargs='?',
+                    const=1,
+                    default=None,
+                    help="将调试信息输出到文件，类型为DZO目标文件。使用此选项但不指定文件则输出到第一个文件同名同目录下的.dzo文件")
+    parser.add_argument("-b", "--banks", type=int, default=None,
+                        help=f"bank切换模式：按顺序将模块放入最多BANKS个{ROM_SIZE}字节的bank，跨bank的直接跳转经由跳板，"
+                             f"跳板向IO写入0xF0|n后跳转。最多{MAX_BANKS}个bank")
+    parser.add_argument("-m", "--map", action="store_true", help="显示模块布局与全局标记表")
+    parser.add_argument("--no-warn", action="store_true", help="不显示警告")
+    parser.add_argument("--version", action="version", version=f"Eggy Linker\n{__version__}\nfor DZC-8M Plus Instruction Set")
+    args = parser.parse_args()
+
+    modules: list[LinkModule] = []
+    failed = False
+    for path in args.files:
+        module, reused = load_module(path, no_warn=args.no_warn)
+        if module is None:
+            failed = True
+            continue
+        if reused:
+            print(f"复用目标文件: {path}")
+        modules.append(module)
+    if failed:
+        print("编译失败，存在错误。")
+        return 1
+    if args.banks is not None and not 1 <= args.banks <= MAX_BANKS:
+        parser.error(f"--banks 须在1到{MAX_BANKS}之间")
+    result = link(modules) if args.banks is None else link_banked(modules, args.banks)
+    for error in result.errors:
+        print(f"错误: {error}")
+    if result.has_error:
+        print("链接失败，存在错误。")
+        return 1
+    if args.map:
+        print(out_map(result))
+    elif result.bank_usage:
+        print(out_bank_usage(result), end="")
+    stem = os.path.splitext(args.files[0])[0]
+    filename = args.output if args.output else stem + ".bin"
+    with open(filename, "wb") as f:
+        f.write(result.binary)
+    print(f"二进制字节码已输出到 {filename}")
+    if args.debug_output:
+        filename = stem + ".dzo" if args.debug_output == 1 else args.debug_output
+        symbols = {**result.symbols, **result.local_symbols}
+        with open(filename, "wb") as f:
+            f.write(dzo.write_object(dzo.build_debug_object(result.binary, symbols, result.lines, result.source)))
+        print(f"调试信息已输出到 {filename}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,320 @@
+"""
+纯函数区域的记忆化执行。
+
+以标记指定一段地址区间为纯区域：从区间起始地址进入，到PC离开区间为止，结果只取决于进入时读取的寄存器。
+进入时以输入寄存器的值查找LRU缓存，命中则直接写入缓存的输出寄存器与出口PC，并将缓存的步数计入总步数。
+
+输入寄存器由执行时的读写跟踪得到：一次调用中先读后写的寄存器都是输入，声明的输入只是初始集合，
+发现新的输入时自动扩充并清空缓存，因此缓存总是精确的。设置AF符号位的指令会保留AF的高5位，
+只读取AF高5位的区域以 AF & 0b11111000 作为键。
+输出默认为调用中写入的所有寄存器；声明输出时只恢复声明的寄存器，其余寄存器须在区域之后不再使用。
+
+区域内执行PAUSE、切换bank或单次调用超过步数上限时，该区域被停用，之后按普通方式执行。
+"""
+import sys, time
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+import argparse
+
+import isa
+import vm
+
+__version__ = "0.1.0"
+
+AF_FLAG_MASK = 0b11111000 # 设置符号位的指令保留的AF位
+MAX_CALL_STEPS = 1 << 16 # 单次调用的步数上限，超过时认为区域不会返回
+_MOVE_ZERO = ("MOVZ", "MOVLZ") # 条件为0时写入
+_MOVE_NONZERO = ("MOVN", "MOVLN") # 条件非0时写入
+_CARRY_OPS = ("ADDC", "SUBB") # 读取AF的进位
+
+class RegionSpec(NamedTuple):
+    """命令行中的区域描述，如 mod_loop:is_prime/in=R1,R2/out=R2。"""
+    start: str
+    end: Optional[str] # None表示到下一个标记为止
+    inputs: tuple[int, ...]
+    outputs: Optional[tuple[int, ...]] # None表示自动检测
+
+class MemoEntry(NamedTuple):
+    exit_pc: int
+    outputs: tuple[tuple[int, int], ...] # (寄存器, 值)
+    steps: int
+
+class Access(NamedTuple):
+    """一条指令的寄存器访问。"""
+    reads: tuple[tuple[int, int], ...] # (寄存器, 掩码)
+    dest: Optional[int] # 目标寄存器
+    cond: Optional[isa.Operand] # 条件赋值指令的条件操作数
+    write_on_zero: bool # 条件为0时写入
+    flags: bool # 是否写入AF符号位
+
+def parse_register(name: str) -> int:
+    name = name.strip().upper()
+    if name not in isa.REGISTER_NAMES or name == "PC":
+        raise ValueError(f"无效的寄存器: {name}")
+    return isa.REGISTER_NAMES.index(name)
+
+def parse_region(text: str) -> RegionSpec:
+    """
+    解析区域描述 START[:END][/in=REG,...][/out=REG,...]。
+
+    :raises ValueError: 格式错误
+    """
+    parts = text.split("/")
+    start, _, end = parts[0].partition(":")
+    if not start:
+        raise ValueError(f"区域缺少起始标记: {text}")
+    inputs: tuple[int, ...] = ()
+    outputs: Optional[tuple[int, ...]] = None
+    for part in parts[1:]:
+        key, _, value = part.partition("=")
+        regs = tuple(parse_register(name) for name in value.split(",") if name.strip())
+        if key == "in":
+            inputs = regs
+        elif key == "out":
+            outputs = regs
+        else:
+            raise ValueError(f"未知的区域选项 '{key}'，应为in或out")
+    return RegionSpec(start, end or None, inputs, outputs)
+
+def instruction_access(program, addr: int) -> Access:
+    decoded = isa.decode_at(program, addr)
+    spec = decoded.spec
+    operands = decoded.operands
+    reads: dict[int, int] = {}
+    values = operands[1:] if spec.writes_dest else operands
+    for kind, reg in values:
+        if kind == "R" and reg != vm.PC:
+            reads[reg] = 0xFF
+    if spec.name in ("INC", "DEC"):
+        reads[operands[0][1]] = 0xFF
+    if spec.name in _CARRY_OPS:
+        reads[vm.AF] = 0xFF
+    if spec.flags:
+        reads[vm.AF] = reads.get(vm.AF, 0) | AF_FLAG_MASK
+    dest = operands[0][1] if spec.writes_dest else None
+    conditional = spec.name in _MOVE_ZERO or spec.name in _MOVE_NONZERO
+    return Access(tuple(reads.items()), dest, operands[-1] if conditional else None, spec.name in _MOVE_ZERO, spec.flags)
+
+class PureRegion:
+    """一个纯区域及其缓存。地址为程序文件中的偏移，即 bank * 0xFF + bank内地址。"""
+    def __init__(self, name: str, start: int, end: int, inputs: tuple[int, ...] = (),
+                 outputs: Optional[tuple[int, ...]] = None, capacity: int = 4096):
+        self.name = name
+        self.start = start
+        self.end = end # 不含
+        self.inputs: dict[int, int] = {reg: 0xFF for reg in inputs} # 寄存器 -> 掩码
+        self.outputs = outputs
+        self.capacity = capacity
+        self.cache: OrderedDict[tuple[int, ...], MemoEntry] = OrderedDict()
+        self.accesses: dict[int, Access] = {}
+        self.disabled: Optional[str] = None # 停用原因
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0 # 命中节省的步数
+        self.widened = 0 # 发现新输入的次数
+
+    def key(self, registers: list[int]) -> tuple[int, ...]:
+        return tuple(registers[reg] & mask for reg, mask in self.inputs.items())
+
+    def describe(self) -> str:
+        def reg(reg: int, mask: int) -> str:
+            return vm.reg_name_map[reg] + ("" if mask == 0xFF else f"&{mask:#04x}")
+        inputs = ",".join(reg(r, m) for r, m in sorted(self.inputs.items())) or "-"
+        outputs = "auto" if self.outputs is None else ",".join(vm.reg_name_map[r] for r in self.outputs)
+        return f"{self.name} [0x{self.start:02X}, 0x{self.end:02X}) in={inputs} out={outputs}"
+
+class MemoRunner:
+    """
+    在InstructionRunner外包装纯区域记忆化。接口与InstructionRunner相同，可直接替换vm.py中使用的执行器。
+    未命中时整次调用在一次run_step中执行完毕，除非遇到PAUSE。
+    """
+    def __init__(self, runner: vm.InstructionRunner, regions: list[PureRegion]):
+        self.runner = runner
+        self.ctx = runner.ctx
+        self.regions = {region.start: region for region in regions}
+
+    @property
+    def steps(self) -> int:
+        return self.runner.steps
+
+    @property
+    def cur_addr(self) -> int:
+        return self.runner.cur_addr
+
+    @property
+    def cur_bank(self) -> int:
+        return self.runner.cur_bank
+
+    def run_step(self):
+        ctx = self.ctx
+        region = self.regions.get(ctx.Bank * 0xFF + ctx.Registers[vm.PC])
+        if region is None or region.disabled is not None:
+            self.runner.run_step()
+            return
+        key = region.key(ctx.Registers)
+        entry = region.cache.get(key)
+        if entry is None:
+            region.misses += 1
+            self.call(region)
+            return
+        region.cache.move_to_end(key)
+        region.hits += 1
+        region.skipped += entry.steps
+        for reg, value in entry.outputs:
+            ctx.Registers[reg] = value
+        ctx.Registers[vm.PC] = entry.exit_pc % 0xFF
+        self.runner.cur_addr = region.start % 0xFF
+        self.runner.steps += entry.steps
+
+    def call(self, region: PureRegion):
+        """跟踪读写执行一次调用，成功返回时写入缓存。"""
+        ctx = self.ctx
+        runner = self.runner
+        registers = ctx.Registers
+        before = list(registers)
+        bank_state = (ctx.Bank, ctx.Bank_pending)
+        reads: dict[int, int] = {}
+        written: set[int] = set()
+        steps = 0
+        while True:
+            pc = ctx.Bank * 0xFF + registers[vm.PC]
+            if steps > 0 and not region.start <= pc < region.end:
+                break
+            if steps >= MAX_CALL_STEPS:
+                region.disabled = f"单次调用超过 {MAX_CALL_STEPS} 步"
+                return
+            access = region.accesses.get(pc)
+            if access is None:
+                access = region.accesses[pc] = instruction_access(ctx.Program, registers[vm.PC])
+            for reg, mask in access.reads:
+                if reg not in written:
+                    reads[reg] = reads.get(reg, 0) | mask
+            dest = access.dest
+            if access.cond is not None:
+                kind, value = access.cond
+                cond = registers[value] if kind == "R" else value
+                if (cond == 0) != access.write_on_zero:
+                    dest = None
+            runner.run_step()
+            steps += 1
+            if dest is not None and dest != vm.PC:
+                written.add(dest)
+            if access.flags and dest != vm.AF:
+                written.add(vm.AF)
+            if ctx.Pause_signal:
+                region.disabled = "区域内执行了PAUSE"
+                return
+            if (ctx.Bank, ctx.Bank_pending) != bank_state:
+                region.disabled = "区域内切换了bank"
+                return
+        # 出现新的输入时扩充键并清空缓存
+        if any(reg not in region.inputs or mask & ~region.inputs[reg] for reg, mask in reads.items()):
+            for reg, mask in reads.items():
+                region.inputs[reg] = region.inputs.get(reg, 0) | mask
+            region.cache.clear()
+            region.widened += 1
+        outputs = sorted(written) if region.outputs is None else region.outputs
+        key = tuple(before[reg] & mask for reg, mask in region.inputs.items())
+        region.cache[key] = MemoEntry(pc, tuple((reg, registers[reg]) for reg in outputs), steps)
+        if len(region.cache) > region.capacity:
+            region.cache.popitem(last=False)
+
+    iter_pauses = vm.InstructionRunner.iter_pauses
+
+    def reload(self, specs: list[RegionSpec], flags: dict[str, int], size: int):
+        """
+        程序被替换后按新的标记表重新确定区域。旧区域的地址、访问记录与缓存属于旧程序，全部丢弃。
+
+        :raises ValueError: 标记不存在或区间为空，此时不再记忆化任何区域
+        """
+        self.regions = {}
+        self.regions = {region.start: region for region in resolve_regions(specs, flags, size)}
+
+    def report(self) -> str:
+        string = ""
+        for region in self.regions.values():
+            calls = region.hits + region.misses
+            string += f"{region.describe()}\n"
+            string += (f"  调用 {calls}, 命中 {region.hits} ({region.hits / calls * 100 if calls else 0:.1f}%), "
+                       f"节省 {region.skipped} 步, 缓存 {len(region.cache)}/{region.capacity}, 扩充输入 {region.widened} 次\n")
+            if region.disabled is not None:
+                string += f"  已停用: {region.disabled}\n"
+        return string
+
+def resolve_regions(specs: list[RegionSpec], flags: dict[str, int], size: int, capacity: int = 4096) -> list[PureRegion]:
+    """
+    按标记表确定区域地址。未指定结束标记时到下一个标记为止。
+
+    :raises ValueError: 标记不存在或区间为空
+    """
+    def lookup(name: str) -> int:
+        if name in flags:
+            return flags[name]
+        import cp
+        value = cp.parse_number(name)
+        if value is None:
+            raise ValueError(f"标记不存在: {name}")
+        return value
+    regions = []
+    for spec in specs:
+        start = lookup(spec.start)
+        if spec.end is not None:
+            end = lookup(spec.end)
+        else:
+            end = min((addr for addr in flags.values() if addr > start), default=size)
+        if end <= start:
+            raise ValueError(f"区域 {spec.start} 为空: [0x{start:02X}, 0x{end:02X})")
+        regions.append(PureRegion(spec.start, start, end, spec.inputs, spec.outputs, capacity))
+    return regions
+
+def main():
+    parser = argparse.ArgumentParser(description="DZC-8M Pure Region Memoizer")
+    parser.add_argument("file", help="汇编代码文件，或包含标记表的DZO/JSON调试文件")
+    parser.add_argument("-r", "--region", action="append", required=True,
+                        help="纯区域 START[:END][/in=REG,...][/out=REG,...]，可重复。未指定END时到下一个标记为止")
+    parser.add_argument("-s", "--steps", type=int, default=1_000_000, help="执行的步数。默认1000000")
+    parser.add_argument("--capacity", type=int, default=4096, help="每个区域的LRU缓存容量。默认4096")
+    parser.add_argument("--no-verify", action="store_true", help="不与普通执行比较PAUSE输出与耗时")
+    parser.add_argument("--version", action="version", version=f"Eggy Memoizer\n{__version__}\nfor DZC-8M Plus Instruction Set")
+    args = parser.parse_args()
+
+    try:
+        image = vm.load_image(args.file, args.file.lower().endswith(".json"))
+        regions = resolve_regions([parse_region(text) for text in args.region], image.flags, len(image.rom), args.capacity)
+    except (vm.ProgramLoadException, ValueError, OSError) as e:
+        print(e)
+        return 1
+
+    def run(memoized: bool) -> tuple[list[vm.PauseEvent], float, Optional[MemoRunner]]:
+        ctx = vm.Ctx_t()
+        runner: vm.InstructionRunner
+        if len(image.rom) > 0xFF:
+            ctx.load_banks(image.rom)
+            runner = vm.BankedInstructionRunner(ctx)
+        else:
+            ctx.load_program(image.rom)
+            runner = vm.InstructionRunner(ctx)
+        memo = MemoRunner(runner, regions) if memoized else None
+        start = time.perf_counter()
+        events = list((memo or runner).iter_pauses(max_steps=args.steps))
+        return events, time.perf_counter() - start, memo
+
+    events, elapsed, memo = run(True)
+    assert memo is not None
+    print(memo.report(), end="")
+    print(f"记忆化执行: {memo.steps} 步, {len(events)} 次PAUSE, {elapsed:.3f}s")
+    if args.no_verify:
+        return 0
+    plain, plain_elapsed, _ = run(False)
+    print(f"普通执行:   {args.steps} 步, {len(plain)} 次PAUSE, {plain_elapsed:.3f}s, 加速 {plain_elapsed / elapsed:.2f}x")
+    # 命中时一次跳过多步，步数上限处可能多执行一次调用，只比较共同的部分
+    common = [event for event in events if event.steps <= args.steps]
+    if [e[1:] for e in common] != [e[1:] for e in plain[:len(common)]]:
+        print("错误: PAUSE输出与普通执行不一致")
+        return 1
+    print(f"前 {len(common)} 次PAUSE与普通执行一致")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
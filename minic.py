@@ -0,0 +1,1271 @@
+"""
+DZC-8M 迷你C编译器，将C语言的一个小子集编译为cp.py可编译的汇编代码。
+
+支持的语言子集：
+- 只有 uint8_t 类型的变量。以寄存器命名的变量(R0~R3, SP, IO)固定在该寄存器中，
+  其余变量由寄存器分配器分配到R0~R3, SP中。PAUSE时只保证以寄存器命名的变量可见
+- 一个 main 函数，语句: 赋值(= += -= &= |= ^= <<= >>=)、++/--、if/else、while、do/while、for、
+  break、continue、goto与标号、return(停机)、pause()
+- 运算符: + - & | ^ << >> ~ 与一元负号，全部按8位无符号运算(与C的整数提升不同)
+- 条件中可使用 == != < <= > >= && || !
+- 以#开头的预处理行被忽略
+
+优化：
+- 基于活跃变量分析的寄存器分配，生命周期不重叠的变量共用寄存器
+- 比较使用CMP与AF符号位，与0比较直接测试寄存器，与2的幂比较使用SHR；AF寄存器用作表达式与条件的临时寄存器
+- while (x >= y) x -= y; 形式的循环使用恢复余数法，每次迭代只需一次减法和一次条件跳转
+- 循环翻转(条件在循环末尾)、跳转串接、消除跳转到下一条指令、条件跳转跨越无条件跳转的合并
+- 简单的if赋值编译为条件赋值(MOVZ/MOVN)，不产生跳转
+- 常量折叠；0~7的常量使用短格式，地址在0~7的跳转目标使用2字节的MOVZ/MOVN
+"""
+import os, sys
+import re
+from typing import NamedTuple, Optional, Union
+
+import argparse
+
+import isa
+
+__version__ = "0.1.0"
+
+ROM_SIZE = 0xFF # 程序存储区大小
+
+PC = 0
+AF = 1
+SP = 2
+IO = 3
+# 可分配给普通变量的寄存器，按优先顺序
+ALLOC_POOL = (4, 5, 6, 7, SP)
+# 可以用作变量名、固定在该寄存器中的寄存器
+PINNABLE = {"R0": 4, "R1": 5, "R2": 6, "R3": 7, "SP": SP, "IO": IO}
+
+class CompileError(Exception):
+    def __init__(self, line: int, message: str):
+        super().__init__(message)
+        self.line = line
+        self.message = message
+
+# ---------------- 词法分析 ----------------
+
+class Token(NamedTuple):
+    kind: str # "num", "id", "op", "eof"
+    text: str
+    value: int
+    line: int
+
+KEYWORDS = {"uint8_t", "int", "void", "if", "else", "while", "do", "for", "break", "continue", "goto", "return"}
+
+retoken = re.compile(r"""
+    (?P<space>[ \t\r\f\v]+)
+  | (?P<newline>\n)
+  | (?P<preproc>\#[^\n]*)
+  | (?P<line_comment>//[^\n]*)
+  | (?P<block_comment>/\*(?:[^*]|\*(?!/))*\*/)
+  | (?P<num>0[xX][0-9A-Fa-f]+|0[bB][01]+|\d+|'(?:\\.|[^\\'])')
+  | (?P<id>[A-Za-z_][A-Za-z0-9_]*)
+  | (?P<op><<=|>>=|\+\+|--|\+=|-=|&=|\|=|\^=|<<|>>|<=|>=|==|!=|&&|\|\||[-+~!&|^<>=(){};,:])
+""", re.VERBOSE)
+
+CHAR_ESCAPES = {"n": 10, "t": 9, "r": 13, "0": 0, "\\": 92, "'": 39}
+
+def parse_literal(text: str, line: int) -> int:
+    if text.startswith("'"):
+        body = text[1:-1]
+        value = CHAR_ESCAPES.get(body[1]) if body.startswith("\\") else ord(body)
+        if value is None:
+            raise CompileError(line, f"不支持的转义字符: {text}")
+    elif text[:2] in ("0x", "0X"):
+        value = int(text, 16)
+    elif text[:2] in ("0b", "0B"):
+        value = int(text[2:], 2)
+    elif len(text) > 1 and text.startswith("0"):
+        value = int(text, 8)
+    else:
+        value = int(text)
+    if value > 0xFF:
+        raise CompileError(line, f"常量超出8位范围: {text}")
+    return value
+
+def tokenize(code: str) -> list[Token]:
+    tokens = []
+    line = 1
+    pos = 0
+    while pos < len(code):
+        m = retoken.match(code, pos)
+        if m is None:
+            raise CompileError(line, f"无法识别的字符: {code[pos]!r}")
+        kind = m.lastgroup
+        text = m.group()
+        if kind == "num":
+            tokens.append(Token("num", text, parse_literal(text, line), line))
+        elif kind == "id":
+            tokens.append(Token("id", text, 0, line))
+        elif kind == "op":
+            tokens.append(Token("op", text, 0, line))
+        line += text.count("\n")
+        pos = m.end()
+    tokens.append(Token("eof", "", 0, line))
+    return tokens
+
+# ---------------- 语法树 ----------------
+
+class Num(NamedTuple):
+    value: int
+    line: int = 0
+
+class Var(NamedTuple):
+    name: str
+    line: int = 0
+
+class Unary(NamedTuple):
+    op: str
+    operand: "Expr"
+    line: int = 0
+
+class Binary(NamedTuple):
+    op: str
+    left: "Expr"
+    right: "Expr"
+    line: int = 0
+
+Expr = Union[Num, Var, Unary, Binary]
+
+class Assign(NamedTuple):
+    target: str
+    op: str # "=" 或 "+=" 等
+    expr: Expr
+    line: int
+
+class Pause(NamedTuple):
+    line: int
+
+class If(NamedTuple):
+    cond: Expr
+    then: "Stmt"
+    other: Optional["Stmt"]
+    line: int
+
+class While(NamedTuple):
+    cond: Expr
+    body: "Stmt"
+    line: int
+
+class DoWhile(NamedTuple):
+    body: "Stmt"
+    cond: Expr
+    line: int
+
+class For(NamedTuple):
+    init: Optional["Stmt"]
+    cond: Optional[Expr]
+    step: Optional["Stmt"]
+    body: "Stmt"
+    line: int
+
+class Jump(NamedTuple):
+    kind: str # "break", "continue", "goto", "return"
+    label: Optional[str]
+    line: int
+
+class Label(NamedTuple):
+    name: str
+    line: int
+
+class Block(NamedTuple):
+    stmts: list
+    line: int
+
+Stmt = Union[Assign, Pause, If, While, DoWhile, For, Jump, Label, Block]
+
+# ---------------- 语法分析 ----------------
+
+# 二元运算符优先级
+BINARY_PRECEDENCE = {
+    "||": 1, "&&": 2, "|": 3, "^": 4, "&": 5,
+    "==": 6, "!=": 6, "<": 7, "<=": 7, ">": 7, ">=": 7,
+    "<<": 8, ">>": 8, "+": 9, "-": 9,
+}
+ASSIGN_OPS = {"=", "+=", "-=", "&=", "|=", "^=", "<<=", ">>="}
+
+class Parser:
+    def __init__(self, tokens: list[Token]):
+        self.tokens = tokens
+        self.pos = 0
+        self.declarations: list[tuple[str, int]] = [] # (变量名, 行号)，按声明顺序
+        self.inits: list[Assign] = [] # 全局变量的初始化
+
+    @property
+    def tok(self) -> Token:
+        return self.tokens[self.pos]
+
+    def peek(self, offset: int = 1) -> Token:
+        return self.tokens[min(self.pos + offset, len(self.tokens) - 1)]
+
+    def next(self) -> Token:
+        tok = self.tok
+        self.pos += 1
+        return tok
+
+    def accept(self, text: str) -> bool:
+        if self.tok.kind in ("op", "id") and self.tok.text == text:
+            self.pos += 1
+            return True
+        return False
+
+    def expect(self, text: str) -> Token:
+        if not (self.tok.kind in ("op", "id") and self.tok.text == text):
+            raise CompileError(self.tok.line, f"此处应为 '{text}'，实际为 '{self.tok.text or '文件末尾'}'")
+        return self.next()
+
+    def expect_id(self) -> Token:
+        if self.tok.kind != "id" or self.tok.text in KEYWORDS:
+            raise CompileError(self.tok.line, f"此处应为标识符，实际为 '{self.tok.text or '文件末尾'}'")
+        return self.next()
+
+    def parse_program(self) -> Block:
+        body: Optional[Block] = None
+        while self.tok.kind != "eof":
+            if self.tok.text == "uint8_t":
+                self.inits.extend(self.parse_declaration())
+            elif self.tok.text in ("int", "void"):
+                line = self.next().line
+                name = self.expect_id()
+                if name.text != "main":
+                    raise CompileError(name.line, f"只支持main函数: {name.text}")
+                self.expect("(")
+                self.accept("void")
+                self.expect(")")
+                if body is not None:
+                    raise CompileError(line, "重复定义main函数")
+                body = self.parse_block()
+            else:
+                raise CompileError(self.tok.line, f"此处应为声明或main函数，实际为 '{self.tok.text}'")
+        if body is None:
+            raise CompileError(self.tok.line, "没有main函数")
+        return Block([*self.inits, *body.stmts], body.line)
+
+    def parse_declaration(self) -> list[Assign]:
+        self.expect("uint8_t")
+        inits = []
+        while True:
+            name = self.expect_id()
+            self.declarations.append((name.text, name.line))
+            if self.accept("="):
+                inits.append(Assign(name.text, "=", self.parse_expr(), name.line))
+            if not self.accept(","):
+                break
+        self.expect(";")
+        return inits
+
+    def parse_block(self) -> Block:
+        line = self.expect("{").line
+        stmts = []
+        while not self.accept("}"):
+            if self.tok.kind == "eof":
+                raise CompileError(line, "代码块没有闭合")
+            stmts.append(self.parse_statement())
+        return Block(stmts, line)
+
+    def parse_statement(self) -> Stmt:
+        tok = self.tok
+        line = tok.line
+        if tok.text == "{":
+            return self.parse_block()
+        if tok.text == "uint8_t":
+            return Block(self.parse_declaration(), line)
+        if self.accept("if"):
+            self.expect("(")
+            cond = self.parse_expr()
+            self.expect(")")
+            then = self.parse_statement()
+            other = self.parse_statement() if self.accept("else") else None
+            return If(cond, then, other, line)
+        if self.accept("while"):
+            self.expect("(")
+            cond = self.parse_expr()
+            self.expect(")")
+            return While(cond, self.parse_statement(), line)
+        if self.accept("do"):
+            body = self.parse_statement()
+            self.expect("while")
+            self.expect("(")
+            cond = self.parse_expr()
+            self.expect(")")
+            self.expect(";")
+            return DoWhile(body, cond, line)
+        if self.accept("for"):
+            self.expect("(")
+            init = None if self.tok.text == ";" else self.parse_simple()
+            self.expect(";")
+            cond = None if self.tok.text == ";" else self.parse_expr()
+            self.expect(";")
+            step = None if self.tok.text == ")" else self.parse_simple()
+            self.expect(")")
+            return For(init, cond, step, self.parse_statement(), line)
+        if tok.text in ("break", "continue"):
+            self.next()
+            self.expect(";")
+            return Jump(tok.text, None, line)
+        if self.accept("goto"):
+            label = self.expect_id().text
+            self.expect(";")
+            return Jump("goto", label, line)
+        if self.accept("return"):
+            if self.tok.text != ";":
+                self.parse_expr() # main的返回值被忽略
+            self.expect(";")
+            return Jump("return", None, line)
+        if tok.kind == "id" and tok.text not in KEYWORDS and self.peek().text == ":":
+            self.pos += 2
+            return Label(tok.text, line)
+        if self.accept(";"):
+            return Block([], line)
+        stmt = self.parse_simple()
+        self.expect(";")
+        return stmt
+
+    def parse_simple(self) -> Stmt:
+        """赋值、自增自减或函数调用。"""
+        line = self.tok.line
+        if self.tok.text in ("++", "--"):
+            op = self.next().text
+            name = self.expect_id().text
+            return Assign(name, "+=" if op == "++" else "-=", Num(1, line), line)
+        name = self.expect_id().text
+        if self.accept("("):
+            self.expect(")")
+            if name != "pause":
+                raise CompileError(line, f"不支持的函数: {name}。只有pause()可用")
+            return Pause(line)
+        if self.tok.text in ("++", "--"):
+            op = self.next().text
+            return Assign(name, "+=" if op == "++" else "-=", Num(1, line), line)
+        if self.tok.text in ASSIGN_OPS:
+            op = self.next().text
+            return Assign(name, op, self.parse_expr(), line)
+        raise CompileError(line, f"此处应为赋值语句，实际为 '{self.tok.text}'")
+
+    def parse_expr(self, min_prec: int = 1) -> Expr:
+        left = self.parse_unary()
+        while self.tok.kind == "op" and BINARY_PRECEDENCE.get(self.tok.text, 0) >= min_prec:
+            op = self.next()
+            right = self.parse_expr(BINARY_PRECEDENCE[op.text] + 1)
+            left = Binary(op.text, left, right, op.line)
+        return left
+
+    def parse_unary(self) -> Expr:
+        tok = self.tok
+        if tok.kind == "op" and tok.text in ("-", "~", "!", "+"):
+            self.next()
+            operand = self.parse_unary()
+            return operand if tok.text == "+" else Unary(tok.text, operand, tok.line)
+        if self.accept("("):
+            expr = self.parse_expr()
+            self.expect(")")
+            return expr
+        if tok.kind == "num":
+            self.next()
+            return Num(tok.value, tok.line)
+        return Var(self.expect_id().text, tok.line)
+
+# ---------------- 中间代码 ----------------
+
+class VReg:
+    """虚拟寄存器：变量或临时值。reg为分配到的寄存器编号。"""
+    __slots__ = ("name", "reg", "pinned")
+    def __init__(self, name: str, reg: Optional[int] = None):
+        self.name = name
+        self.reg = reg
+        self.pinned = reg is not None # 固定在寄存器中
+
+    def __repr__(self) -> str:
+        return self.name
+
+Operand = Union[VReg, int]
+
+class Ins:
+    """
+    一条中间代码指令。
+
+    op为指令名，另有伪指令 JMP/JZ/JNZ(b为条件)/LABEL/HALT。MOVZ/MOVN的a为源，b为条件；
+    a可以是任意8位常量，输出时按大小选择短格式或长格式。其余指令的操作数为寄存器或0~7的常量。
+    """
+    __slots__ = ("op", "dst", "a", "b", "label")
+    def __init__(self, op: str, dst: Optional[VReg] = None, a: Optional[Operand] = None,
+                 b: Optional[Operand] = None, label: Optional[str] = None):
+        self.op = op
+        self.dst = dst
+        self.a = a
+        self.b = b
+        self.label = label
+
+    def __repr__(self) -> str:
+        parts = [str(x) for x in (self.dst, self.a, self.b, self.label) if x is not None]
+        return f"{self.op} {', '.join(parts)}"
+
+FLAG_OPS = {"ADD", "SUB", "INC", "DEC", "CMP"} # 设置AF的指令
+ALU_OPS = {"+": "ADD", "-": "SUB", "&": "AND", "|": "OR", "^": "XOR", "<<": "SHL", ">>": "SHR"}
+COMMUTATIVE = {"+", "&", "|", "^"}
+COMPARE_OPS = {"==", "!=", "<", "<=", ">", ">="}
+# 交换操作数后的比较运算符
+MIRROR = {"==": "==", "!=": "!=", "<": ">", "<=": ">=", ">": "<", ">=": "<="}
+# CMP a, b 之后，比较结果为真时 AF & mask 是否非零
+CMP_MASKS = {"<": (0b010, True), "<=": (0b011, True), ">": (0b011, False), ">=": (0b010, False)}
+
+def is_unconditional_mov(ins: Ins) -> bool:
+    return ins.op == "MOVZ" and ins.b == 0
+
+def ins_defs(ins: Ins) -> list[VReg]:
+    defs = []
+    if ins.dst is not None:
+        defs.append(ins.dst)
+    if ins.op in FLAG_OPS:
+        defs.append(AF_REG)
+    return defs
+
+def ins_uses(ins: Ins, observed: list[VReg]) -> list[VReg]:
+    """指令读取的虚拟寄存器。PAUSE与停机读取所有可见变量，条件赋值读取目标寄存器的原值。"""
+    if ins.op in ("PAUSE", "HALT"):
+        return observed
+    uses = [x for x in (ins.a, ins.b) if isinstance(x, VReg)]
+    if ins.op in ("INC", "DEC") or (ins.op in ("MOVZ", "MOVN") and not is_unconditional_mov(ins)):
+        uses.append(ins.dst)
+    return uses
+
+AF_REG = VReg("AF", AF)
+
+# ---------------- 代码生成 ----------------
+
+def is_leaf(e: Expr) -> bool:
+    """可以直接作为值字段(寄存器或3位常量)的表达式。"""
+    return isinstance(e, Var) or (isinstance(e, Num) and e.value <= 7)
+
+def reads(e: Expr, name: str) -> bool:
+    if isinstance(e, Var):
+        return e.name == name
+    if isinstance(e, Unary):
+        return reads(e.operand, name)
+    if isinstance(e, Binary):
+        return reads(e.left, name) or reads(e.right, name)
+    return False
+
+def is_chain(e: Expr) -> bool:
+    """计算过程只需要一个寄存器的表达式。可以完全在AF中计算。"""
+    if isinstance(e, (Num, Var)):
+        return True
+    if isinstance(e, Unary):
+        return is_chain(e.operand)
+    return (is_leaf(e.left) and is_chain(e.right)) or (is_leaf(e.right) and is_chain(e.left))
+
+def same_expr(a: Expr, b: Expr) -> bool:
+    if isinstance(a, Num) and isinstance(b, Num):
+        return a.value == b.value
+    if isinstance(a, Var) and isinstance(b, Var):
+        return a.name == b.name
+    return False
+
+def fold(e: Expr) -> Expr:
+    """常量折叠与代数化简。所有运算按8位无符号进行。"""
+    if isinstance(e, Unary):
+        operand = fold(e.operand)
+        if e.op == "~" and isinstance(operand, Num):
+            return Num(~operand.value & 0xFF, e.line)
+        if e.op == "-" and isinstance(operand, Num):
+            return Num(-operand.value & 0xFF, e.line)
+        if e.op in ("~", "-") and isinstance(operand, Unary) and operand.op == e.op:
+            return operand.operand
+        return Unary(e.op, operand, e.line)
+    if not isinstance(e, Binary):
+        return e
+    op = e.op
+    left, right = fold(e.left), fold(e.right)
+    if op in COMPARE_OPS or op in ("&&", "||"):
+        return Binary(op, left, right, e.line)
+    if isinstance(left, Num) and isinstance(right, Num):
+        a, b = left.value, right.value
+        value = {
+            "+": a + b, "-": a - b, "&": a & b, "|": a | b, "^": a ^ b,
+            "<<": a << b if b < 8 else 0, ">>": a >> b,
+        }[op]
+        return Num(value & 0xFF, e.line)
+    if op in COMMUTATIVE and isinstance(left, Num):
+        left, right = right, left
+    if isinstance(right, Num):
+        c = right.value
+        if c == 0 and op in ("+", "-", "|", "^", "<<", ">>"):
+            return left
+        if (c == 0 and op == "&") or (c >= 8 and op in ("<<", ">>")):
+            return Num(0, e.line)
+        if c == 0xFF and op == "&":
+            return left
+        if c == 0xFF and op == "|":
+            return Num(0xFF, e.line)
+        if c == 0xFF and op == "^":
+            return Unary("~", left, e.line)
+        # 加减一个较大的常量，改为减加一个3位常量
+        if c > 7 and 0x100 - c <= 7 and op in ("+", "-"):
+            return Binary("-" if op == "+" else "+", left, Num(0x100 - c, e.line), e.line)
+    if isinstance(left, Num) and left.value == 0 and op == "-":
+        return Unary("-", right, e.line)
+    if same_expr(left, right) and isinstance(left, Var):
+        if op in ("-", "^"):
+            return Num(0, e.line)
+        if op in ("&", "|"):
+            return left
+    return Binary(op, left, right, e.line)
+
+class CodeGen:
+    """将语法树翻译为使用虚拟寄存器的中间代码。"""
+    def __init__(self, declarations: list[tuple[str, int]]):
+        self.code: list[Ins] = []
+        self.vars: dict[str, VReg] = {}
+        self.user_labels: dict[str, str] = {} # C标号 -> 汇编标记
+        self.label_count = 0
+        self.temp_count = 0
+        self.loops: list[tuple[str, str]] = [] # (continue目标, break目标)
+        for name, line in declarations:
+            if name in self.vars:
+                raise CompileError(line, f"重复声明的变量: {name}")
+            if name in ("PC", "AF"):
+                raise CompileError(line, f"{name}不能用作变量")
+            self.vars[name] = VReg(name, PINNABLE.get(name))
+
+    @property
+    def observed(self) -> list[VReg]:
+        """PAUSE时可见的变量。"""
+        return [reg for reg in self.vars.values() if reg.pinned]
+
+    def new_label(self) -> str:
+        self.label_count += 1
+        return f"_L{self.label_count}"
+
+    def new_temp(self) -> VReg:
+        self.temp_count += 1
+        return VReg(f"_t{self.temp_count}")
+
+    def user_label(self, name: str) -> str:
+        label = self.user_labels.get(name)
+        if label is None:
+            # 与寄存器名相同、可能被cp.py解析为数字或与编译器标记冲突的标号加前缀
+            safe = re.fullmatch(r"[A-Za-z][A-Za-z0-9_]*", name) and name.upper() not in isa.REGISTER_NAMES \
+                and not re.fullmatch(r"[0-9A-Fa-f]+[HhDdBbOo]", name)
+            label = name if safe else f"_u_{name}"
+            self.user_labels[name] = label
+        return label
+
+    def var(self, e: Var) -> VReg:
+        reg = self.vars.get(e.name)
+        if reg is None:
+            raise CompileError(e.line, f"未声明的变量: {e.name}")
+        return reg
+
+    def emit(self, op: str, dst: Optional[VReg] = None, a: Optional[Operand] = None,
+             b: Optional[Operand] = None, label: Optional[str] = None):
+        self.code.append(Ins(op, dst, a, b, label))
+
+    def operand(self, e: Expr) -> Operand:
+        return self.var(e) if isinstance(e, Var) else e.value
+
+    # ---- 表达式 ----
+
+    def gen_expr(self, e: Expr, dst: VReg):
+        """计算表达式，结果写入dst。"""
+        e = fold(e)
+        if isinstance(e, Num):
+            self.emit("MOVZ", dst, e.value, 0)
+        elif isinstance(e, Var):
+            src = self.var(e)
+            if src is not dst:
+                self.emit("MOVZ", dst, src, 0)
+        elif isinstance(e, Unary):
+            if e.op == "!":
+                raise CompileError(e.line, "逻辑运算只能用于条件")
+            if is_leaf(e.operand):
+                value = self.operand(e.operand)
+            else:
+                self.gen_expr(e.operand, dst)
+                value = dst
+            if e.op == "~":
+                self.emit("NOT", dst, value)
+            else:
+                self.emit("SUB", dst, 0, value)
+        else:
+            self.gen_binary(e, dst)
+
+    def temp_for(self, e: Expr, dst: VReg) -> VReg:
+        """计算子表达式用的临时寄存器。子表达式只需一个寄存器、且结果立即被使用时用AF。"""
+        return AF_REG if dst is not AF_REG and is_chain(e) else self.new_temp()
+
+    def gen_binary(self, e: Binary, dst: VReg):
+        op, left, right = e.op, e.left, e.right
+        if op in COMPARE_OPS or op in ("&&", "||"):
+            raise CompileError(e.line, "比较与逻辑运算只能用于条件")
+        name = ALU_OPS[op]
+        # 自增自减
+        if isinstance(left, Var) and self.var(left) is dst and isinstance(right, Num) and right.value == 1 and op in ("+", "-"):
+            self.emit("INC" if op == "+" else "DEC", dst)
+            return
+        if is_leaf(left) and is_leaf(right):
+            self.emit(name, dst, self.operand(left), self.operand(right))
+        elif is_leaf(right):
+            if reads(right, dst.name):
+                temp = self.temp_for(left, dst)
+                self.gen_expr(left, temp)
+                self.emit(name, dst, temp, self.operand(right))
+            else:
+                self.gen_expr(left, dst)
+                self.emit(name, dst, dst, self.operand(right))
+        elif is_leaf(left):
+            if op in COMMUTATIVE:
+                self.gen_binary(Binary(op, right, left, e.line), dst)
+            elif not reads(left, dst.name):
+                self.gen_expr(right, dst)
+                self.emit(name, dst, self.operand(left), dst)
+            else:
+                temp = self.temp_for(right, dst)
+                self.gen_expr(right, temp)
+                self.emit(name, dst, self.operand(left), temp)
+        else:
+            if op in COMMUTATIVE and is_chain(left) and not is_chain(right):
+                left, right = right, left
+            # dst为AF时，计算另一侧的运算会改写AF，先算出的一侧必须放在临时寄存器中
+            if dst is AF_REG:
+                temp = self.new_temp()
+                self.gen_expr(left, temp)
+                self.gen_expr(right, dst)
+                self.emit(name, dst, temp, dst)
+            elif not reads(right, dst.name):
+                self.gen_expr(left, dst)
+                temp = self.temp_for(right, dst)
+                self.gen_expr(right, temp)
+                self.emit(name, dst, dst, temp)
+            elif not reads(left, dst.name) and (op in COMMUTATIVE or is_chain(left)):
+                self.gen_expr(right, dst)
+                temp = self.temp_for(left, dst)
+                self.gen_expr(left, temp)
+                self.emit(name, dst, temp, dst)
+            else:
+                temp = self.new_temp()
+                self.gen_expr(left, temp)
+                self.gen_expr(right, dst)
+                self.emit(name, dst, temp, dst)
+
+    def value_of(self, e: Expr) -> Operand:
+        """得到表达式的值字段。不是叶子时在AF中计算。"""
+        if is_leaf(e):
+            return self.operand(e)
+        self.gen_expr(e, AF_REG)
+        return AF_REG
+
+    def cmp_operands(self, left: Expr, right: Expr) -> tuple[Operand, Operand]:
+        """准备CMP的两个操作数。至多一个在AF中计算，另一个需要时使用临时寄存器。"""
+        if not is_leaf(left) and not is_leaf(right):
+            temp = self.new_temp()
+            self.gen_expr(left, temp)
+            return temp, self.value_of(right)
+        if not is_leaf(left):
+            return self.value_of(left), self.operand(right)
+        return self.operand(left), self.value_of(right)
+
+    # ---- 条件 ----
+
+    def gen_test(self, cond: Expr) -> Union[bool, tuple[Operand, bool]]:
+        """
+        计算原子条件。
+
+        :return: 常量条件返回bool；否则返回(值, nz)，条件为真当且仅当 (值 != 0) == nz
+        """
+        cond = fold(cond)
+        if isinstance(cond, Num):
+            return cond.value != 0
+        if isinstance(cond, Binary) and cond.op in COMPARE_OPS:
+            return self.gen_compare(cond)
+        return self.value_of(cond), True
+
+    def gen_compare(self, cond: Binary) -> Union[bool, tuple[Operand, bool]]:
+        op, left, right = cond.op, cond.left, cond.right
+        if isinstance(left, Num) and not isinstance(right, Num):
+            op, left, right = MIRROR[op], right, left
+        if isinstance(left, Num) and isinstance(right, Num):
+            a, b = left.value, right.value
+            return {"==": a == b, "!=": a != b, "<": a < b, "<=": a <= b, ">": a > b, ">=": a >= b}[op]
+        if isinstance(right, Num):
+            c = right.value
+            # 化为 < 或 >= 常量
+            if op == "<=":
+                if c == 0xFF:
+                    return True
+                op, c = "<", c + 1
+            elif op == ">":
+                if c == 0xFF:
+                    return False
+                op, c = ">=", c + 1
+            if op == "<" and c == 0:
+                return False
+            if op == ">=" and c == 0:
+                return True
+            if op in ("<", ">=") and c == 1:
+                op, c = ("==" if op == "<" else "!="), 0
+            if op in ("==", "!="):
+                if c == 0:
+                    return self.value_of(left), op == "!="
+                if c > 7 and 0x100 - c <= 7:
+                    self.gen_expr(Binary("+", left, Num(0x100 - c)), AF_REG)
+                else:
+                    self.gen_expr(Binary("^", left, Num(c)), AF_REG)
+                return AF_REG, op == "!="
+            # 与2的幂比较：x < 2^k 当且仅当 x >> k == 0
+            if (c & (c - 1)) == 0:
+                self.gen_expr(Binary(">>", left, Num(c.bit_length() - 1)), AF_REG)
+                return AF_REG, op == ">="
+            right = Num(c)
+        if op in ("==", "!="):
+            self.gen_expr(Binary("^", left, right), AF_REG)
+            return AF_REG, op == "!="
+        a, b = self.cmp_operands(left, right)
+        mask, nz = CMP_MASKS[op]
+        self.emit("CMP", None, a, b)
+        self.emit("AND", AF_REG, AF_REG, mask)
+        return AF_REG, nz
+
+    def gen_branch(self, cond: Expr, label: str, when: bool):
+        """条件cond的值等于when时跳转到label，否则顺序执行。"""
+        if isinstance(cond, Unary) and cond.op == "!":
+            self.gen_branch(cond.operand, label, not when)
+            return
+        if isinstance(cond, Binary) and cond.op in ("&&", "||"):
+            # a && b 为假 / a || b 为真 时，短路跳转
+            short = (cond.op == "||") == when
+            if short:
+                self.gen_branch(cond.left, label, when)
+                self.gen_branch(cond.right, label, when)
+            else:
+                skip = self.new_label()
+                self.gen_branch(cond.left, skip, not when)
+                self.gen_branch(cond.right, label, when)
+                self.emit("LABEL", label=skip)
+            return
+        test = self.gen_test(cond)
+        if isinstance(test, bool):
+            if test == when:
+                self.emit("JMP", label=label)
+            return
+        value, nz = test
+        self.emit("JNZ" if nz == when else "JZ", b=value, label=label)
+
+    # ---- 语句 ----
+
+    def gen_stmt(self, s: Stmt):
+        if isinstance(s, Block):
+            for stmt in s.stmts:
+                self.gen_stmt(stmt)
+        elif isinstance(s, Assign):
+            target = self.var(Var(s.target, s.line))
+            expr = s.expr if s.op == "=" else Binary(s.op[:-1], Var(s.target, s.line), s.expr, s.line)
+            self.gen_expr(expr, target)
+        elif isinstance(s, Pause):
+            self.emit("PAUSE")
+        elif isinstance(s, If):
+            self.gen_if(s)
+        elif isinstance(s, While):
+            if not self.gen_restoring_loop(s):
+                self.gen_loop(s.cond, s.body, None, rotate=True)
+        elif isinstance(s, DoWhile):
+            self.gen_loop(s.cond, s.body, None, rotate=False)
+        elif isinstance(s, For):
+            if s.init is not None:
+                self.gen_stmt(s.init)
+            self.gen_loop(s.cond if s.cond is not None else Num(1), s.body, s.step, rotate=True)
+        elif isinstance(s, Jump):
+            if s.kind == "goto":
+                self.goto_lines.setdefault(s.label, s.line)
+                self.emit("JMP", label=self.user_label(s.label))
+            elif s.kind == "return":
+                self.emit("HALT")
+            else:
+                if not self.loops:
+                    raise CompileError(s.line, f"{s.kind}不在循环中")
+                cont, end = self.loops[-1]
+                self.emit("JMP", label=cont if s.kind == "continue" else end)
+        elif isinstance(s, Label):
+            if s.name in self.defined_labels:
+                raise CompileError(s.line, f"重复的标号: {s.name}")
+            self.defined_labels.add(s.name)
+            self.emit("LABEL", label=self.user_label(s.name))
+
+    def gen_loop(self, cond: Expr, body: Stmt, step: Optional[Stmt], rotate: bool):
+        """循环。条件放在循环末尾，每次迭代只执行一次条件跳转。"""
+        body_label, cont, end = self.new_label(), self.new_label(), self.new_label()
+        test = self.new_label()
+        if rotate:
+            self.emit("JMP", label=test)
+        self.emit("LABEL", label=body_label)
+        self.loops.append((cont, end))
+        self.gen_stmt(body)
+        self.loops.pop()
+        self.emit("LABEL", label=cont)
+        if step is not None:
+            self.gen_stmt(step)
+        self.emit("LABEL", label=test)
+        self.gen_branch(cond, body_label, True)
+        self.emit("LABEL", label=end)
+
+    def gen_restoring_loop(self, s: While) -> bool:
+        """
+        while (x >= y) x -= y; 与 while (x > y) x -= y; 使用恢复余数法：
+        先减，由减法设置的AF判断减之前的比较结果，退出时加回最后一次多减的值。
+        """
+        cond, body = fold(s.cond), s.body
+        while isinstance(body, Block) and len(body.stmts) == 1:
+            body = body.stmts[0]
+        if not (isinstance(cond, Binary) and cond.op in (">=", ">", "<=", "<") and isinstance(body, Assign)):
+            return False
+        op, x, y = cond.op, cond.left, cond.right
+        if op in ("<=", "<"):
+            op, x, y = MIRROR[op], y, x
+        if not (isinstance(x, Var) and is_leaf(y) and not same_expr(x, y) and body.target == x.name):
+            return False
+        if isinstance(y, Num) and y.value == 0:
+            return False
+        if body.op == "-=":
+            amount = body.expr
+        elif body.op == "=" and isinstance(body.expr, Binary) and body.expr.op == "-" and same_expr(body.expr.left, x):
+            amount = body.expr.right
+        else:
+            return False
+        if not same_expr(amount, y):
+            return False
+        reg, value = self.var(x), self.operand(y)
+        loop = self.new_label()
+        self.emit("LABEL", label=loop)
+        self.emit("SUB", reg, reg, value)
+        self.emit("AND", AF_REG, AF_REG, CMP_MASKS[op][0])
+        self.emit("JZ", b=AF_REG, label=loop)
+        self.emit("ADD", reg, reg, value)
+        return True
+
+    def cmov_assigns(self, s: Optional[Stmt]) -> Optional[list[Assign]]:
+        """可以编译为条件赋值的语句：若干条源为变量或常量的赋值。"""
+        if s is None:
+            return None
+        stmts = s.stmts if isinstance(s, Block) else [s]
+        if not 0 < len(stmts) <= 3:
+            return None
+        for stmt in stmts:
+            if not (isinstance(stmt, Assign) and stmt.op == "=" and isinstance(fold(stmt.expr), (Var, Num))):
+                return None
+        return stmts
+
+    def gen_cmov(self, s: If) -> bool:
+        """
+        if (c) x = a; 编译为条件赋值 MOVZ/MOVN x, a, c。
+        if (c) x = a; else x = b; 编译为 x = b 与条件赋值 x = a。
+        """
+        assigns = self.cmov_assigns(s.then)
+        cond = fold(s.cond)
+        if not assigns or isinstance(cond, Num) or (isinstance(cond, (Unary, Binary)) and cond.op in ("!", "&&", "||")):
+            return False
+        other = self.cmov_assigns(s.other) if s.other is not None else []
+        if other is None:
+            return False
+        if other and not (len(assigns) == len(other) == 1 and assigns[0].target == other[0].target
+                          and not reads(fold(assigns[0].expr), assigns[0].target)):
+            return False
+        mark = len(self.code)
+        test = self.gen_test(cond)
+        if isinstance(test, bool):
+            del self.code[mark:]
+            return False
+        value, nz = test
+        targets = {stmt.target for stmt in assigns + other}
+        if isinstance(value, VReg) and value.name in targets:
+            # 条件值会被赋值语句修改
+            del self.code[mark:]
+            return False
+        for stmt in other:
+            self.gen_stmt(stmt)
+        for stmt in assigns:
+            src = fold(stmt.expr)
+            self.emit("MOVN" if nz else "MOVZ", self.var(Var(stmt.target, stmt.line)), self.operand(src), value)
+        return True
+
+    def gen_if(self, s: If):
+        if self.gen_cmov(s):
+            return
+        end = self.new_label()
+        if s.other is None:
+            self.gen_branch(s.cond, end, False)
+            self.gen_stmt(s.then)
+        elif ends_with_jump(s.other) and not ends_with_jump(s.then):
+            # else分支以跳转结束时放在前面，省去then分支末尾的跳转
+            then = self.new_label()
+            self.gen_branch(s.cond, then, True)
+            self.gen_stmt(s.other)
+            self.emit("LABEL", label=then)
+            self.gen_stmt(s.then)
+        else:
+            other = self.new_label()
+            self.gen_branch(s.cond, other, False)
+            self.gen_stmt(s.then)
+            self.emit("JMP", label=end)
+            self.emit("LABEL", label=other)
+            self.gen_stmt(s.other)
+        self.emit("LABEL", label=end)
+
+    def generate(self, program: Block) -> list[Ins]:
+        self.defined_labels: set[str] = set()
+        self.goto_lines: dict[str, int] = {}
+        self.gen_stmt(program)
+        self.emit("HALT")
+        for name, line in self.goto_lines.items():
+            if name not in self.defined_labels:
+                raise CompileError(line, f"未定义的标号: {name}")
+        return self.code
+
+def ends_with_jump(s: Stmt) -> bool:
+    while isinstance(s, Block) and s.stmts:
+        s = s.stmts[-1]
+    return isinstance(s, Jump)
+
+# ---------------- 优化 ----------------
+
+def label_index(code: list[Ins]) -> dict[str, int]:
+    return {ins.label: i for i, ins in enumerate(code) if ins.op == "LABEL"}
+
+def successors(code: list[Ins], labels: dict[str, int], i: int) -> list[int]:
+    ins = code[i]
+    if ins.op == "JMP":
+        return [labels[ins.label]]
+    if ins.op == "HALT":
+        return []
+    succ = [i + 1] if i + 1 < len(code) else []
+    if ins.op in ("JZ", "JNZ"):
+        succ.append(labels[ins.label])
+    return succ
+
+def liveness(code: list[Ins], observed: list[VReg]) -> list[set[VReg]]:
+    """每条指令执行后活跃的虚拟寄存器。"""
+    labels = label_index(code)
+    succ = [successors(code, labels, i) for i in range(len(code))]
+    defs = [ins_defs(ins) for ins in code]
+    uses = [ins_uses(ins, observed) for ins in code]
+    live_in: list[set[VReg]] = [set() for _ in code]
+    live_out: list[set[VReg]] = [set() for _ in code]
+    changed = True
+    while changed:
+        changed = False
+        for i in range(len(code) - 1, -1, -1):
+            out = set()
+            for s in succ[i]:
+                out |= live_in[s]
+            new_in = (out - set(defs[i])) | set(uses[i])
+            if out != live_out[i] or new_in != live_in[i]:
+                live_out[i] = out
+                live_in[i] = new_in
+                changed = True
+    return live_out
+
+def optimize_jumps(code: list[Ins]) -> list[Ins]:
+    """跳转优化：常量条件、不可达代码、跳转串接、跳转到下一条指令、条件跳转跨越无条件跳转。"""
+    changed = True
+    while changed:
+        changed = False
+        out: list[Ins] = []
+        reachable = True
+        for ins in code:
+            if ins.op in ("JZ", "JNZ") and isinstance(ins.b, int):
+                if (ins.b == 0) == (ins.op == "JZ"):
+                    ins = Ins("JMP", label=ins.label)
+                else:
+                    changed = True
+                    continue
+            if ins.op == "LABEL":
+                reachable = True
+            elif not reachable:
+                changed = True
+                continue
+            out.append(ins)
+            if ins.op in ("JMP", "HALT"):
+                reachable = False
+        code = out
+        labels = label_index(code)
+
+        def first_real(i: int) -> int:
+            while i < len(code) and code[i].op == "LABEL":
+                i += 1
+            return i
+
+        for ins in code:
+            if ins.op in ("JMP", "JZ", "JNZ"):
+                seen = {ins.label}
+                while True:
+                    target = first_real(labels[ins.label])
+                    if target < len(code) and code[target].op == "JMP" and code[target].label not in seen:
+                        ins.label = code[target].label
+                        seen.add(ins.label)
+                        changed = True
+                    else:
+                        break
+        out = []
+        i = 0
+        while i < len(code):
+            ins = code[i]
+            if ins.op in ("JMP", "JZ", "JNZ"):
+                nxt = first_real(i + 1)
+                if first_real(labels[ins.label]) == nxt:
+                    changed = True
+                    i += 1
+                    continue
+                # JZ c, L1; JMP L2; L1:  =>  JNZ c, L2
+                if ins.op in ("JZ", "JNZ") and nxt == i + 1 and nxt < len(code) and code[nxt].op == "JMP" \
+                        and first_real(labels[ins.label]) == first_real(nxt + 1):
+                    out.append(Ins("JNZ" if ins.op == "JZ" else "JZ", b=ins.b, label=code[nxt].label))
+                    changed = True
+                    i += 2
+                    continue
+            out.append(ins)
+            i += 1
+        code = out
+        used = {ins.label for ins in code if ins.op in ("JMP", "JZ", "JNZ")}
+        before = len(code)
+        code = [ins for ins in code if ins.op != "LABEL" or ins.label in used]
+        changed = changed or len(code) != before
+    return code
+
+def fold_restored_compare(code: list[Ins], observed: list[VReg]) -> tuple[list[Ins], bool]:
+    """
+    ADD t, a, b; XOR AF, t, b; JZ/JNZ AF, L  =>  JZ/JNZ a, L
+    (a + b) ^ b == 0 当且仅当 a == 0。t与AF在跳转之后不再使用时成立，常见于恢复余数法的循环之后。
+    """
+    live_out = liveness(code, observed)
+    for i in range(len(code) - 2):
+        add, xor, jump = code[i], code[i + 1], code[i + 2]
+        if not (add.op == "ADD" and xor.op == "XOR" and xor.dst is AF_REG and jump.op in ("JZ", "JNZ") and jump.b is AF_REG):
+            continue
+        t = add.dst
+        if t is AF_REG or t in live_out[i + 2] or AF_REG in live_out[i + 2]:
+            continue
+        pair = (xor.a, xor.b) if xor.a is t else (xor.b, xor.a) if xor.b is t else None
+        if pair is None:
+            continue
+        other = pair[1]
+        if add.b is other or (isinstance(other, int) and add.b == other):
+            cond = add.a
+        elif add.a is other or (isinstance(other, int) and add.a == other):
+            cond = add.b
+        else:
+            continue
+        return code[:i] + [Ins(jump.op, b=cond, label=jump.label)] + code[i + 3:], True
+    return code, False
+
+def eliminate_dead_code(code: list[Ins], observed: list[VReg]) -> tuple[list[Ins], bool]:
+    """删除结果不再被使用的指令。只有AF被使用的减法改为CMP。"""
+    live_out = liveness(code, observed)
+    out = []
+    changed = False
+    for ins, live in zip(code, live_out):
+        dst = ins.dst
+        if dst is not None and ins.op not in ("JMP", "JZ", "JNZ") and dst.reg != IO and dst not in live:
+            if ins.op not in FLAG_OPS or AF_REG not in live:
+                changed = True
+                continue
+            if ins.op == "SUB":
+                ins = Ins("CMP", None, ins.a, ins.b)
+                changed = True
+        if ins.op == "CMP" and AF_REG not in live:
+            changed = True
+            continue
+        if ins.op in ("MOVZ", "MOVN") and ins.a is dst:
+            changed = True
+            continue
+        out.append(ins)
+    return out, changed
+
+def optimize(code: list[Ins], observed: list[VReg]) -> list[Ins]:
+    code = optimize_jumps(code)
+    changed = True
+    while changed:
+        code, folded = fold_restored_compare(code, observed)
+        code, removed = eliminate_dead_code(code, observed)
+        changed = folded or removed
+        if changed:
+            code = optimize_jumps(code)
+    return code
+
+# ---------------- 寄存器分配 ----------------
+
+def allocate_registers(code: list[Ins], observed: list[VReg]) -> dict[VReg, int]:
+    """
+    图着色寄存器分配。同时活跃的虚拟寄存器互相冲突；无条件赋值的两端优先分配同一寄存器，以消除赋值指令。
+
+    :return: 普通变量与临时值 -> 寄存器编号
+    """
+    live_out = liveness(code, observed)
+    graph: dict[VReg, set[VReg]] = {}
+    moves: dict[VReg, set[VReg]] = {}
+
+    def node(reg: VReg) -> set[VReg]:
+        return graph.setdefault(reg, set())
+
+    for ins, live in zip(code, live_out):
+        for reg in ins_uses(ins, observed):
+            node(reg)
+        source = ins.a if is_unconditional_mov(ins) and isinstance(ins.a, VReg) else None
+        for d in ins_defs(ins):
+            node(d)
+            for other in live:
+                if other is not d and other is not source:
+                    node(d).add(other)
+                    node(other).add(d)
+        if source is not None:
+            moves.setdefault(ins.dst, set()).add(source)
+            moves.setdefault(source, set()).add(ins.dst)
+
+    colors: dict[VReg, int] = {reg: reg.reg for reg in graph if reg.pinned}
+    order = sorted((reg for reg in graph if not reg.pinned), key=lambda reg: -len(graph[reg]))
+    for reg in order:
+        taken = {colors[n] for n in graph[reg] if n in colors}
+        preferred = [colors[m] for m in moves.get(reg, ()) if m in colors]
+        candidates = [c for c in preferred + list(ALLOC_POOL) if c in ALLOC_POOL and c not in taken]
+        if not candidates:
+            conflicts = ", ".join(sorted(n.name for n in graph[reg] if n is not AF_REG and not n.name.startswith("_t")))
+            what = "表达式的临时值" if reg.name.startswith("_t") else reg.name
+            raise CompileError(0, f"寄存器不足：无法为{what}分配寄存器，同时活跃的变量: {conflicts}")
+        colors[reg] = candidates[0]
+    return {reg: color for reg, color in colors.items() if not reg.pinned}
+
+# ---------------- 输出 ----------------
+
+def format_operand(x: Union[Operand, str]) -> str:
+    if isinstance(x, VReg):
+        return isa.REGISTER_NAMES[x.reg]
+    return str(x)
+
+def layout(code: list[Ins]) -> tuple[list[tuple[str, list[str]]], dict[str, int]]:
+    """
+    选择每条指令的格式并确定标记地址。目标地址或常量不超过7的跳转与赋值使用2字节的短格式。
+
+    :return: (汇编指令名, 操作数) 列表(标记行的指令名为空串，操作数为标记名), 标记表
+    """
+    lines: list[tuple[str, list[str]]] = []
+    for ins in code:
+        if ins.op == "LABEL":
+            lines.append(("", [ins.label]))
+        elif ins.op == "HALT":
+            lines.append(("", [f"_halt{len(lines)}"]))
+            lines.append(("JMP", [f"_halt{len(lines) - 1}", "0"]))
+        elif ins.op in ("JMP", "JZ", "JNZ"):
+            op = "JMP" if ins.op == "JMP" else "JN" if ins.op == "JNZ" else "JZ"
+            lines.append((op, [ins.label, "0" if ins.op == "JMP" else format_operand(ins.b)]))
+        elif ins.op in ("MOVZ", "MOVN"):
+            lines.append((ins.op, [format_operand(ins.dst), format_operand(ins.a), format_operand(ins.b)]))
+        else:
+            args = [format_operand(x) for x in (ins.dst, ins.a, ins.b) if x is not None]
+            lines.append((ins.op, args))
+
+    def resolve(op: str, args: list[str], short: bool) -> tuple[str, list[str], int]:
+        if op in ("JMP", "JZ", "JN"):
+            base = "MOVN" if op == "JN" else "MOVZ"
+            if short:
+                return base, ["PC", *args], 2
+            return base[:3] + "L" + base[3:], ["PC", *args], 3
+        if op in ("MOVZ", "MOVN"):
+            if args[1].isdigit() and int(args[1]) > 7:
+                return op[:3] + "L" + op[3:], args, 3
+            return op, args, 2
+        if op == "":
+            return op, args, 0
+        return op, args, isa.OPS[op].length
+
+    # 从全部为长格式开始，反复缩短目标地址不超过7的跳转，直到不再变化
+    short = [False] * len(lines)
+    while True:
+        flags: dict[str, int] = {}
+        addr = 0
+        for (op, args), s in zip(lines, short):
+            if op == "":
+                flags[args[0]] = addr
+            addr += resolve(op, args, s)[2]
+        new_short = [op in ("JMP", "JZ", "JN") and flags[args[0]] <= 7 for op, args in lines]
+        if new_short == short:
+            break
+        short = [a or b for a, b in zip(short, new_short)]
+    out = []
+    for (op, args), s in zip(lines, short):
+        name, args, _ = resolve(op, args, s)
+        out.append((name, args))
+    return out, flags
+
+class CompileResult:
+    def __init__(self):
+        self.asm = ""
+        self.size = 0 # 字节码长度
+        self.allocation: dict[str, str] = {} # 变量名 -> 寄存器名
+
+def compile_c(code: str, filename: str = "") -> CompileResult:
+    """将C代码编译为汇编代码。出错时抛出CompileError。"""
+    parser = Parser(tokenize(code))
+    program = parser.parse_program()
+    gen = CodeGen(parser.declarations)
+    ir = gen.generate(program)
+    observed = gen.observed
+    ir = optimize(ir, observed)
+    allocation = allocate_registers(ir, observed)
+    for reg, color in allocation.items():
+        reg.reg = color
+    # 分配后同一寄存器之间的赋值被消除
+    ir = [ins for ins in ir if not (ins.op in ("MOVZ", "MOVN") and isinstance(ins.a, VReg) and ins.a.reg == ins.dst.reg)]
+    ir = optimize_jumps(ir)
+    lines, flags = layout(ir)
+
+    result = CompileResult()
+    result.allocation = {reg.name: isa.REGISTER_NAMES[reg.reg] for reg in gen.vars.values() if reg.reg is not None}
+    asm = [f"// 由minic.py从 {os.path.basename(filename) or 'C代码'} 生成"]
+    mapping = ", ".join(f"{name} -> {reg}" for name, reg in result.allocation.items() if name != reg)
+    if mapping:
+        asm.append(f"// 变量分配: {mapping}")
+    for op, args in lines:
+        if op == "":
+            asm.append(f"{args[0]}:")
+        else:
+            asm.append(f"    {op} {', '.join(args)}".rstrip())
+    result.asm = "\n".join(asm) + "\n"
+    result.size = sum(isa.OPS[op].length for op, _ in lines if op)
+    if result.size > ROM_SIZE:
+        raise CompileError(0, f"程序长度为{result.size}字节，超出ROM大小{ROM_SIZE}字节")
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="DZC-8M Mini C Compiler")
+    parser.add_argument("file", help="输入的C代码文件")
+    parser.add_argument("-o", "--output",
+                    nargs='?',
+                    const=1,
+                    default=None,
+                    help="将汇编代码输出到文件。不指定则输出到标准输出，使用此选项但不指定文件则输出到同名同目录下的.asm文件")
+    parser.add_argument("--version", action="version", version=f"Eggy Mini C Compiler\n{__version__}\nfor DZC-8M Plus Instruction Set")
+    args = parser.parse_args()
+    with open(args.file, "r", encoding="utf-8-sig") as f: # 兼容带BOM的文件
+        code = f.read()
+    try:
+        result = compile_c(code, args.file)
+    except CompileError as e:
+        import cp
+        lines = code.splitlines()
+        if 0 < e.line <= len(lines):
+            cp.print_error(e.line, e.message, lines[e.line - 1])
+        else:
+            print(f"错误: {e.message}")
+        print("编译失败，存在错误。")
+        return 1
+    if not args.output:
+        print(result.asm, end="")
+        return 0
+    filename = os.path.splitext(args.file)[0] + ".asm" if args.output == 1 else args.output
+    with open(filename, "w", encoding="utf-8") as f:
+        f.write(result.asm)
+    print(f"汇编代码已输出到 {filename}，共{result.size}字节")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
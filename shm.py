@@ -0,0 +1,299 @@
+"""
+共享内存状态导出。vm.py --shm NAME 将寄存器、PC历史环与计数器发布到
+multiprocessing.shared_memory 块中，任意数量的本地进程可以无拷贝地读取，不经过管道，不影响虚拟机运行速度。
+
+除PC历史环为本机字节序外，所有整数均为小端序。
+
+共享内存块布局(64 + 2 * N 字节):
+    [0:4]   魔数 b"DZSM"
+    [4:6]   版本 u16
+    [6:8]   PC历史环容量 N u16
+    [8:12]  序列号 u32，顺序锁
+    [12:16] 状态标志 u32，见 FLAG_*
+    [16:24] 已执行的步数 u64
+    [24:32] 已发布的次数 u64
+    [32:40] 发布时间 f64，time.time()
+    [40:48] 寄存器 PC AF SP IO R0 R1 R2 R3，各u8
+    [48]    当前bank u8
+    [49]    待切换的bank u8，没有时为0xFF
+    [50:52] bank数量 u16
+    [52:56] 保留，为0
+    [56:64] 已记录的PC总数 u64
+    [64:]   PC历史环，N项u16，为程序文件中的偏移 bank * 0xFF + bank内地址。
+            第i个记录的PC位于 i % N 处
+
+顺序锁协议:
+    写入者(只有一个)先将序列号加1变为奇数，写入其余所有字段，再加1变为偶数。
+    读取者读取序列号，为奇数时重试；复制整个块后再次读取序列号，两次相同则复制的内容一致，否则重试。
+    读取者从不写入共享内存，因此读取者数量不限，也不会阻塞写入者。
+"""
+import os, sys
+import time
+import array
+import struct
+import argparse
+from multiprocessing import shared_memory, resource_tracker
+from typing import NamedTuple, Optional
+
+import isa
+import vm
+
+__version__ = "0.1.0"
+
+MAGIC = b"DZSM"
+VERSION = 1
+
+DEFAULT_RING = 256 # PC历史环默认容量
+DEFAULT_INTERVAL = 4096 # 默认每执行多少步发布一次
+NO_BANK = 0xFF
+
+FLAG_PAUSE = 0b01 # PAUSE信号
+FLAG_EXITED = 0b10 # 虚拟机已退出，之后不再更新
+
+header_struct = struct.Struct("<4sHH")
+seq_struct = struct.Struct("<I")
+state_struct = struct.Struct("<IQQd8sBBH4xQ")
+SEQ_OFFSET = header_struct.size
+STATE_OFFSET = SEQ_OFFSET + seq_struct.size
+RING_OFFSET = STATE_OFFSET + state_struct.size
+
+class SharedStateException(Exception):
+    pass
+
+class StateSnapshot(NamedTuple):
+    """一次一致的读取结果。"""
+    seq: int
+    flags: int
+    steps: int
+    publishes: int
+    time: float
+    registers: tuple[int, ...]
+    bank: int
+    bank_pending: Optional[int]
+    bank_count: int
+    history: list[int] # 最近执行的PC，从旧到新
+
+    @property
+    def exited(self) -> bool:
+        return bool(self.flags & FLAG_EXITED)
+
+def block_size(ring: int) -> int:
+    return RING_OFFSET + ring * 2
+
+class StatePublisher:
+    """
+    创建共享内存块并发布虚拟机状态。PC历史环在进程内的数组中记录，发布时整体复制。
+    """
+    def __init__(self, name: str, ring: int = DEFAULT_RING):
+        if not 0 < ring <= 0xFFFF:
+            raise ValueError(f"PC历史环容量必须在1到{0xFFFF}之间")
+        self.ring = array.array("H", bytes(ring * 2))
+        self.head = 0 # 已记录的PC总数
+        self.seq = 0
+        self.publishes = 0
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=block_size(ring))
+        except FileExistsError:
+            raise SharedStateException(f"共享内存 {name} 已存在。另一台虚拟机正在使用，或上次未正常退出")
+        self.buf = self.shm.buf
+        header_struct.pack_into(self.buf, 0, MAGIC, VERSION, ring)
+        seq_struct.pack_into(self.buf, SEQ_OFFSET, self.seq)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def record(self, pc: int):
+        ring = self.ring
+        ring[self.head % len(ring)] = pc
+        self.head += 1
+
+    def publish(self, ctx: vm.Ctx_t, steps: int, flags: int = 0):
+        buf = self.buf
+        if ctx.Pause_signal:
+            flags |= FLAG_PAUSE
+        self.seq += 1
+        seq_struct.pack_into(buf, SEQ_OFFSET, self.seq & 0xFFFFFFFF)
+        self.publishes += 1
+        pending = ctx.Bank_pending if ctx.Bank_pending is not None else NO_BANK
+        state_struct.pack_into(buf, STATE_OFFSET, flags, steps, self.publishes, time.time(),
+                               bytes(ctx.Registers), ctx.Bank, pending, len(ctx.Banks), self.head)
+        buf[RING_OFFSET:RING_OFFSET + len(self.ring) * 2] = memoryview(self.ring).cast("B")
+        self.seq += 1
+        seq_struct.pack_into(buf, SEQ_OFFSET, self.seq & 0xFFFFFFFF)
+
+    def close(self, unlink: bool = True):
+        """释放共享内存。读取者仍持有映射时，内容保留到其关闭为止。"""
+        self.buf = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+class PublishingRunner:
+    """
+    在InstructionRunner外包装状态发布。接口与InstructionRunner相同，可直接替换vm.py中使用的执行器。
+    每步记录PC，每interval步发布一次；调用者另外在刷新界面时调用publish。
+    """
+    iter_pauses = vm.InstructionRunner.iter_pauses
+
+    def __init__(self, runner: vm.InstructionRunner, publisher: StatePublisher, interval: int = DEFAULT_INTERVAL):
+        self.runner = runner
+        self.ctx = runner.ctx
+        self.publisher = publisher
+        self.interval = interval
+        self.next_publish = runner.steps + interval
+
+    @property
+    def steps(self) -> int:
+        return self.runner.steps
+
+    @property
+    def cur_addr(self) -> int:
+        return self.runner.cur_addr
+
+    @property
+    def cur_bank(self) -> int:
+        return self.runner.cur_bank
+
+    def run_step(self):
+        ctx = self.ctx
+        self.publisher.record(ctx.Bank * 0xFF + ctx.Registers[vm.PC])
+        self.runner.run_step()
+        if self.runner.steps >= self.next_publish:
+            self.publish()
+
+    def publish(self, flags: int = 0):
+        self.publisher.publish(self.ctx, self.runner.steps, flags)
+        self.next_publish = self.runner.steps + self.interval
+
+def attach(name: str) -> shared_memory.SharedMemory:
+    """
+    以读取者身份打开共享内存块。
+
+    :raises SharedStateException: 不存在或不是虚拟机状态块
+    """
+    try:
+        shm = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        raise SharedStateException(f"共享内存 {name} 不存在。请先运行 vm.py --shm {name}")
+    # 3.13之前打开已有的块也会被resource_tracker登记，读取者退出时会删除它
+    if sys.version_info < (3, 13) and os.name == "posix":
+        resource_tracker.unregister(shm._name, "shared_memory")
+    if shm.size < RING_OFFSET or bytes(shm.buf[:4]) != MAGIC:
+        shm.close()
+        raise SharedStateException(f"共享内存 {name} 不是虚拟机状态块")
+    return shm
+
+class StateReader:
+    """按顺序锁协议读取一致的快照。"""
+    MAX_RETRIES = 1000
+
+    def __init__(self, name: str):
+        self.shm = attach(name)
+        self.buf = self.shm.buf
+        _, version, ring = header_struct.unpack_from(self.buf, 0)
+        if version != VERSION:
+            self.close()
+            raise SharedStateException(f"不支持的版本 {version}")
+        self.ring = ring
+        self.size = block_size(ring)
+
+    def seq(self) -> int:
+        return seq_struct.unpack_from(self.buf, SEQ_OFFSET)[0]
+
+    def snapshot(self) -> StateSnapshot:
+        """
+        :raises SharedStateException: 多次重试仍未读到一致的内容
+        """
+        buf = self.buf
+        for _ in range(self.MAX_RETRIES):
+            before = self.seq()
+            if before & 1:
+                continue
+            data = bytes(buf[:self.size])
+            if self.seq() == before:
+                break
+        else:
+            raise SharedStateException("写入过于频繁，未能读取一致的快照")
+        flags, steps, publishes, stamp, registers, bank, pending, bank_count, head = \
+            state_struct.unpack_from(data, STATE_OFFSET)
+        ring = array.array("H", data[RING_OFFSET:])
+        count = min(head, self.ring)
+        history = [ring[i % self.ring] for i in range(head - count, head)]
+        return StateSnapshot(before, flags, steps, publishes, stamp, tuple(registers), bank,
+                             None if pending == NO_BANK else pending, bank_count, history)
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+
+def out_snapshot(snap: StateSnapshot, rate: Optional[float], history: int) -> list[str]:
+    """查看器的显示内容，每项一行。"""
+    status = "exited" if snap.exited else "PAUSE" if snap.flags & FLAG_PAUSE else "running"
+    string = [f"Steps = {snap.steps}" + (f" ({rate:.1f} steps/s)" if rate is not None else "") + f", {status}"]
+    for reg, value in enumerate(snap.registers):
+        bits = " ".join(f"{value:08b}")
+        string.append(f"{isa.REGISTER_NAMES[reg]} = {bits} = {value}")
+    if snap.bank_count > 1:
+        pending = f", pending {snap.bank_pending}" if snap.bank_pending is not None else ""
+        string.append(f"Bank = {snap.bank}/{snap.bank_count}{pending}")
+    recent = snap.history[-history:] if history > 0 else []
+    string.append("PC history: " + " ".join(f"{pc:X}" for pc in recent))
+    return string
+
+def watch(reader: StateReader, fps: float, history: int):
+    """持续显示，直到虚拟机退出。执行速度由相邻两次发布计算。"""
+    snap = last = reader.snapshot()
+    rate = None
+    shown = 0
+    sys.stdout.write(vm.ANSI_CURSOR_HIDE)
+    try:
+        while True:
+            string = out_snapshot(snap, rate, history)
+            if shown:
+                sys.stdout.write(vm.ANSI_CURSOR_UPS(shown))
+            sys.stdout.write("".join(vm.ANSI_CLEAR_LINE + line + "\n" for line in string))
+            sys.stdout.flush()
+            shown = len(string)
+            if snap.exited:
+                return
+            time.sleep(1 / fps)
+            snap = reader.snapshot()
+            if snap.time > last.time:
+                rate = (snap.steps - last.steps) / (snap.time - last.time)
+                last = snap
+    finally:
+        sys.stdout.write(vm.ANSI_CURSOR_SHOW)
+
+def main():
+    parser = argparse.ArgumentParser(description="DZC-8M Shared State Viewer")
+    parser.add_argument("name", help="共享内存块名称，与vm.py --shm相同")
+    parser.add_argument("--fps", type=float, default=10.0, help="刷新率。默认10")
+    parser.add_argument("-n", "--history", type=int, default=16, help="显示最近执行的PC数。默认16")
+    parser.add_argument("-1", "--once", action="store_true", help="只读取并输出一次")
+    parser.add_argument("--version", action="version", version=f"Eggy Shared State Viewer\n{__version__}\nfor DZC-8M Plus Instruction Set")
+    args = parser.parse_args()
+    if args.fps <= 0:
+        parser.error("--fps必须为正数")
+
+    try:
+        reader = StateReader(args.name)
+    except SharedStateException as e:
+        print(e)
+        return 1
+    try:
+        if args.once:
+            print("\n".join(out_snapshot(reader.snapshot(), None, args.history)))
+        else:
+            watch(reader, args.fps, args.history)
+    except KeyboardInterrupt:
+        pass
+    except SharedStateException as e:
+        print(e)
+        return 1
+    finally:
+        reader.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+"""
+bank切换的回归测试：用link.link_banked链接，在vm.BankedInstructionRunner中执行。
+"""
+import os, sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cp
+import vm
+import link
+
+MAX_STEPS = 5000
+
+def link_sources(*sources: str) -> bytes:
+    modules = []
+    for i, code in enumerate(sources):
+        result = cp.assemble(code, no_warn=True, relocatable=True)
+        assert not result.has_error, result.diagnostics
+        modules.append(link.LinkModule.from_result(f"m{i}.asm", result, code))
+    result = link.link_banked(modules, link.MAX_BANKS)
+    assert not result.has_error, result.errors
+    return bytes(result.binary)
+
+def run_banked(program: bytes) -> vm.Ctx_t:
+    ctx = vm.Ctx_t()
+    ctx.load_banks(program)
+    runner = vm.BankedInstructionRunner(ctx)
+    for _ in range(MAX_STEPS):
+        runner.run_step()
+        if ctx.Pause_signal:
+            return ctx
+    raise AssertionError("程序未在限定步数内暂停")
+
+class BankSwitchTest(unittest.TestCase):
+    def test_stub_target_is_fall_through(self):
+        # bank 1的代码占124字节，跳板(6字节)之后的地址130恰好是bank 0中back的地址
+        a = "\n".join([".global back", "    MOVLZ PC, far, 0"] + ["    NOP"] * 127 +
+                      ["back:", "    MOVLZ R1, 77, 0", "    PAUSE", "stop:", "    MOVLZ PC, stop, 0"]) + "\n"
+        c = "\n".join([".global far", "far:", "    MOVLZ R0, 55, 0"] + ["    NOP"] * 118 + ["    MOVLZ PC, back, 0"]) + "\n"
+        program = link_sources(a, c)
+        self.assertEqual(program[0xFF + 127:0xFF + 130], cp.assemble("    MOVLZ PC, 130, 0\n").binary)
+        ctx = run_banked(program)
+        self.assertEqual(ctx.Bank, 0)
+        self.assertEqual(ctx.Registers[vm.R0], 55)
+        self.assertEqual(ctx.Registers[vm.R1], 77)
+
+    def test_condition_not_met(self):
+        # 条件不满足的条件赋值不写入PC，不切换bank
+        bank0 = cp.assemble("    MOVLZ IO, 0xF1, 0\n    MOVLN PC, 3, R0\n    MOVZ PC, 7, 0\n", no_warn=True).binary
+        ctx = vm.Ctx_t()
+        ctx.load_banks(bank0.ljust(0xFF, b"\x10") + bytes(8))
+        runner = vm.BankedInstructionRunner(ctx)
+        runner.run_step()
+        runner.run_step()
+        self.assertEqual((ctx.Bank, ctx.Bank_pending), (0, 1))
+        runner.run_step()
+        self.assertEqual((ctx.Bank, ctx.Bank_pending, ctx.Registers[vm.PC]), (1, None, 7))
+
+class BankedReloadTest(unittest.TestCase):
+    def test_reload_keeps_bank(self):
+        # 300字节的程序不变地重新加载，bank 1中的PC保持原位置
+        program = bytes([0x10]) * 300
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "banked.bin")
+            with open(path, "wb") as f:
+                f.write(program)
+            ctx = vm.Ctx_t()
+            ctx.load_banks(program)
+            reloader = vm.HotReloader(path, False, vm.load_image(path, False))
+            ctx.select_bank(1)
+            ctx.Registers[vm.PC] = 15
+            reloader.mtime = None
+            reloader.next_check = 0
+            self.assertTrue(reloader.poll(ctx))
+        self.assertEqual((ctx.Bank, ctx.Registers[vm.PC]), (1, 15))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+"""
+vm.DebugConsole 的回归测试：一次写入的多条命令全部执行，不等待更多输入。
+"""
+import os, sys
+import io
+import asyncio
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cp
+import vm
+
+def make_console(code: str) -> vm.DebugConsole:
+    result = cp.assemble(code, no_warn=True)
+    ctx = vm.Ctx_t()
+    ctx.load_program(result.binary)
+    image = vm.ProgramImage(result.binary, code, list(result.lines), dict(result.flag_table))
+    console = vm.DebugConsole(ctx, vm.InstructionRunner(ctx), image, out=io.StringIO())
+    console.rows, console.columns = 40, 80
+    return console
+
+class ReadCommandsTest(unittest.TestCase):
+    def test_commands_in_one_write(self):
+        console = make_console("loop:\n    INC R0\n    MOVLZ PC, loop, 0\n")
+        read_fd, write_fd = os.pipe()
+        stdin = os.fdopen(read_fd, "r")
+
+        async def scenario() -> int:
+            console.wake = asyncio.Event()
+            machine = asyncio.create_task(console.run_machine())
+            commands = asyncio.create_task(console.read_commands(stdin))
+            # 三条命令在一次写入中到达，之后不再有输入
+            os.write(write_fd, b"pause off\nspeed 1000\nrun\n")
+            await asyncio.sleep(0.5)
+            steps = console.runner.steps
+            os.write(write_fd, b"quit\n")
+            await asyncio.wait_for(commands, 1)
+            await asyncio.wait_for(machine, 1)
+            return steps
+
+        try:
+            steps = asyncio.run(scenario())
+        finally:
+            os.close(write_fd)
+            stdin.close()
+        self.assertFalse(console.stop_on_pause)
+        self.assertIsNotNone(console.clock)
+        self.assertGreater(steps, 100)
+        self.assertTrue(console.quit)
+
+    def test_partial_line_at_eof(self):
+        console = make_console("    PAUSE\n")
+        read_fd, write_fd = os.pipe()
+        stdin = os.fdopen(read_fd, "r")
+        os.write(write_fd, b"set R1 5\nset R2 6")
+        os.close(write_fd)
+
+        async def scenario():
+            console.wake = asyncio.Event()
+            await asyncio.wait_for(console.read_commands(stdin), 1)
+
+        try:
+            asyncio.run(scenario())
+        finally:
+            stdin.close()
+        self.assertEqual(console.ctx.Registers[vm.R1:vm.R2 + 1], [5, 6])
+
+if __name__ == "__main__":
+    unittest.main()
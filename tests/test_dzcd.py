@@ -0,0 +1,35 @@
+"""
+dzcd.ToolchainService 的回归测试：max_steps/max_events为null时使用默认值，非法值返回错误。
+"""
+import os, sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import dzcd
+
+# 不会PAUSE的程序
+LOOP = "loop:\n    INC R0\n    MOVLZ PC, loop, 0\n"
+
+class StepLimitTest(unittest.TestCase):
+    def setUp(self):
+        self.service = dzcd.ToolchainService()
+
+    def test_null_uses_default(self):
+        response = self.service.handle({"op": "run", "source": LOOP, "max_events": None, "max_steps": None})
+        self.assertTrue(response["ok"], response)
+        self.assertEqual(response["events"], [])
+        response = self.service.handle({"op": "profile", "source": LOOP, "max_steps": None})
+        self.assertTrue(response["ok"], response)
+
+    def test_invalid_limits(self):
+        for op in ("run", "profile"):
+            for value in (0, -1, "100", 1.5, True, dzcd.MAX_STEPS + 1):
+                with self.subTest(op=op, value=value):
+                    response = self.service.handle({"op": op, "source": LOOP, "max_steps": value})
+                    self.assertFalse(response["ok"])
+        response = self.service.handle({"op": "run", "source": LOOP, "max_events": -1, "max_steps": 10})
+        self.assertFalse(response["ok"])
+
+if __name__ == "__main__":
+    unittest.main()
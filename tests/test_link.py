@@ -0,0 +1,70 @@
+"""
+link.py 的回归测试：只有 .global 导出的标记跨模块可见，各模块的本地标记互不冲突。
+"""
+import os, sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cp
+import dzo
+import vm
+import link
+
+EXAMPLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "example")
+
+def module(name: str, code: str) -> link.LinkModule:
+    result = cp.assemble(code, no_warn=True, relocatable=True)
+    assert not result.has_error, result.diagnostics
+    return link.LinkModule.from_result(name, result, code)
+
+def first_pause(program: bytes) -> tuple[int, ...]:
+    ctx = vm.Ctx_t()
+    ctx.load_program(program)
+    return next(vm.InstructionRunner(ctx).iter_pauses(max_events=1, max_steps=1000)).registers
+
+class LinkTest(unittest.TestCase):
+    def test_local_labels(self):
+        main = module("main.asm", "    MOVZ R3, 2, 0\nloop:\n    DEC R3\n    MOVLN PC, loop, R3\n"
+                                  "    MOVLZ PC, twice, 0\n")
+        lib = module("lib.asm", ".global twice\ntwice:\n    MOVZ R1, 5, 0\nloop:\n    DEC R1\n    MOVLN PC, loop, R1\n"
+                                "    MOVLZ R2, 9, 0\n    MOVLZ PC, done, 0\n.global done\ndone:\n    PAUSE\n")
+        result = link.link([main, lib])
+        self.assertFalse(result.has_error, result.errors)
+        self.assertEqual(set(result.symbols), {"twice", "done"})
+        self.assertIn("main.loop", result.local_symbols)
+        self.assertIn("lib.loop", result.local_symbols)
+        registers = first_pause(bytes(result.binary))
+        self.assertEqual((registers[vm.R1], registers[vm.R2], registers[vm.R3]), (0, 9, 0))
+
+    def test_unexported_reference(self):
+        main = module("main.asm", "    MOVLZ PC, helper, 0\n")
+        lib = module("lib.asm", "helper:\n    PAUSE\n")
+        result = link.link([main, lib])
+        self.assertEqual(len(result.errors), 1)
+        self.assertIn(f"{cp.EXPORT_DIRECTIVE} helper", result.errors[0])
+
+    def test_duplicate_export(self):
+        a = module("a.asm", ".global x\nx:\n    NOP\n")
+        b = module("b.asm", ".global x\nx:\n    NOP\n")
+        self.assertTrue(link.link([a, b]).has_error)
+
+    def test_undefined_export(self):
+        result = cp.assemble(".global nothere\n    NOP\n", relocatable=True)
+        self.assertTrue(result.has_error)
+
+    def test_object_round_trip(self):
+        with open(os.path.join(EXAMPLE, "mul_lib.asm"), "r", encoding="utf-8") as f:
+            code = f.read()
+        data = cp.out_relocatable_object(cp.assemble(code, relocatable=True), code)
+        with open(os.path.join(EXAMPLE, "linkdemo.asm"), "r", encoding="utf-8") as f:
+            demo = module("linkdemo.asm", f.read())
+        lib = link.LinkModule.from_object("mul_lib.o", dzo.ObjectFile(data))
+        self.assertEqual(lib.exports, {"mul"})
+        self.assertIn("mul_loop", lib.symbols)
+        result = link.link([demo, lib])
+        self.assertFalse(result.has_error, result.errors)
+        self.assertEqual(first_pause(bytes(result.binary))[vm.R2], 42)
+
+if __name__ == "__main__":
+    unittest.main()
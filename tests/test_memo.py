@@ -0,0 +1,56 @@
+"""
+memo.py 的回归测试：热重载替换程序后，记忆化区域按新程序重新确定，不使用旧程序的缓存。
+"""
+import os, sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import vm
+import memo
+
+SOURCE = """\
+loop:
+    MOVLZ SP, back, 0
+    MOVLZ PC, f, 0
+back:
+    PAUSE
+    MOVLZ PC, loop, 0
+f:
+    ADD R0, R1, {}
+    MOVZ PC, SP, 0
+"""
+
+class MemoReloadTest(unittest.TestCase):
+    def test_reload_clears_regions(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "f.asm")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(SOURCE.format(1))
+            image = vm.load_image(path, True)
+            ctx = vm.Ctx_t()
+            ctx.load_program(image.rom)
+            ctx.Registers[vm.R1] = 3
+            specs = [memo.parse_region("f")]
+            runner = memo.MemoRunner(vm.InstructionRunner(ctx), memo.resolve_regions(specs, image.flags, len(image.rom)))
+            reloader = vm.HotReloader(path, True, image,
+                                      on_reload=lambda new: runner.reload(specs, new.flags, len(new.rom)))
+            events = runner.iter_pauses(max_steps=1000)
+            for _ in range(3):
+                self.assertEqual(next(events).registers[vm.R0], 4)
+            self.assertEqual(runner.regions[image.flags["f"]].hits, 2)
+
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(SOURCE.format(5))
+            reloader.mtime = None
+            reloader.next_check = 0
+            self.assertTrue(reloader.poll(ctx))
+            events = runner.iter_pauses(max_steps=1000)
+            for _ in range(2):
+                self.assertEqual(next(events).registers[vm.R0], 8)
+            region = runner.regions[reloader.image.flags["f"]]
+            self.assertEqual((region.misses, region.hits), (1, 1))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+"""
+minic.py 比较运算的回归测试：编译、汇编后在虚拟机中执行，与按8位无符号运算的参考结果比较。
+"""
+import os, sys
+import random
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cp
+import vm
+import minic
+
+MAX_STEPS = 10000
+
+# 比较两侧的表达式及其参考值，x固定在R0，y为普通变量(由R2赋值)
+OPERANDS = [
+    ("R0", lambda x, y: x),
+    ("y", lambda x, y: y),
+    ("5", lambda x, y: 5),
+    ("200", lambda x, y: 200),
+    ("~R0 | -3", lambda x, y: ~x | 0xFD),
+    ("-R0 | y", lambda x, y: -x | y),
+    ("R0 | 253", lambda x, y: x | 253),
+    ("R0 | y", lambda x, y: x | y),
+    ("(R0 + y) ^ (y - 9)", lambda x, y: (x + y) ^ (y - 9)),
+    ("R0 >> 1", lambda x, y: x >> 1),
+    ("(y << 2) & 0xF0", lambda x, y: (y << 2) & 0xF0),
+]
+
+COMPARES = {
+    "==": lambda a, b: a == b,
+    "!=": lambda a, b: a != b,
+    "<": lambda a, b: a < b,
+    "<=": lambda a, b: a <= b,
+    ">": lambda a, b: a > b,
+    ">=": lambda a, b: a >= b,
+}
+
+def run_c(code: str, registers: dict[int, int]) -> list[int]:
+    """编译并执行C代码，返回第一次PAUSE时的寄存器。"""
+    result = cp.assemble(minic.compile_c(code).asm, no_warn=True)
+    assert not result.has_error, result.diagnostics
+    ctx = vm.Ctx_t()
+    ctx.load_program(result.binary)
+    for reg, value in registers.items():
+        ctx.Registers[reg] = value
+    runner = vm.InstructionRunner(ctx)
+    for _ in range(MAX_STEPS):
+        runner.run_step()
+        if ctx.Pause_signal:
+            return ctx.Registers
+    raise AssertionError("程序未在限定步数内暂停")
+
+class CompareTest(unittest.TestCase):
+    def check(self, left: int, op: str, right: int, x: int, y: int):
+        (left_src, left_ref), (right_src, right_ref) = OPERANDS[left], OPERANDS[right]
+        code = ("uint8_t R0, R1, R2, y;\n"
+                "int main() {\n"
+                "    y = R2;\n"
+                f"    if (({left_src}) {op} ({right_src})) R1 = 1; else R1 = 2;\n"
+                "    pause();\n"
+                "}\n")
+        expected = 1 if COMPARES[op](left_ref(x, y) & 0xFF, right_ref(x, y) & 0xFF) else 2
+        registers = run_c(code, {vm.R0: x, vm.R2: y})
+        self.assertEqual(registers[vm.R1], expected, f"{code}R0={x}, y={y}")
+
+    def test_reported(self):
+        self.check(4, "==", 5, 137, 186)
+        self.check(6, "==", 7, 137, 0)
+        self.check(6, "==", 7, 137, 253)
+
+    def test_all_pairs(self):
+        rng = random.Random(38)
+        values = (0, 1, 7, 8, 127, 128, 137, 186, 253, 255)
+        for left in range(len(OPERANDS)):
+            for right in range(len(OPERANDS)):
+                for op in COMPARES:
+                    x, y = rng.choice(values), rng.choice(values)
+                    with self.subTest(left=OPERANDS[left][0], op=op, right=OPERANDS[right][0], x=x, y=y):
+                        self.check(left, op, right, x, y)
+
+    def test_condition_value(self):
+        # 非比较的复合条件在AF中求值
+        code = ("uint8_t R0, R1, R2, y;\n"
+                "int main() {\n"
+                "    y = R2;\n"
+                "    if ((R0 | 3) ^ (y | 3)) R1 = 1; else R1 = 2;\n"
+                "    pause();\n"
+                "}\n")
+        for x, y in ((4, 4), (4, 8), (0, 3), (3, 0), (200, 201)):
+            expected = 1 if (x | 3) ^ (y | 3) else 2
+            self.assertEqual(run_c(code, {vm.R0: x, vm.R2: y})[vm.R1], expected)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+"""
+cp.stable_layout 的回归测试：对随机程序做随机修改，稳定布局与顺序布局的字节码在虚拟机中执行的结果必须相同。
+"""
+import os, sys
+import random
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cp
+import vm
+
+MAX_STEPS = 2000
+REGS = ("R0", "R1", "R2", "R3")
+
+def random_instruction(rng: random.Random, block: int, blocks: int) -> str:
+    """随机指令。跳转只向后，程序总会执行到结尾的PAUSE。"""
+    kind = rng.randrange(6)
+    if kind == 0 and block + 1 < blocks:
+        target = rng.randrange(block + 1, blocks)
+        return f"{rng.choice(('MOVLN', 'MOVLZ'))} PC, L{target}, {rng.choice(REGS)}"
+    if kind == 1:
+        return f"MOVLZ {rng.choice(REGS)}, {rng.randrange(256)}, 0"
+    if kind == 2:
+        return f"{rng.choice(('INC', 'DEC'))} {rng.choice(REGS)}"
+    if kind == 3:
+        return f"NOT {rng.choice(REGS)}, {rng.choice(REGS)}"
+    return f"{rng.choice(('ADD', 'SUB', 'XOR', 'OR', 'AND'))} {rng.choice(REGS)}, {rng.choice(REGS)}, {rng.randrange(8)}"
+
+def render(blocks: list[list[str]]) -> str:
+    lines = []
+    for i, block in enumerate(blocks):
+        if i:
+            lines.append(f"L{i}:")
+        lines.extend("    " + ins for ins in block)
+    lines.append("    PAUSE")
+    return "\n".join(lines) + "\n"
+
+def random_program(rng: random.Random) -> list[list[str]]:
+    count = rng.randrange(2, 8)
+    # 程序开头的块常只有一条指令，使其变大后地址0处的转发跳转覆盖后一块的原位置
+    sizes = [rng.choice((1, 1, 2, 3, 4))] + [rng.randrange(5) for _ in range(count - 1)]
+    return [[random_instruction(rng, i, count) for _ in range(size)] for i, size in enumerate(sizes)]
+
+def random_edit(rng: random.Random, blocks: list[list[str]]) -> list[list[str]]:
+    blocks = [list(block) for block in blocks]
+    for _ in range(rng.randrange(1, 4)):
+        i = rng.randrange(len(blocks))
+        block = blocks[i]
+        kind = rng.randrange(3)
+        if kind == 0 or not block:
+            block.insert(rng.randrange(len(block) + 1), random_instruction(rng, i, len(blocks)))
+        elif kind == 1:
+            del block[rng.randrange(len(block))]
+        else:
+            block[rng.randrange(len(block))] = random_instruction(rng, i, len(blocks))
+    return blocks
+
+def execute(rom: bytes, registers: list[int]) -> list[int]:
+    ctx = vm.Ctx_t()
+    ctx.load_program(rom)
+    ctx.Registers[:] = registers
+    runner = vm.InstructionRunner(ctx)
+    for _ in range(MAX_STEPS):
+        runner.run_step()
+        if ctx.Pause_signal:
+            return ctx.Registers[vm.AF:]
+    raise AssertionError("程序未在限定步数内暂停")
+
+class StableLayoutTest(unittest.TestCase):
+    def check(self, old_code: str, new_code: str, rng: random.Random):
+        old = cp.assemble(old_code, no_warn=True)
+        self.assertFalse(old.has_error)
+        stable = cp.stable_layout(new_code, old.flag_table, old.binary, no_warn=True)
+        sequential = cp.assemble(new_code, no_warn=True)
+        self.assertFalse(stable.has_error, stable.diagnostics)
+        for _ in range(4):
+            registers = [0, 0, 0, 0] + [rng.randrange(256) for _ in REGS]
+            self.assertEqual(execute(stable.binary, registers), execute(sequential.binary, registers),
+                             f"\n{old_code}\n->\n{new_code}")
+
+    def test_entry_forward_overlap(self):
+        # 程序开头的块变大移走，地址0处的转发跳转覆盖L1原位置(地址2)处的转发跳转
+        body = ("L1:\n    INC R2\n{}    NOT R0, R2\n    XOR R1, R0, 5\n    MOVLN PC, L6, R1\n"
+                "L2:\n    MOVLZ R0, 61, 0\n    MOVLN PC, L3, R3\n    MOVLN PC, L4, R2\n    AND R2, R1, 1\n"
+                "L3:\n    XOR R0, R1, 4\n    XOR R2, R3, 0\n    INC R3\n"
+                "L4:\n    XOR R2, R2, 4\n    NOT R1, R2\n"
+                "L5:\n    MOVLZ R2, 135, 0\n"
+                "L6:\n{}    SUB R3, R2, 4\n    PAUSE\n")
+        old_code = "    ADD R2, R3, 6\n" + body.format("", "")
+        new_code = "    MOVLN PC, L2, R0\n" + body.format("    DEC R0\n", "    DEC R1\n")
+        self.check(old_code, new_code, random.Random(0))
+
+    def test_random_edits(self):
+        rng = random.Random(41)
+        for _ in range(500):
+            old = random_program(rng)
+            new = random_edit(rng, old)
+            self.check(render(old), render(new), rng)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,4 +1,8 @@
-from typing import Callable
+import os, sys, time
+import asyncio
+from typing import Callable, Iterator, NamedTuple, Optional
+
+import isa
 
 PC = 0
 AF = 1
@@ -9,16 +13,7 @@ R1 = 5
 R2 = 6
 R3 = 7
 
-reg_name_map = {
-    0: 'PC',
-    1: 'AF',
-    2: 'SP',
-    3: 'IO',
-    4: 'R0',
-    5: 'R1',
-    6: 'R2',
-    7: 'R3',
-}
+reg_name_map = dict(enumerate(isa.REGISTER_NAMES))
 
 class Ctx_t:
     Registers: list[int] = [
@@ -37,6 +32,56 @@ class Ctx_t:
 
     Pause_signal: bool = False # 暂停信号。和DZC-8M的暂停信号一致。需自行复位。
 
+    Banks: list[bytearray] = [] # bank切换扩展：各bank的程序存储区，Program为当前bank
+    Bank: int = 0 # 当前bank
+    Bank_pending: Optional[int] = None # 已选择、将在下一次写入PC时切换到的bank
+
+    def __init__(self):
+        # 每个上下文独立持有寄存器与程序存储区，避免多个虚拟机实例共享状态
+        self.Registers = [0x00] * 8
+        self.Program = bytearray(0xFF)
+        self.Banks = [self.Program]
+
+    def load_program(self, program: bytes) -> bool:
+        """
+        将程序写入程序存储区，不足部分补零。
+
+        :return: 程序是否因大于0xFF字节而被截断
+        :rtype: bool
+        """
+        if len(program) > 0xFF:
+            self.Program[:] = program[:0xFF]
+            return True
+        self.Program[:] = bytes(0xFF)
+        self.Program[:len(program)] = program
+        return False
+
+    def load_banks(self, program: bytes) -> int:
+        """
+        将程序按0xFF字节拆分，写入各bank，不足部分补零，并切换到bank 0。
+
+        :return: bank数
+        :rtype: int
+        """
+        self.Banks = [bytearray(0xFF) for _ in range(max(1, -(-len(program) // 0xFF)))]
+        for i, bank in enumerate(self.Banks):
+            chunk = program[i * 0xFF:(i + 1) * 0xFF]
+            bank[:len(chunk)] = chunk
+        self.Bank_pending = None
+        self.select_bank(0)
+        return len(self.Banks)
+
+    def select_bank(self, bank: int):
+        """切换当前bank。bank编号按bank数取模，与只译码低位的硬件一致。"""
+        self.Bank = bank % len(self.Banks)
+        self.Program = self.Banks[self.Bank]
+
+class PauseEvent(NamedTuple):
+    """一次PAUSE事件的寄存器快照。"""
+    addr: int # PAUSE指令所在地址
+    steps: int # 截至此事件（含PAUSE指令）已执行的步数
+    registers: tuple[int, ...] # 寄存器快照，下标同寄存器编号
+
 class InstructionRunner:
     def __init__(self, ctx: Ctx_t):
         self.ctx = ctx
@@ -44,40 +89,33 @@ class InstructionRunner:
         self.program_d0 = 0 # 当前addr + 0的程序字节
         self.program_d1 = 0 # 当前addr + 1的程序字节
         self.program_d2 = 0 # 当前addr + 2的程序字节
-        self.command_table: dict[int, tuple[Callable, int]] = {
-            0b00000: (self.__run_pause, 1),
-            0b00001: (self.__run_pause, 1),
-            0b00010: (self.__run_nop, 1),
-            0b00011: (self.__run_nop, 1),
-            0b00100: (self.__run_movz, 2),
-            0b00101: (self.__run_movlz, 3),
-            0b00110: (self.__run_movn, 2),
-            0b00111: (self.__run_movln, 3),
-            0b01000: (self.__run_add, 2),
-            0b01001: (self.__run_add, 2),
-            0b01010: (self.__run_sub, 2),
-            0b01011: (self.__run_sub, 2),
-            0b01100: (self.__run_addc, 2),
-            0b01101: (self.__run_addc, 2),
-            0b01110: (self.__run_subb, 2),
-            0b01111: (self.__run_subb, 2),
-            0b10000: (self.__run_inc, 1),
-            0b10001: (self.__run_dec, 1),
-            0b10010: (self.__run_cmp, 2),
-            0b10011: (self.__run_cmp, 2),
-            0b10100: (self.__run_not, 2),
-            0b10101: (self.__run_not, 2),
-            0b10110: (self.__run_and, 2),
-            0b10111: (self.__run_and, 2),
-            0b11000: (self.__run_or, 2),
-            0b11001: (self.__run_or, 2),
-            0b11010: (self.__run_xor, 2),
-            0b11011: (self.__run_xor, 2),
-            0b11100: (self.__run_shl, 2),
-            0b11101: (self.__run_shl, 2),
-            0b11110: (self.__run_shr, 2),
-            0b11111: (self.__run_shr, 2),
+        self.steps = 0 # 已执行的步数
+        self.cur_bank = 0 # 当前指令所在bank，仅BankedInstructionRunner更新
+        handlers: dict[str, Callable] = {
+            "PAUSE": self.__run_pause,
+            "NOP":   self.__run_nop,
+            "MOVZ":  self.__run_movz,
+            "MOVLZ": self.__run_movlz,
+            "MOVN":  self.__run_movn,
+            "MOVLN": self.__run_movln,
+            "ADD":   self.__run_add,
+            "SUB":   self.__run_sub,
+            "ADDC":  self.__run_addc,
+            "SUBB":  self.__run_subb,
+            "INC":   self.__run_inc,
+            "DEC":   self.__run_dec,
+            "CMP":   self.__run_cmp,
+            "NOT":   self.__run_not,
+            "AND":   self.__run_and,
+            "OR":    self.__run_or,
+            "XOR":   self.__run_xor,
+            "SHL":   self.__run_shl,
+            "SHR":   self.__run_shr,
         }
+        # 首字节 -> (处理函数, 指令长度)，由isa.DECODE_TABLE导出
+        self.dispatch_table: list[tuple[Callable, int]] = [
+            (handlers[spec.name], spec.length) for spec in isa.DECODE_TABLE
+        ]
     def get_program_from_addr(self, addr: int) -> int:
         return self.ctx.Program[addr % 0xFF]
     def __value_get_value(self, val: int) -> int:
@@ -327,14 +365,444 @@ class InstructionRunner:
         self.program_d0 = self.get_program_from_addr(pc)
         self.program_d1 = self.get_program_from_addr(pc + 1)
         self.program_d2 = self.get_program_from_addr(pc + 2)
-        # 取头
-        head = self.program_d0 >> 3
         # 获取函数
-        func, size = self.command_table[head]
+        func, size = self.dispatch_table[self.program_d0]
         # PC增偏移量
         self.ctx.Registers[PC] = (pc + size) & 0xFF
         # 执行函数
         func()
+        self.steps += 1
+
+    def iter_pauses(self, max_events: Optional[int] = None, max_steps: Optional[int] = None) -> Iterator[PauseEvent]:
+        """
+        无终端输出地连续执行，每遇到一次PAUSE产出一个寄存器快照。PAUSE信号在产出前被复位。
+
+        :param max_events: 最多产出的事件数。None表示不限
+        :type max_events: Optional[int]
+        :param max_steps: 本次调用最多执行的步数。None表示不限
+        :type max_steps: Optional[int]
+        :return: PauseEvent迭代器。可配合itertools惰性消费，随时停止
+        :rtype: Iterator[PauseEvent]
+        """
+        ctx = self.ctx
+        run_step = self.run_step
+        events = 0
+        end_steps = None if max_steps is None else self.steps + max_steps
+        while max_events is None or events < max_events:
+            if end_steps is not None and self.steps >= end_steps:
+                return
+            run_step()
+            if ctx.Pause_signal:
+                ctx.Pause_signal = False
+                events += 1
+                yield PauseEvent(self.cur_addr, self.steps, tuple(ctx.Registers))
+
+    def run_profile(self, max_steps: int) -> list[int]:
+        """
+        无终端输出地执行max_steps步，统计每个地址作为指令起始地址被执行的次数。PAUSE信号被忽略并复位。
+
+        :return: 长度为0x100的执行次数列表，下标为地址
+        :rtype: list[int]
+        """
+        ctx = self.ctx
+        run_step = self.run_step
+        counts = [0] * 0x100
+        for _ in range(max_steps):
+            run_step()
+            counts[self.cur_addr] += 1
+        ctx.Pause_signal = False
+        return counts
+
+BANK_SELECT = 0xF0 # 写入IO的值为 BANK_SELECT | n 时选择bank n
+
+class BankedInstructionRunner(InstructionRunner):
+    """
+    bank切换扩展。指令写入IO的结果为0xFn时选择bank n，在之后第一次写入PC时切换，写入的地址为新bank中的地址。
+    条件赋值(MOVZ/MOVN/MOVLZ/MOVLN)在条件满足时才写入PC，写入的地址等于顺序地址时同样切换。
+    """
+    def __init__(self, ctx: Ctx_t):
+        super().__init__(ctx)
+        # 首字节 -> 目标寄存器，不写入寄存器的指令为None
+        self.dest_table: list[Optional[int]] = [
+            byte & 0b111 if spec.writes_dest else None for byte, spec in enumerate(isa.DECODE_TABLE)
+        ]
+        # 首字节 -> 条件赋值在条件为0时写入(True)或非0时写入(False)，其他指令为None
+        self.write_on_zero: list[Optional[bool]] = [
+            {"MOVZ": True, "MOVLZ": True, "MOVN": False, "MOVLN": False}.get(spec.name) for spec in isa.DECODE_TABLE
+        ]
+        self.bank_switches = 0 # 已发生的bank切换次数
+
+    def pc_written(self) -> bool:
+        """刚执行的、目标为PC的指令是否写入了PC。"""
+        d0 = self.program_d0
+        on_zero = self.write_on_zero[d0]
+        if on_zero is None:
+            return True
+        kind, value = isa.decode(d0, self.program_d1, self.program_d2).operands[2]
+        if kind == "R":
+            # 条件在PC增加之后读取，除PC外的寄存器未被改写
+            value = (self.cur_addr + isa.LENGTH_TABLE[d0]) & 0xFF if value == PC else self.ctx.Registers[value]
+        return (value == 0) == on_zero
+
+    def run_step(self):
+        ctx = self.ctx
+        self.cur_bank = ctx.Bank
+        super().run_step()
+        d0 = self.program_d0
+        dest = self.dest_table[d0]
+        if dest == IO:
+            value = ctx.Registers[IO]
+            if value & 0xF0 == BANK_SELECT:
+                ctx.Bank_pending = value & 0x0F
+        elif dest == PC and ctx.Bank_pending is not None and self.pc_written():
+            ctx.select_bank(ctx.Bank_pending)
+            ctx.Bank_pending = None
+            self.bank_switches += 1
+
+class ProfileException(Exception):
+    pass
+
+class ExecutionProfile:
+    """
+    执行剖析：各地址作为指令起始地址被执行的次数，以及写入PC的指令的执行与跳转次数。
+    地址均为程序文件中的偏移，即 bank * 0xFF + bank内地址。同一程序的多次运行可以累加。
+
+    保存为JSON: {"rom": 程序的十六进制, "runs": 运行次数, "steps": 总步数,
+    "counts": {地址: 次数}, "branches": {地址: [执行次数, 跳转次数]}}。cp.py --pgo 据此重排代码块。
+    """
+    def __init__(self, rom: bytes):
+        self.rom = rom
+        self.runs = 0
+        self.steps = 0
+        self.counts: dict[int, int] = {}
+        self.branches: dict[int, list[int]] = {} # 地址 -> [执行次数, 跳转次数]
+
+    def record(self, runner: InstructionRunner, max_steps: int):
+        """
+        无终端输出地执行max_steps步并累加到剖析中。PAUSE信号被忽略并复位。
+        写入PC且PC不等于顺序地址(或bank改变)时计为一次跳转。
+        """
+        ctx = runner.ctx
+        registers = ctx.Registers
+        writes_pc = [spec.writes_dest and byte & 0b111 == PC for byte, spec in enumerate(isa.DECODE_TABLE)]
+        counts = self.counts
+        branches = self.branches
+        for _ in range(max_steps):
+            runner.run_step()
+            cur_addr = runner.cur_addr
+            addr = runner.cur_bank * 0xFF + cur_addr
+            counts[addr] = counts.get(addr, 0) + 1
+            d0 = runner.program_d0
+            if writes_pc[d0]:
+                branch = branches.get(addr)
+                if branch is None:
+                    branch = branches[addr] = [0, 0]
+                branch[0] += 1
+                if registers[PC] != (cur_addr + isa.LENGTH_TABLE[d0]) & 0xFF or ctx.Bank != runner.cur_bank:
+                    branch[1] += 1
+        ctx.Pause_signal = False
+        self.runs += 1
+        self.steps += max_steps
+
+    def taken(self, addr: int) -> tuple[int, int]:
+        """
+        :return: addr处指令的执行次数, 跳转次数
+        """
+        executed, taken = self.branches.get(addr, (self.counts.get(addr, 0), 0))
+        return executed, taken
+
+    def merge(self, other: "ExecutionProfile"):
+        """
+        :raises ProfileException: 两个剖析属于不同的程序
+        """
+        if other.rom != self.rom:
+            raise ProfileException("剖析属于不同的程序，无法合并")
+        self.runs += other.runs
+        self.steps += other.steps
+        for addr, count in other.counts.items():
+            self.counts[addr] = self.counts.get(addr, 0) + count
+        for addr, (executed, taken) in other.branches.items():
+            branch = self.branches.setdefault(addr, [0, 0])
+            branch[0] += executed
+            branch[1] += taken
+
+    def dumps(self) -> str:
+        import json
+        return json.dumps({
+            "rom": self.rom.hex(),
+            "runs": self.runs,
+            "steps": self.steps,
+            "counts": {str(addr): count for addr, count in sorted(self.counts.items())},
+            "branches": {str(addr): branch for addr, branch in sorted(self.branches.items())},
+        }, indent=4) + "\n"
+
+    @classmethod
+    def load(cls, path: str) -> "ExecutionProfile":
+        """
+        :raises ProfileException: 文件无法读取或格式错误
+        """
+        import json
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            profile = cls(bytes.fromhex(data["rom"]))
+            profile.runs = int(data.get("runs", 1))
+            profile.steps = int(data["steps"])
+            profile.counts = {int(addr): int(count) for addr, count in data["counts"].items()}
+            profile.branches = {int(addr): [int(executed), int(taken)] for addr, (executed, taken) in data["branches"].items()}
+        except OSError as e:
+            raise ProfileException(f"无法读取剖析文件 {path}: {e}")
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            raise ProfileException(f"无效的剖析文件 {path}: {e}")
+        return profile
+
+class RealTimeClock:
+    """
+    按目标频率执行指令的实时时钟。
+
+    第n步的截止时间为 origin + n / freq，由time.perf_counter计算，不随渲染与sleep的误差累积。
+    频率高于刷新率时，每次刷新执行一批到期的指令。
+    """
+    def __init__(self, freq: float, fps: float = 30.0):
+        self.freq = freq
+        self.frame = max(1, int(freq / fps)) # 每次刷新执行的步数
+        self.limit = self.frame * 4 # 每次最多追赶的步数，落后更多时放弃追赶
+        self.steps = 0 # 已执行的步数
+        self.begin = time.perf_counter()
+        self.origin = self.begin # 第0步的时间，暂停与放弃追赶时后移
+        self.idle = 0.0 # 暂停的总时长
+        self.dropped = 0.0 # 放弃追赶的总时长
+        self._hold: Optional[float] = None
+
+    def batch(self) -> int:
+        """等待至下一批指令到期，返回应执行的步数。"""
+        delay = self.delay()
+        if delay > 0:
+            time.sleep(delay)
+        return self.due()
+
+    def delay(self) -> float:
+        """距下一批指令到期的时间，单位为秒。不能阻塞时(如在asyncio中)代替batch，自行等待后调用due。"""
+        return self.origin + (self.steps + self.frame) / self.freq - time.perf_counter()
+
+    def due(self) -> int:
+        """当前应执行的步数。"""
+        due = int((time.perf_counter() - self.origin) * self.freq) - self.steps
+        if due > self.limit:
+            lag = (due - self.limit) / self.freq
+            self.origin += lag
+            self.dropped += lag
+            due = self.limit
+        return max(1, due)
+
+    def advance(self, steps: int):
+        """记录实际执行的步数。遇到PAUSE时可能少于batch的返回值。"""
+        self.steps += steps
+
+    def hold(self):
+        """暂停计时，如等待用户输入时。"""
+        self._hold = time.perf_counter()
+
+    def resume(self):
+        if self._hold is not None:
+            elapsed = time.perf_counter() - self._hold
+            self.origin += elapsed
+            self.idle += elapsed
+            self._hold = None
+
+    def measured(self) -> float:
+        """实测频率，不含暂停的时间。"""
+        now = time.perf_counter()
+        elapsed = now - self.begin - self.idle
+        if self._hold is not None:
+            elapsed -= now - self._hold
+        return self.steps / elapsed if elapsed > 0 else 0.0
+
+    def report(self) -> str:
+        measured = self.measured()
+        string = f"Clock: {measured:.6g} Hz / target {self.freq:.6g} Hz ({(measured / self.freq - 1) * 100:+.2f}%)"
+        if self.dropped > 0:
+            string += f", behind {self.dropped:.3f}s"
+        return string
+
+def format_registers(ctx: Ctx_t) -> list[str]:
+    """每个寄存器一行，如 PC = 1 1 1 1 1 1 1 1 = 255(-1)，以空格补齐到32字符。"""
+    rows = []
+    for i in range(8):
+        n = ctx.Registers[i]
+        s08b = f"{n:08b}"
+        sn = f"{' '.join([*s08b])} = {n}"
+        sn_main = f"{reg_name_map[i]} = {sn}"
+        # 如果n>127, 则显示补码数形式
+        if n > 0x7F:
+            sn_main += f"({n - 0x100})"
+        # PC = 1 1 1 1 1 1 1 1 = 255(-128), 最大长度32
+        # 添加适量的空格
+        rows.append(sn_main + ' ' * (32 - len(sn_main)))
+    return rows
+
+class ProgramImage(NamedTuple):
+    """从文件读取的程序及其调试信息。"""
+    rom: bytes
+    src: Optional[str]
+    lines: list[int] # 每字节对应的源代码行号
+    flags: dict[str, int] # 标记表，热重载时用于重新定位PC
+
+class ProgramLoadException(Exception):
+    pass
+
+def load_image(path: str, debug: bool) -> ProgramImage:
+    """
+    读取程序文件。.asm文件被直接编译；debug为True时.json与.dzo文件须包含源代码。
+
+    :raises ProgramLoadException: 编译错误或文件格式错误
+    """
+    import cp, dzo
+    if path.lower().endswith(".asm"):
+        with open(path, "r", encoding="utf-8") as f:
+            src = f.read()
+        result = cp.assemble(src, no_warn=True)
+        errors = [d for d in result.diagnostics if d.severity == cp.SEVERITY_ERROR]
+        if errors:
+            more = f"，共{len(errors)}个错误" if len(errors) > 1 else ""
+            raise ProgramLoadException(f"第{errors[0].line}行: {errors[0].message}{more}")
+        return ProgramImage(bytes(result.binary), src, list(result.lines), dict(result.flag_table))
+    try:
+        if dzo.is_object_file(path): # DZO目标文件，按需读取段
+            with dzo.ObjectFile.open(path) as obj:
+                rom = obj.rom
+                src = obj.source() if debug else None
+                lines = obj.lines() if debug else []
+                flags = obj.symbols()
+            if debug and src is None:
+                raise ProgramLoadException("DZO文件中没有源代码段，无法调试。")
+            return ProgramImage(rom, src, lines, flags)
+    except dzo.DZOFormatException as e:
+        raise ProgramLoadException(str(e))
+    if debug: # JSON debug
+        import json, base64
+        with open(path, "r", encoding="utf-8") as f:
+            try:
+                data = json.load(f)
+                rom = base64.b64decode(data["bin"])
+                src = data["src"]
+                lines = data["lines"]
+            except (ValueError, KeyError) as e:
+                raise ProgramLoadException(f"无效的JSON调试文件: {e}")
+        # 旧版JSON没有标记表，由源代码重新编译得到
+        return ProgramImage(rom, src, lines, dict(cp.assemble(src, no_warn=True).flag_table))
+    with open(path, "rb") as f: # 二进制
+        return ProgramImage(f.read(), None, [], {})
+
+def remap_pc_by_line(old: ProgramImage, new: ProgramImage, pc: int) -> Optional[tuple[int, str]]:
+    """PC所在的源代码行在新源代码中未被修改时，定位到该行的第一个字节。"""
+    import difflib
+    if old.src is None or new.src is None or pc >= len(old.lines) or not new.lines:
+        return None
+    line = old.lines[pc]
+    if pc > 0 and old.lines[pc - 1] == line: # PC不在该行的起始位置
+        return None
+    matcher = difflib.SequenceMatcher(None, old.src.splitlines(), new.src.splitlines(), autojunk=False)
+    for a, b, size in matcher.get_matching_blocks():
+        if a <= line < a + size:
+            new_line = b + line - a
+            if new_line in new.lines:
+                return new.lines.index(new_line), f"line {line + 1} -> {new_line + 1}"
+            return None
+    return None
+
+def remap_pc(old: ProgramImage, new: ProgramImage, pc: int) -> tuple[int, str]:
+    """
+    程序替换后重新定位PC。地址均为平坦地址 bank * 0xFF + bank内地址，调用者负责拆分为bank与PC。
+
+    有源代码时先按未修改的源代码行定位。否则找到旧程序中PC之前最近的、新程序中仍然存在的标记，
+    数出标记到PC之间的指令条数，在新程序中从同名标记起前进相同条数。没有可用的标记时以地址0为起点。
+
+    :return: 新的PC, 定位说明(如 "loop+2")
+    """
+    by_line = remap_pc_by_line(old, new, pc)
+    if by_line is not None:
+        return by_line
+    anchors = [(addr, name) for name, addr in old.flags.items() if name in new.flags and addr <= pc]
+    if anchors:
+        addr, name = max(anchors)
+        new_addr = new.flags[name]
+    else:
+        addr, name, new_addr = 0, "start", 0
+
+    def length(rom: bytes, a: int) -> int:
+        # 程序之后补零的区域为PAUSE
+        return isa.LENGTH_TABLE[rom[a]] if a < len(rom) else 1
+
+    count = 0
+    a = addr
+    while a < pc:
+        a += length(old.rom, a)
+        count += 1
+    if a != pc: # PC不在指令边界上，按字节偏移
+        return new_addr + pc - addr, f"{name}+{pc - addr}B"
+    b = new_addr
+    for _ in range(count):
+        b += length(new.rom, b)
+    return b, f"{name}+{count}" if count else name
+
+class HotReloader:
+    """
+    监视程序文件，修改后重新读取(.asm文件重新编译)，替换程序存储区并重新定位PC。寄存器的其他内容保持不变。
+    读取失败时继续运行原程序。
+    """
+    def __init__(self, path: str, debug: bool, image: ProgramImage, interval: float = 0.25,
+                 on_reload: Optional[Callable[[ProgramImage], None]] = None):
+        self.path = path
+        self.debug = debug
+        self.image = image
+        self.interval = interval # 检查文件修改的最短间隔，单位为秒
+        self.reloads = 0
+        self.mtime = self._mtime()
+        self.next_check = time.perf_counter() + interval
+        self.status = f"Watch: {path}"
+        self.on_reload = on_reload # 替换程序后调用，用于更新依赖旧程序地址的状态
+
+    def _mtime(self) -> Optional[int]:
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def poll(self, ctx: Ctx_t) -> bool:
+        """检查文件是否被修改。重新加载了程序时返回True。"""
+        now = time.perf_counter()
+        if now < self.next_check:
+            return False
+        self.next_check = now + self.interval
+        mtime = self._mtime()
+        if mtime is None or mtime == self.mtime:
+            return False
+        self.mtime = mtime
+        try:
+            image = load_image(self.path, self.debug)
+        except (ProgramLoadException, OSError, UnicodeDecodeError) as e:
+            self.status = f"Watch: reload failed, {e}"
+            return False
+        banked = len(ctx.Banks) > 1
+        if not banked and len(image.rom) > 0xFF:
+            self.status = "Watch: reload failed, 程序大于0xFF字节，请重新启动以使用bank切换"
+            return False
+        # bank切换时按 bank * 0xFF + PC 的平坦地址重新定位
+        pc = ctx.Bank * 0xFF + ctx.Registers[PC]
+        new_pc, where = remap_pc(self.image, image, pc)
+        if banked:
+            ctx.load_banks(image.rom)
+            ctx.select_bank(new_pc // 0xFF)
+        else:
+            ctx.load_program(image.rom)
+        ctx.Registers[PC] = new_pc % 0xFF
+        self.image = image
+        self.reloads += 1
+        self.status = f"Watch: reload #{self.reloads}, PC 0x{pc:02X} -> 0x{new_pc:02X} ({where})"
+        if self.on_reload is not None:
+            self.on_reload(image)
+        return True
 
 ANSI_CURSOR_UP = '\x1b[1A'
 ANSI_CURSOR_UPS = lambda lines: f'\x1b[{lines}A'
@@ -343,12 +811,440 @@ ANSI_CURSOR_DOWNS = lambda lines: f'\x1b[{lines}B'
 ANSI_CURSOR_MOVE_UD = lambda lines: ANSI_CURSOR_DOWNS(lines) if lines > 0 else (ANSI_CURSOR_UPS(-lines) if lines < 0 else '')
 ANSI_CURSOR_LEFT = '\r'
 ANSI_CLEAR_LINE = '\x1b[2K'
+ANSI_CLEAR_DOWN = '\x1b[J'
+ANSI_CLEAR_SCREEN = '\x1b[2J\x1b[H'
 ANSI_CURSOR_SHOW = '\x1b[?25h'
 ANSI_CURSOR_HIDE = '\x1b[?25l'
 
+ANSI_CURSOR_SAVE = '\x1b7'
+ANSI_CURSOR_RESTORE = '\x1b8'
+ANSI_CURSOR_TO = lambda row, col=1: f'\x1b[{row};{col}H'
+ANSI_SCROLL_REGION = lambda top, bottom: f'\x1b[{top};{bottom}r'
+ANSI_SCROLL_RESET = '\x1b[r'
+
 FILL_TRIANGLE = "\u25BA"
 CIRCLE = "\u25CB"
 
+def display_width(ch: str) -> int:
+    import unicodedata
+    return 2 if unicodedata.east_asian_width(ch) in ("W", "F") else 1
+
+def clip_text(text: str, width: int) -> str:
+    """按终端显示宽度截断，全角字符占2列。"""
+    text = text.replace("\t", "    ")
+    used = 0
+    for i, ch in enumerate(text):
+        used += display_width(ch)
+        if used > width:
+            return text[:i]
+    return text
+
+class SourceViewport:
+    """
+    -F模式的源代码窗口。只显示终端高度能容纳的若干行，当前行接近窗口边缘时滚动，
+    每次只重绘内容改变的行。窗口大小在终端大小改变或源代码被重新加载时由调用者更新。
+    """
+    MARGIN = 3 # 当前行与窗口边缘至少保持的行数
+
+    def __init__(self, src_lines: list[str], height: int, width: int):
+        self.src_lines = src_lines
+        self.height = 0
+        self.width = width
+        self.top = 0 # 窗口第一行对应的源代码行
+        self.drawn: list[Optional[str]] = [] # 每个窗口行已显示的内容
+        self.resize(height, width)
+
+    @staticmethod
+    def fit_height(src_lines: list[str], reserved: int) -> int:
+        """终端中除reserved行之外可用于源代码的行数。"""
+        import shutil
+        rows = shutil.get_terminal_size().lines
+        return max(0, min(len(src_lines), rows - reserved - 1))
+
+    def resize(self, height: int, width: int):
+        self.height = height
+        self.width = width
+        self.top = max(0, min(self.top, len(self.src_lines) - height))
+        self.drawn = [None] * height
+
+    def set_source(self, src_lines: list[str], height: int):
+        self.src_lines = src_lines
+        self.resize(height, self.width)
+
+    def scroll_to(self, line: int):
+        margin = min(self.MARGIN, (self.height - 1) // 2)
+        if self.top + margin <= line < self.top + self.height - margin:
+            return
+        self.top = max(0, min(line - self.height // 2, len(self.src_lines) - self.height))
+
+    def row_text(self, row: int, cur_line: Optional[int], next_line: Optional[int]) -> str:
+        line = self.top + row
+        if line >= len(self.src_lines):
+            return ""
+        marker = FILL_TRIANGLE if line == cur_line else CIRCLE if line == next_line else " "
+        return clip_text(f"{marker}{line + 1:>4}│ {self.src_lines[line]}", self.width - 1)
+
+    def render(self, cur_line: Optional[int], next_line: Optional[int]) -> str:
+        """
+        从窗口第一行开始输出，结束时光标位于窗口之后的一行。未改变的行只换行，不重绘。
+
+        :param cur_line: 当前指令所在行，窗口随之滚动
+        :param next_line: 下一条指令所在行
+        """
+        if cur_line is not None:
+            self.scroll_to(cur_line)
+        string = ANSI_CURSOR_LEFT
+        for row in range(self.height):
+            text = self.row_text(row, cur_line, next_line)
+            if text != self.drawn[row]:
+                string += ANSI_CLEAR_LINE + text
+                self.drawn[row] = text
+            string += "\n"
+        return string
+
+CONSOLE_HELP = """\
+run | r              继续运行
+stop | s             停止
+step | n [N]         执行N步后停止，默认1
+set REG VALUE        设置寄存器，VALUE可以是数或标记
+mem [ADDR [LEN]]     显示程序存储区，默认从PC开始16字节
+break [ADDR|LABEL]   在地址或标记处设置断点，不带参数时列出断点
+delete ADDR|LABEL|all 删除断点
+speed HZ|max         设置执行频率
+pause on|off         遇到PAUSE时是否停止
+quit | q             退出"""
+
+class DebugConsole:
+    """
+    asyncio调试控制台。指令执行、命令输入与界面渲染并发进行，运行中也可以输入命令。
+
+    屏幕上方为状态面板；下方为滚动区域，显示命令输出与PAUSE事件；最后一行为命令输入行。
+    地址均为程序文件中的偏移，即 bank * 0xFF + bank内地址。
+    """
+    PANEL_ROWS = 12 # 状态, 当前行, 8个寄存器, 附加状态, 分隔线
+    SLICE_STEPS = 2000 # 不限速时每次让出事件循环前执行的步数
+    MAX_PAUSE_LOG = 5 # 每帧最多显示的PAUSE事件，其余合并
+
+    def __init__(self, ctx: Ctx_t, runner: InstructionRunner, image: ProgramImage, freq: Optional[float] = None,
+                 fps: float = 30.0, stop_on_pause: bool = True, reloader: Optional["HotReloader"] = None, out=None,
+                 on_frame: Optional[Callable[[], None]] = None):
+        self.ctx = ctx
+        self.runner = runner
+        self.image = image
+        self.fps = fps
+        self.clock = RealTimeClock(freq, fps) if freq is not None else None
+        self.stop_on_pause = stop_on_pause
+        self.reloader = reloader
+        self.out = out or sys.stdout
+        self.on_frame = on_frame # 每次刷新界面时调用，如发布共享内存状态
+        self.running = False
+        self.quit = False
+        self.step_budget: Optional[int] = None # step命令剩余的步数
+        self.breakpoints: set[int] = set()
+        self.pause_events: list[str] = [] # 待显示的PAUSE事件
+        self.pause_dropped = 0
+        self.rows = 0
+        self.columns = 0
+        self.wake: Optional[asyncio.Event] = None
+        if self.clock is not None:
+            self.clock.hold()
+
+    # 地址与显示
+    def flat_pc(self) -> int:
+        return self.ctx.Bank * 0xFF + self.ctx.Registers[PC]
+
+    def line_text(self, addr: int) -> str:
+        lines = self.image.lines
+        src_lines = (self.image.src or "").splitlines()
+        if addr < len(lines) and lines[addr] < len(src_lines):
+            return f"{lines[addr] + 1:>4}│ {src_lines[lines[addr]]}"
+        bank, offset = divmod(addr, 0xFF)
+        return f"{f'0x{offset:X}':>6}: {isa.decode_at(self.ctx.Banks[bank % len(self.ctx.Banks)], offset)}"
+
+    def addr_name(self, addr: int) -> str:
+        names = [name for name, value in self.image.flags.items() if value == addr]
+        return f"0x{addr:02X}" + (f" ({names[0]})" if names else "")
+
+    def parse_value(self, text: str) -> int:
+        """数或标记。"""
+        import cp
+        if text in self.image.flags:
+            return self.image.flags[text]
+        value = cp.parse_number(text)
+        if value is None:
+            raise ValueError(f"无法解析的数或标记: {text}")
+        return value
+
+    def write(self, text: str):
+        self.out.write(text)
+        self.out.flush()
+
+    def log(self, text: str):
+        """在滚动区域底部输出一行，不影响输入行的光标。"""
+        string = ANSI_CURSOR_SAVE
+        for line in text.splitlines() or [""]:
+            string += ANSI_CURSOR_TO(self.rows - 1) + "\n" + ANSI_CLEAR_LINE + line[:self.columns]
+        self.write(string + ANSI_CURSOR_RESTORE)
+
+    def prompt(self):
+        self.write(ANSI_CURSOR_TO(self.rows) + ANSI_CLEAR_LINE + "> ")
+
+    def panel(self) -> list[str]:
+        state = "RUNNING" if self.running else "STOPPED"
+        speed = "max" if self.clock is None else f"{self.clock.freq:.6g} Hz"
+        status = f"{state}  steps {self.runner.steps}  speed {speed}"
+        if self.clock is not None:
+            status += f"  measured {self.clock.measured():.6g} Hz"
+        if len(self.ctx.Banks) > 1:
+            status += f"  bank {self.ctx.Bank}/{len(self.ctx.Banks)}"
+        extra = self.reloader.status if self.reloader is not None else ""
+        if self.breakpoints:
+            extra += ("  " if extra else "") + f"breakpoints {len(self.breakpoints)}"
+        return [status, CIRCLE + self.line_text(self.flat_pc()), *format_registers(self.ctx), extra, "─" * self.columns]
+
+    def render(self):
+        string = ANSI_CURSOR_SAVE
+        for row, text in enumerate(self.panel(), start=1):
+            string += ANSI_CURSOR_TO(row) + ANSI_CLEAR_LINE + text[:self.columns]
+        self.write(string + ANSI_CURSOR_RESTORE)
+        if self.pause_events or self.pause_dropped:
+            for event in self.pause_events:
+                self.log(event)
+            if self.pause_dropped:
+                self.log(f"... 另有 {self.pause_dropped} 次PAUSE")
+            self.pause_events.clear()
+            self.pause_dropped = 0
+
+    # 执行控制
+    def set_running(self, running: bool):
+        if running == self.running:
+            return
+        self.running = running
+        if self.clock is not None:
+            self.clock.resume() if running else self.clock.hold()
+        if running and self.wake is not None:
+            self.wake.set()
+
+    def execute(self, steps: int) -> int:
+        """执行至多steps步，遇到断点、PAUSE(若设置停止)或step命令结束时停止。返回实际执行的步数。"""
+        ctx = self.ctx
+        runner = self.runner
+        run_step = runner.run_step
+        breakpoints = self.breakpoints
+        for done in range(1, steps + 1):
+            run_step()
+            if ctx.Pause_signal:
+                ctx.Pause_signal = False
+                if len(self.pause_events) < self.MAX_PAUSE_LOG:
+                    regs = " ".join(f"{reg_name_map[i]}={ctx.Registers[i]}" for i in range(R0, R3 + 1))
+                    self.pause_events.append(f"PAUSE @{self.addr_name(ctx.Bank * 0xFF + runner.cur_addr)} step {runner.steps}: {regs}")
+                else:
+                    self.pause_dropped += 1
+                if self.stop_on_pause:
+                    self.set_running(False)
+                    return done
+            if self.step_budget is not None:
+                self.step_budget -= 1
+                if self.step_budget <= 0:
+                    self.step_budget = None
+                    self.set_running(False)
+                    return done
+            if breakpoints and self.flat_pc() in breakpoints:
+                self.step_budget = None
+                self.set_running(False)
+                self.log(f"断点 {self.addr_name(self.flat_pc())}")
+                return done
+        return steps
+
+    async def run_machine(self):
+        assert self.wake is not None
+        while not self.quit:
+            if not self.running:
+                self.wake.clear()
+                await self.wake.wait()
+                continue
+            if self.clock is None:
+                self.execute(self.SLICE_STEPS)
+                await asyncio.sleep(0)
+                continue
+            delay = self.clock.delay()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                if not self.running:
+                    continue
+            self.clock.advance(self.execute(self.clock.due()))
+
+    async def run_display(self):
+        while not self.quit:
+            if self.reloader is not None and self.reloader.poll(self.ctx):
+                self.image = self.reloader.image
+            self.render()
+            if self.on_frame is not None:
+                self.on_frame()
+            await asyncio.sleep(1 / self.fps)
+
+    # 命令
+    def command(self, line: str):
+        words = line.split()
+        if not words:
+            return
+        name, args = words[0].lower(), words[1:]
+        try:
+            if name in ("run", "r"):
+                self.set_running(True)
+            elif name in ("stop", "s"):
+                self.step_budget = None
+                self.set_running(False)
+            elif name in ("step", "n"):
+                self.step_budget = self.parse_value(args[0]) if args else 1
+                if self.step_budget <= 0:
+                    raise ValueError("步数必须为正数")
+                self.set_running(True)
+            elif name == "set":
+                if len(args) != 2 or args[0].upper() not in isa.REGISTER_NAMES:
+                    raise ValueError("用法: set REG VALUE")
+                reg = isa.REGISTER_NAMES.index(args[0].upper())
+                value = self.parse_value(args[1])
+                if reg == PC and value > 0xFF:
+                    self.ctx.select_bank(value // 0xFF)
+                    value %= 0xFF
+                self.ctx.Registers[reg] = value & 0xFF
+            elif name == "mem":
+                addr = self.parse_value(args[0]) if args else self.flat_pc()
+                length = self.parse_value(args[1]) if len(args) > 1 else 16
+                self.log(self.memory(addr, length))
+            elif name == "break":
+                if not args:
+                    self.log("断点: " + (", ".join(self.addr_name(a) for a in sorted(self.breakpoints)) or "无"))
+                else:
+                    self.breakpoints.add(self.parse_value(args[0]))
+            elif name == "delete":
+                if args == ["all"]:
+                    self.breakpoints.clear()
+                elif args:
+                    self.breakpoints.discard(self.parse_value(args[0]))
+                else:
+                    raise ValueError("用法: delete ADDR|LABEL|all")
+            elif name == "speed":
+                if not args:
+                    raise ValueError("用法: speed HZ|max")
+                was_running = self.running
+                self.set_running(False)
+                if args[0].lower() == "max":
+                    self.clock = None
+                else:
+                    freq = float(args[0])
+                    if freq <= 0:
+                        raise ValueError("频率必须为正数")
+                    self.clock = RealTimeClock(freq, self.fps)
+                    self.clock.hold()
+                self.set_running(was_running)
+            elif name == "pause":
+                if args not in (["on"], ["off"]):
+                    raise ValueError("用法: pause on|off")
+                self.stop_on_pause = args[0] == "on"
+            elif name in ("help", "?"):
+                self.log(CONSOLE_HELP)
+            elif name in ("quit", "q", "exit"):
+                self.quit = True
+                self.set_running(False)
+                if self.wake is not None:
+                    self.wake.set()
+            else:
+                raise ValueError(f"未知的命令: {name}，输入help查看命令")
+        except ValueError as e:
+            self.log(f"错误: {e}")
+
+    def memory(self, addr: int, length: int) -> str:
+        """十六进制与反汇编。"""
+        bank, offset = divmod(addr, 0xFF)
+        program = self.ctx.Banks[bank % len(self.ctx.Banks)]
+        end = min(offset + length, 0xFF)
+        string = ""
+        for row in range(offset, end, 8):
+            string += f"0x{row:02X}: {bytes(program[row:min(row + 8, end)]).hex(' ')}\n"
+        for inst_addr, data, decoded in isa.disassemble(bytes(program), offset, end):
+            string += f"  0x{inst_addr:02X} {data.hex(' '):<9} {decoded}\n"
+        return string.rstrip("\n")
+
+    async def read_commands(self, stdin=None):
+        """逐行读取并执行命令，直到quit命令或输入结束。stdin默认为sys.stdin。"""
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue[Optional[str]] = asyncio.Queue()
+        stdin = stdin or sys.stdin
+        try:
+            fd = stdin.fileno()
+            pending = bytearray()
+            def on_readable():
+                # 一次可读可能包含多行(粘贴或管道输入)，全部按行放入队列，不完整的行留到下次
+                data = os.read(fd, 4096)
+                if not data:
+                    loop.remove_reader(fd)
+                    if pending:
+                        queue.put_nowait(pending.decode("utf-8", errors="replace"))
+                    queue.put_nowait(None)
+                    return
+                pending.extend(data)
+                *lines, rest = pending.split(b"\n")
+                for line in lines:
+                    queue.put_nowait(line.decode("utf-8", errors="replace"))
+                pending[:] = rest
+            loop.add_reader(fd, on_readable)
+            reader = True
+        except (NotImplementedError, ValueError, OSError):
+            # 不支持add_reader的平台使用守护线程读取
+            import threading
+            def read_lines():
+                while True:
+                    line = stdin.readline()
+                    loop.call_soon_threadsafe(queue.put_nowait, line or None)
+                    if not line:
+                        return
+            threading.Thread(target=read_lines, daemon=True).start()
+            reader = False
+        try:
+            while not self.quit:
+                line = await queue.get()
+                if line is None: # 输入结束，机器继续运行，直到被中断
+                    return
+                line = line.strip()
+                if line:
+                    self.log(f"> {line}")
+                self.command(line)
+                self.prompt()
+        finally:
+            if reader and not stdin.closed:
+                loop.remove_reader(stdin.fileno())
+
+    async def run(self):
+        """运行控制台，直到quit命令或SIGINT。"""
+        import shutil, signal
+        self.columns, self.rows = shutil.get_terminal_size()
+        if self.rows < self.PANEL_ROWS + 3:
+            raise ValueError(f"终端高度不足，至少需要 {self.PANEL_ROWS + 3} 行")
+        self.wake = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        def interrupt():
+            self.quit = True
+            self.wake.set()
+        try:
+            loop.add_signal_handler(signal.SIGINT, interrupt)
+        except (NotImplementedError, RuntimeError):
+            pass
+        self.write("\x1b[2J" + ANSI_SCROLL_REGION(self.PANEL_ROWS + 1, self.rows - 1))
+        self.log("调试控制台。输入help查看命令，run开始运行。")
+        self.prompt()
+        tasks = [asyncio.create_task(coro) for coro in (self.run_machine(), self.run_display(), self.read_commands())]
+        try:
+            while not self.quit:
+                await asyncio.sleep(0.05)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.render()
+            self.write(ANSI_SCROLL_RESET + ANSI_CURSOR_TO(self.rows) + "\n" + ANSI_CURSOR_SHOW)
+
         
 if __name__ == '__main__':
     import time
@@ -362,9 +1258,18 @@ if __name__ == '__main__':
     # 解析参数：file
     parser = argparse.ArgumentParser()
     parser.add_argument('file', help='file binary or json to run')
-    parser.add_argument('-D', '--debug', help='若启用此项，file必须为json文件。不启用此项时，file必须为二进制文件', action='store_true')
-    parser.add_argument('-d', '--delay', type=float, help='每步执行延迟，单位为秒。默认不执行。负值表示单步调试', default=0.0)
-    parser.add_argument('-F', '--full-src', help='若启用此项，则显示所有源代码行，提供更清晰的代码提示。否则，只显示当前行，以便快速定位。请确保你的终端在横竖两个方向上都有足够的空间容纳内容，否则会出现显示异常。', action='store_true')
+    parser.add_argument('-D', '--debug', help='若启用此项，file必须为dzo或json调试文件。不启用此项时，file必须为二进制文件或dzo文件。.asm文件在两种模式下均被直接编译', action='store_true')
+    parser.add_argument('-W', '--watch', help='监视file，修改后重新读取(.asm文件重新编译)并替换正在运行的程序，寄存器保持不变，PC按标记重新定位', action='store_true')
+    timing = parser.add_mutually_exclusive_group()
+    timing.add_argument('-d', '--delay', type=float, help='每步执行延迟，单位为秒。默认不执行。负值表示单步调试', default=0.0)
+    timing.add_argument('--freq', type=float, help='实时模式：按给定的时钟频率(Hz)执行，如游戏内调试时钟为1。时钟按截止时间调度，不累积误差', default=None)
+    parser.add_argument('--fps', type=float, help='实时模式下的最高刷新率。频率更高时每次刷新执行一批指令。默认30', default=30.0)
+    parser.add_argument('-F', '--full-src', help='若启用此项，则显示当前行附近终端高度能容纳的源代码行，随执行滚动，提供更清晰的代码提示。否则，只显示当前行，以便快速定位。', action='store_true')
+    parser.add_argument('-C', '--console', help='调试控制台：机器运行时也可以输入命令(run/stop/step/set/mem/break/speed/quit)，输入help查看全部命令。--freq为初始频率，默认不限速', action='store_true')
+    parser.add_argument('-M', '--memo', action='append', metavar='REGION', help='将标记区间作为纯区域记忆化执行，格式为 START[:END][/in=REG,...][/out=REG,...]，可重复。见memo.py')
+    parser.add_argument('-P', '--profile', metavar='FILE', help='无界面执行--profile-steps步，将各地址的执行次数与跳转的跳转率写入剖析文件FILE后退出。FILE已存在且属于同一程序时累加。供cp.py --pgo使用')
+    parser.add_argument('--profile-steps', type=int, default=1_000_000, help='剖析执行的步数。默认1000000')
+    parser.add_argument('--shm', metavar='NAME', help='将寄存器、PC历史与计数器发布到名为NAME的共享内存块，供其他进程读取。见shm.py')
     parser.add_argument('--ignore-pause', help='若启用此项，则忽略PAUSE信号。否则，当PAUSE信号被触发时，程序仍继续执行', action='store_true')
     args = parser.parse_args()
 
@@ -377,35 +1282,104 @@ if __name__ == '__main__':
     single_step = delay < 0.0
     full_src = args.full_src
     ignore_pause = args.ignore_pause
+    if args.freq is not None and (args.freq <= 0 or args.fps <= 0):
+        parser.error("--freq与--fps必须为正数")
+    clock = RealTimeClock(args.freq, args.fps) if args.freq is not None else None
 
     program: bytes
     src: str | None
     lines: list[int]
     src_lines: list[str] = []
 
-    last_curaddr = 2**32 - 1 # 上一次的地址。仅在debug -F模式下使用。
 
     # 读取文件
-    if debug: # JSON debug
-        import json, base64
-        with open(args.file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        program = base64.b64decode(data["bin"])
-        src = data["src"]
-        lines = data["lines"]
-        src_lines = src.splitlines() # type: ignore
-    else: # 二进制
-        with open(args.file, 'rb') as f:
-            program = f.read()
-            src = None
-            lines = []
+    try:
+        image = load_image(args.file, debug)
+    except ProgramLoadException as e:
+        print(e)
+        exit(1)
+    program = image.rom
+    src = image.src
+    lines = image.lines if debug else []
+    src_lines = src.splitlines() if debug and src is not None else []
+    reloader = HotReloader(args.file, debug, image) if args.watch else None
+    # 寄存器表之后的状态行数
+    status_lines = (clock is not None) + (reloader is not None)
     
-    # 如果program大于0xFF，则发送信息截断
-    if len(program) > 0xFF:
-        print("输入的程序大于256字节。将从截断到0xFF。")
-        ctx.Program[:] = program[:0xFF]
-    else: #等于或小于256字节。补零。
-        ctx.Program[:len(program)] = program
+    # 大于0xFF字节的程序按bank切换扩展运行；否则补零
+    banked = len(program) > 0xFF
+    if banked:
+        print(f"程序共 {ctx.load_banks(program)} 个bank。向IO写入0xF0|n后，下一次写入PC时切换到bank n。")
+        vm = BankedInstructionRunner(ctx)
+    else:
+        ctx.load_program(program)
+    status_lines += banked
+
+    if args.profile:
+        if args.profile_steps <= 0:
+            parser.error("--profile-steps必须为正数")
+        profile = ExecutionProfile(program)
+        if os.path.exists(args.profile):
+            try:
+                profile.merge(ExecutionProfile.load(args.profile))
+            except ProfileException as e:
+                print(f"{e}。请删除 {args.profile} 或使用其他文件名")
+                exit(1)
+        profile.record(vm, args.profile_steps)
+        with open(args.profile, "w", encoding="utf-8") as f:
+            f.write(profile.dumps())
+        jumps = sum(taken for _, taken in profile.branches.values())
+        print(f"剖析已写入 {args.profile}: 共 {profile.runs} 次运行，{profile.steps} 步，其中跳转 {jumps} 次。")
+        exit(0)
+
+    memoizer = None
+    if args.memo:
+        import memo
+        try:
+            memo_specs = [memo.parse_region(text) for text in args.memo]
+            regions = memo.resolve_regions(memo_specs, image.flags, len(program))
+        except ValueError as e:
+            print(e)
+            exit(1)
+        vm = memoizer = memo.MemoRunner(vm, regions)
+        if reloader is not None:
+            def reload_regions(new_image: ProgramImage):
+                try:
+                    memoizer.reload(memo_specs, new_image.flags, len(new_image.rom))
+                except ValueError as e:
+                    reloader.status += f", 记忆化已停用: {e}"
+            reloader.on_reload = reload_regions
+
+    publisher = None
+    if args.shm:
+        import shm
+        try:
+            vm = publisher = shm.PublishingRunner(vm, shm.StatePublisher(args.shm))
+        except (shm.SharedStateException, OSError) as e:
+            print(e)
+            exit(1)
+        publisher.publish()
+
+    def close_shared():
+        """发布最终状态并标记退出，然后删除共享内存块。"""
+        if publisher is not None:
+            publisher.publish(shm.FLAG_EXITED)
+            publisher.publisher.close()
+
+    if args.console:
+        console = DebugConsole(ctx, vm, image, freq=args.freq, fps=args.fps, stop_on_pause=not ignore_pause, reloader=reloader,
+                               on_frame=publisher.publish if publisher is not None else None)
+        try:
+            asyncio.run(console.run())
+        except ValueError as e:
+            print(e)
+            exit(1)
+        finally:
+            close_shared()
+        print(f"Exit. {vm.steps} steps." + (f" {console.clock.report()}" if console.clock is not None else ""))
+        if memoizer is not None:
+            print(memoizer.report(), end="")
+        exit(0)
     is_exit = False
     
     def signal_handler(signum, frame):
@@ -419,71 +1393,85 @@ if __name__ == '__main__':
     def line_format(line: int) -> str:
         return f"{line+1:>4}│ {src_lines[line]}\n"
 
+    def flat(bank: int, addr: int) -> int:
+        """bank内地址 -> 程序文件中的偏移，用于查找行号表。"""
+        return bank * 0xFF + addr
+
     def get_line_str(addr: int) -> str:
         try:
             line = lines[addr]
             return line_format(line)
         except IndexError:
-            return f"{f'0x{addr:X}':>6}: 0x{ctx.Program[addr]:02X}\n"
-
-    if full_src:
-        # 输出所有行
-        for i in range(len(src_lines)):
-            stdout.write(line_format(i))
-        # 移到行首
-        stdout.write(ANSI_CURSOR_LEFT + ANSI_CURSOR_UPS(len(src_lines)))
+            # 没有源代码行时显示反汇编结果
+            bank, addr = divmod(addr, 0xFF)
+            return f"{f'0x{addr:X}':>6}: {isa.decode_at(ctx.Banks[bank % len(ctx.Banks)], addr)}\n"
+
+    # -F模式的源代码窗口。寄存器表、状态行、暂停提示与输入各占一行
+    viewport: Optional[SourceViewport] = None
+    reserved_lines = 8 + status_lines + 2
+    resized = False
+    if debug and full_src:
+        import shutil
+        viewport = SourceViewport(src_lines, SourceViewport.fit_height(src_lines, reserved_lines), shutil.get_terminal_size().columns)
+        # 预留窗口所需的行，移到窗口开头
+        if viewport.height > 0:
+            stdout.write("\n" * viewport.height + ANSI_CURSOR_LEFT + ANSI_CURSOR_UPS(viewport.height))
+        if hasattr(signal, "SIGWINCH"):
+            def resize_handler(signum, frame):
+                global resized
+                resized = True
+            signal.signal(signal.SIGWINCH, resize_handler)
     
     stdout.write(ANSI_CURSOR_HIDE)
 
     while True:
-        vm.run_step()
+        if reloader is not None and reloader.poll(ctx):
+            lines = reloader.image.lines if debug else []
+            if debug:
+                src_lines = (reloader.image.src or "").splitlines()
+            if viewport is not None:
+                # 光标位于窗口开头，清除后按新的源代码重新输出
+                stdout.write(ANSI_CLEAR_DOWN)
+                viewport.set_source(src_lines, SourceViewport.fit_height(src_lines, reserved_lines))
+        if viewport is not None and resized:
+            # 终端大小改变后原有内容的位置不可知，清屏后从第一行重新输出
+            resized = False
+            stdout.write(ANSI_CLEAR_SCREEN)
+            viewport.resize(SourceViewport.fit_height(src_lines, reserved_lines), shutil.get_terminal_size().columns)
+        if clock is None:
+            vm.run_step()
+        else:
+            done = 0
+            for _ in range(clock.batch()):
+                vm.run_step()
+                done += 1
+                if ctx.Pause_signal and not ignore_pause:
+                    break
+            clock.advance(done)
+        if publisher is not None:
+            publisher.publish()
         main = ""
         pause_info = []
 
         if debug: 
-            if full_src:
-                # 将上一个cur_addr的行开头改为空格
-                try:
-                    last_line = lines[last_curaddr]
-                    stdout.write(ANSI_CURSOR_DOWNS(last_line) + ' ' + ANSI_CURSOR_LEFT)
-                except IndexError: last_line = 0
-                try:
-                    cur_line = lines[vm.cur_addr]
-                    # 计算差值
-                    #if last_line == -1: diff = cur_line
-                    #else: diff = cur_line - last_line
-                    diff = cur_line - last_line
-                    # 三角形
-                    stdout.write(ANSI_CURSOR_MOVE_UD(diff) + FILL_TRIANGLE + ANSI_CURSOR_LEFT)
-                except IndexError: cur_line = last_line
-                last_curaddr = vm.cur_addr
-                try:
-                    next_line = lines[vm.ctx.Registers[PC]]
-                    # 计算差值
-                    #if cur_line == -1: diff = next_line
-                    #else: diff = next_line - cur_line
-                    diff = next_line - cur_line
-                    # 圆形
-                    stdout.write(ANSI_CURSOR_MOVE_UD(diff) + CIRCLE + ANSI_CURSOR_LEFT)
-                except IndexError: next_line = cur_line
-                # 移到行尾
-                stdout.write(ANSI_CURSOR_MOVE_UD(len(src_lines) - next_line))
-
+            if viewport is not None:
+                cur_addr = flat(vm.cur_bank, vm.cur_addr)
+                next_addr = flat(ctx.Bank, ctx.Registers[PC])
+                stdout.write(viewport.render(lines[cur_addr] if cur_addr < len(lines) else None,
+                                             lines[next_addr] if next_addr < len(lines) else None))
             else:
-                main += FILL_TRIANGLE + get_line_str(vm.cur_addr)
-                main += CIRCLE + get_line_str(ctx.Registers[PC])
+                main += FILL_TRIANGLE + get_line_str(flat(vm.cur_bank, vm.cur_addr))
+                main += CIRCLE + get_line_str(flat(ctx.Bank, ctx.Registers[PC]))
         # 输出寄存器信息
-        for i in range(8):
-            n = ctx.Registers[i]
-            s08b = f"{n:08b}"
-            sn = f"{' '.join([*s08b])} = {n}"
-            sn_main = f"{reg_name_map[i]} = {sn}"
-            # 如果n>127, 则显示补码数形式
-            if n > 0x7F:
-                sn_main += f"({n - 0x100})"
-            # PC = 1 1 1 1 1 1 1 1 = 255(-128), 最大长度32
-            # 添加适量的空格
-            main += sn_main + ' ' * (32 - len(sn_main)) + '\n'
+        for sn_main in format_registers(ctx):
+            main += sn_main + '\n'
+        if banked:
+            pending = f", pending {ctx.Bank_pending}" if ctx.Bank_pending is not None else ""
+            main += ANSI_CLEAR_LINE + f"Bank = {ctx.Bank}/{len(ctx.Banks)}{pending}\n"
+        if clock is not None:
+            main += ANSI_CLEAR_LINE + clock.report() + '\n'
+        if reloader is not None:
+            main += ANSI_CLEAR_LINE + reloader.status + '\n'
 
         if ctx.Pause_signal:
             pause_info.append("PAUSE")
@@ -498,7 +1486,9 @@ if __name__ == '__main__':
         stdout.write(main)
         
         if pause_info and not ignore_pause:
+            if clock is not None: clock.hold()
             command = stdin.readline()
+            if clock is not None: clock.resume()
             stdout.write(ANSI_CURSOR_HIDE)
         else: #延迟
             if delay > 0.0: time.sleep(delay)
@@ -508,6 +1498,11 @@ if __name__ == '__main__':
                 # 向上移动并清行
                 clearlines(1)
             stdout.write("Exit.\n"+ANSI_CURSOR_SHOW)
+            if clock is not None:
+                stdout.write(f"{clock.steps} steps. {clock.report()}\n")
+            if memoizer is not None:
+                stdout.write(memoizer.report())
+            close_shared()
             exit(0)
         
         if pause_info:
@@ -516,12 +1511,12 @@ if __name__ == '__main__':
         
         
         # 发送8个移行指令，清寄存器表
-        stdout.write(ANSI_CURSOR_LEFT + ANSI_CURSOR_UPS(8))
+        stdout.write(ANSI_CURSOR_LEFT + ANSI_CURSOR_UPS(8 + status_lines))
 
         if debug:
-            if full_src:
-                # 移动到行首
-                stdout.write(ANSI_CURSOR_UPS(len(src_lines)))
-                # stdout.write(f"u{len(src_lines)}." + ANSI_CURSOR_LEFT)
+            if viewport is not None:
+                # 移动到窗口开头
+                if viewport.height > 0:
+                    stdout.write(ANSI_CURSOR_UPS(viewport.height))
             else: # 非full时清行
                 clearlines(2)
\ No newline at end of file